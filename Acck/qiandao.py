@@ -6,15 +6,11 @@ import time
 import sys
 import os
 import json
+import logging
 
-
-class Color:
-    GREEN = '\033[92m'
-    RED = '\033[91m'
-    YELLOW = '\033[93m'
-    BLUE = '\033[94m'
-    CYAN = '\033[96m'
-    END = '\033[0m'
+# 日志由调用方（bot.py）配置输出；platform 字段用于区分平台
+logger = logging.getLogger(__name__)
+LOG_EXTRA = {"platform": "Acck"}
 
 def send_telegram_message(token: str, chat_id: str, text: str):
     """
@@ -26,7 +22,7 @@ def send_telegram_message(token: str, chat_id: str, text: str):
         text: 消息内容
     """
     if not token or not chat_id:
-        print(f"{Color.YELLOW}⚠️ Telegram配置未填写，跳过通知{Color.END}")
+        logger.warning("⚠️ Telegram配置未填写，跳过通知", extra=LOG_EXTRA)
         return
     
     url = f"https://api.telegram.org/bot{token}/sendMessage"
@@ -35,17 +31,17 @@ def send_telegram_message(token: str, chat_id: str, text: str):
         if resp.status_code == 200:
             result = resp.json()
             if result.get('ok'):
-                print(f"{Color.GREEN}✅ Telegram通知发送成功{Color.END}")
+                logger.info("✅ Telegram通知发送成功", extra=LOG_EXTRA)
             else:
-                print(f"{Color.RED}❌ Telegram通知发送失败: {result.get('description', '未知错误')}{Color.END}")
+                logger.error(f"❌ Telegram通知发送失败: {result.get('description', '未知错误')}", extra=LOG_EXTRA)
         else:
-            print(f"{Color.RED}❌ Telegram通知发送失败: HTTP {resp.status_code}{Color.END}")
+            logger.error(f"❌ Telegram通知发送失败: HTTP {resp.status_code}", extra=LOG_EXTRA)
     except requests.exceptions.Timeout:
-        print(f"{Color.RED}❌ Telegram通知发送超时{Color.END}")
+        logger.error("❌ Telegram通知发送超时", extra=LOG_EXTRA)
     except requests.exceptions.RequestException as e:
-        print(f"{Color.RED}❌ Telegram通知网络错误: {e}{Color.END}")
+        logger.error(f"❌ Telegram通知网络错误: {e}", extra=LOG_EXTRA)
     except Exception as e:
-        print(f"{Color.RED}❌ 发送Telegram通知异常: {e}{Color.END}")
+        logger.error(f"❌ 发送Telegram通知异常: {e}", extra=LOG_EXTRA)
 
 class ACCKAccount:
     def __init__(self, email, password, totp_secret=None):
@@ -78,7 +74,7 @@ class ACCKAccount:
             "token": "",
             "verifyCode": ""
         }
-        print(f"{Color.CYAN}ℹ️ 登录账户: {self.email}{Color.END}")
+        logger.info(f"ℹ️ 登录账户: {self.email}", extra=LOG_EXTRA)
         
         try:
             resp = self.session.post("https://api.acck.io/api/v1/user/login", json=payload, timeout=20)
@@ -99,7 +95,7 @@ class ACCKAccount:
             try:
                 totp = pyotp.TOTP(self.totp_secret)
                 payload["token"] = totp.now()
-                print(f"{Color.YELLOW}⚠️ 使用TOTP验证码登录中...{Color.END}")
+                logger.info("使用TOTP验证码登录中...", extra=LOG_EXTRA)
                 
                 resp = self.session.post("https://api.acck.io/api/v1/user/login", json=payload, timeout=20)
                 resp.raise_for_status()
@@ -121,7 +117,7 @@ class ACCKAccount:
             self.token = data["data"]["token"]
             if not self.token:
                 raise Exception("登录成功但未获取到Token")
-            print(f"{Color.GREEN}✅ 登录成功，Token: {self.token[:10]}...{Color.END}")
+            logger.info(f"✅ 登录成功，Token: {self.token[:10]}...", extra=LOG_EXTRA)
         except (KeyError, TypeError):
             raise Exception("登录响应数据格式错误")
 
@@ -135,20 +131,20 @@ class ACCKAccount:
             data = resp.json()
         except Exception:
             msg = f"签到接口返回非JSON，原始内容：{resp.text}"
-            print(f"{Color.RED}{msg}{Color.END}")
+            logger.error(msg, extra=LOG_EXTRA)
             return False, msg
 
         if data.get("code") == 200:
             msg = f"签到成功: {data.get('msg', '')}"
-            print(f"{Color.GREEN}✅ {msg}{Color.END}")
+            logger.info(f"✅ {msg}", extra=LOG_EXTRA)
             return True, msg
         elif data.get("msg") == "今日已签到":
             msg = "今日已签到"
-            print(f"{Color.GREEN}ℹ️ 签到状态：{msg}{Color.END}")
+            logger.info(f"ℹ️ 签到状态：{msg}", extra=LOG_EXTRA)
             return True, msg
         else:
             msg = f"签到失败: {data}"
-            print(f"{Color.RED}❌ {msg}{Color.END}")
+            logger.error(f"❌ {msg}", extra=LOG_EXTRA)
             return False, msg
 
     def get_balance(self):
@@ -160,7 +156,7 @@ class ACCKAccount:
         data = resp.json()
         if data.get("status_code") != 0:
             msg = f"获取余额失败: {data.get('status_msg', '未知错误')}"
-            print(f"{Color.RED}❌ {msg}{Color.END}")
+            logger.error(f"❌ {msg}", extra=LOG_EXTRA)
             return None
 
         info = data.get("data", {})
@@ -172,19 +168,19 @@ class ACCKAccount:
 
         ak_coin = info.get("ak_coin", "N/A")
         balance_info = f"AK币: {ak_coin}，现金: ¥{money:.2f}"
-        print(f"{Color.BLUE}💰 余额信息 - {balance_info}{Color.END}")
+        logger.info(f"💰 余额信息 - {balance_info}", extra=LOG_EXTRA)
         return balance_info
 
 def parse_accounts(env_var: str):
     accounts = []
     if not env_var:
-        print(f"{Color.RED}❌ 环境变量 ACCK_ACCOUNTS 未设置或为空{Color.END}")
+        logger.error("❌ 环境变量 ACCK_ACCOUNTS 未设置或为空", extra=LOG_EXTRA)
         return accounts
 
     for idx, acc_str in enumerate(env_var.split("|"), 1):
         parts = acc_str.strip().split(":")
         if len(parts) < 2:
-            print(f"{Color.YELLOW}⚠️ 跳过无效账户配置: {acc_str}{Color.END}")
+            logger.warning(f"⚠️ 跳过无效账户配置: {acc_str}", extra=LOG_EXTRA)
             continue
         email = parts[0]
         password = parts[1]
@@ -192,17 +188,65 @@ def parse_accounts(env_var: str):
         accounts.append({"email": email, "password": password, "totp_secret": totp_secret})
     return accounts
 
-def main(email, password, totp=None):
+def warmup(email, password, totp=None):
+    """
+    提前登录，返回已持有Token的账户对象，供 checkin_with 在计划时间直接签到
+
+    Raises:
+        Exception: 登录失败时抛出异常
+    """
+    acc = ACCKAccount(email, password, totp)
+    acc.login()
+    return acc
+
+def checkin_with(acc, timings=None):
+    """
+    使用已登录的账户对象签到并查询余额
+
+    Args:
+        acc: warmup 返回的账户对象
+        timings: 可选字典，写入 checkin/balance 阶段耗时（秒）
+
+    Returns:
+        tuple: (ok, 结果文本)，ok 仅在签到接口明确返回成功或今日已签到时为True
+    """
+    if timings is None:
+        timings = {}
     try:
-        acc = ACCKAccount(email, password, totp)
-        acc.login()
+        start = time.perf_counter()
         ok, msg = acc.checkin()
+        timings["checkin"] = time.perf_counter() - start
+        start = time.perf_counter()
         balance = acc.get_balance()
+        timings["balance"] = time.perf_counter() - start
         result = f"签到结果: {'成功' if ok else '失败'}\n信息: {msg}"
         if balance:
             result += f"\n{balance}"
-        return result
+        return ok, result
+    except Exception as e:
+        return False, f"执行出错: {e}"
+
+def main(email, password, totp=None, timings=None):
+    """
+    执行一次签到
+
+    Args:
+        email: 账号邮箱
+        password: 密码
+        totp: TOTP密钥
+        timings: 可选字典，传入时写入 login/checkin/balance 各阶段耗时（秒）
+
+    Returns:
+        tuple: (ok, 结果文本)，同 checkin_with
+    """
+    if timings is None:
+        timings = {}
+    try:
+        start = time.perf_counter()
+        acc = warmup(email, password, totp)
+        timings["login"] = time.perf_counter() - start
     except Exception as e:
-        return f"执行出错: {e}"
+        return False, f"执行出错: {e}"
+    return checkin_with(acc, timings)
 
 # 如需测试请在bot.py中调用main，不建议直接运行本文件
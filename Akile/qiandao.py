@@ -2,6 +2,7 @@
 
 import os
 import time
+import logging
 import pyotp
 from curl_cffi import requests
 from dotenv import load_dotenv
@@ -10,14 +11,9 @@ from typing import Dict, List, Optional, Tuple
 # 初始化环境变量
 load_dotenv()
 
-class Color:
-    """控制台颜色"""
-    GREEN = '\033[92m'
-    RED = '\033[91m'
-    YELLOW = '\033[93m'
-    BLUE = '\033[94m'
-    CYAN = '\033[96m'
-    END = '\033[0m'
+# 日志由调用方（bot.py）配置输出；platform 字段用于区分平台
+logger = logging.getLogger(__name__)
+LOG_EXTRA = {"platform": "Akile"}
 
 class AkileSession:
     """独立会话环境"""
@@ -61,7 +57,7 @@ class AkileAccount:
                 "verifyCode": ""
             }
             
-            print(f"{Color.CYAN} 登录账号: {self.email}{Color.END}")
+            logger.info(f"登录账号: {self.email}", extra=LOG_EXTRA)
             
             # 发送登录请求
             try:
@@ -87,7 +83,7 @@ class AkileAccount:
                 try:
                     totp = pyotp.TOTP(self.totp_secret)
                     payload["token"] = totp.now()
-                    print(f"{Color.YELLOW} 生成TOTP验证码{Color.END}")
+                    logger.info("生成TOTP验证码", extra=LOG_EXTRA)
                     
                     verify_response = self.session.post(
                         "https://api.akile.io/api/v1/user/login",
@@ -185,7 +181,7 @@ class AccountManager:
             # 用 : 分隔账户信息
             parts = acc_str.split(":")
             if len(parts) < 2:
-                print(f"{Color.YELLOW} 忽略无效账号配置: {acc_str}{Color.END}")
+                logger.warning(f"忽略无效账号配置: {acc_str}", extra=LOG_EXTRA)
                 continue
                 
             email = parts[0].strip()
@@ -206,20 +202,20 @@ class AccountManager:
         # 从 AKILE_ACCOUNTS 环境变量读取配置
         config_str = os.getenv("AKILE_ACCOUNTS", "")
         if not config_str:
-            print(f"{Color.RED} 未配置AKILE_ACCOUNTS环境变量{Color.END}")
+            logger.error("未配置AKILE_ACCOUNTS环境变量", extra=LOG_EXTRA)
             return {}
             
         return {acc["name"]: acc for acc in self._parse_accounts(config_str)}
     
     def run(self):
         if not self.accounts:
-            print(f"{Color.RED} 未找到有效账号配置{Color.END}")
+            logger.error("未找到有效账号配置", extra=LOG_EXTRA)
             return
 
-        print(f"{Color.YELLOW} 发现 {len(self.accounts)} 个账号{Color.END}")
+        logger.info(f"发现 {len(self.accounts)} 个账号", extra=LOG_EXTRA)
 
         for name, acc in self.accounts.items():
-            print(f"\n{Color.CYAN} ➤ 处理 {name}{Color.END}")
+            logger.info(f"➤ 处理 {name}", extra=LOG_EXTRA)
             
             account = AkileAccount(
                 email=acc["email"],
@@ -230,46 +226,97 @@ class AccountManager:
             # 登录
             token, error = account.login()
             if error:
-                print(f"{Color.RED} 登录失败: {error}{Color.END}")
+                logger.error(f"登录失败: {error}", extra=LOG_EXTRA)
                 continue
                 
-            print(f"{Color.GREEN} 登录成功{Color.END}")
+            logger.info("登录成功", extra=LOG_EXTRA)
             
             # 签到
             success, msg = account.checkin(token)
             if success:
-                print(f"{Color.GREEN} {msg}{Color.END}")
+                logger.info(msg, extra=LOG_EXTRA)
             else:
-                print(f"{Color.RED} 签到失败: {msg}{Color.END}")
+                logger.error(f"签到失败: {msg}", extra=LOG_EXTRA)
             
             # 获取并显示真实余额
             balance = account.get_real_balance(token)
             if "error" in balance:
-                print(f"{Color.RED} {balance['error']}{Color.END}")
-                print(f"{Color.YELLOW} 原始响应: {balance.get('raw_data', '无')}{Color.END}")
+                logger.error(balance['error'], extra=LOG_EXTRA)
+                logger.warning(f"原始响应: {balance.get('raw_data', '无')}", extra=LOG_EXTRA)
             else:
-                print(f"{Color.BLUE} 💰 真实账号余额:")
-                print(f"   AK币: {balance['ak_coin']}")
-                print(f"   现金: ￥{balance['money']}")
+                logger.info(f"💰 真实账号余额: AK币: {balance['ak_coin']}，现金: ￥{balance['money']}", extra=LOG_EXTRA)
             
             time.sleep(1)
 
-def main(email, password, totp_secret=None):
+def warmup(email, password, totp_secret=None):
+    """
+    提前登录，返回已持有Token的账户对象，供 checkin_with 在计划时间直接签到
+
+    Raises:
+        Exception: 登录失败时抛出异常
+    """
+    acc = AkileAccount(email, password, totp_secret)
+    token, err = acc.login()
+    if not token:
+        raise Exception(f"登录失败: {err}")
+    acc.token = token
+    return acc
+
+def checkin_with(acc, timings=None):
+    """
+    使用已登录的账户对象签到并查询余额
+
+    Args:
+        acc: warmup 返回的账户对象
+        timings: 可选字典，写入 checkin/balance 阶段耗时（秒）
+
+    Returns:
+        tuple: (ok, 结果文本)，ok 仅在签到接口明确返回成功或今日已签到时为True
+    """
+    if timings is None:
+        timings = {}
     try:
-        acc = AkileAccount(email, password, totp_secret)
-        token, err = acc.login()
-        if not token:
-            return f"登录失败: {err}"
-        ok, msg = acc.checkin(token)
-        balance = acc.get_real_balance(token)
+        start = time.perf_counter()
+        ok, msg = acc.checkin(acc.token)
+        timings["checkin"] = time.perf_counter() - start
+        start = time.perf_counter()
+        balance = acc.get_real_balance(acc.token)
+        timings["balance"] = time.perf_counter() - start
         result = f"签到结果: {'成功' if ok else '失败'}\n信息: {msg}"
         # 格式化余额信息
         if isinstance(balance, dict) and "ak_coin" in balance and "money" in balance:
             result += f"\nAK币: {balance['ak_coin']}，现金: ¥{balance['money']}"
         elif isinstance(balance, dict) and "error" in balance:
             result += f"\n{balance['error']}"
-        return result
+        return ok, result
+    except Exception as e:
+        return False, f"执行出错: {e}"
+
+def main(email, password, totp_secret=None, timings=None):
+    """
+    执行一次签到
+
+    Args:
+        email: 账号邮箱
+        password: 密码
+        totp_secret: TOTP密钥
+        timings: 可选字典，传入时写入 login/checkin/balance 各阶段耗时（秒）
+
+    Returns:
+        tuple: (ok, 结果文本)，同 checkin_with
+    """
+    if timings is None:
+        timings = {}
+    try:
+        start = time.perf_counter()
+        acc = AkileAccount(email, password, totp_secret)
+        token, err = acc.login()
+        timings["login"] = time.perf_counter() - start
+        if not token:
+            return False, f"登录失败: {err}"
+        acc.token = token
     except Exception as e:
-        return f"执行出错: {e}"
+        return False, f"执行出错: {e}"
+    return checkin_with(acc, timings)
 
 # 如需测试请在bot.py中调用main，不建议直接运行本文件
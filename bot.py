@@ -21,15 +21,36 @@ from telegram.ext import (
     Application, CommandHandler, MessageHandler, filters, ConversationHandler, ContextTypes, CallbackQueryHandler
 )
 from telegram.constants import ParseMode
-from Acck.qiandao import main as acck_signin
-from Akile.qiandao import main as akile_signin
+from Acck.qiandao import main as acck_main, warmup as acck_warmup, checkin_with as acck_checkin_with
+from Akile.qiandao import main as akile_main, warmup as akile_warmup, checkin_with as akile_checkin_with
 import sys
 import asyncio
 import threading
 import time
+import heapq
+import hashlib
+import hmac
+import re
+import zlib
+import collections
+import concurrent.futures
+import multiprocessing
+import multiprocessing.connection
+import sqlite3
+import contextlib
+import tempfile
+import atexit
+import gzip
+import shutil
 from croniter import croniter
 import logging
+import logging.handlers
+import queue
 import httpx
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows 不支持 flock，退化为单进程假设
 
 # ========== 时区设置 ==========
 # 设置时区为 Asia/Shanghai
@@ -72,13 +93,28 @@ ALLOWED_USERS_FILE = "allowed_users.json"
 BANNED_USERS_FILE = "banned_users.json"
 DAILY_USAGE_FILE = "daily_usage.json"
 USAGE_STATS_FILE = "usage_stats.json"
-ADMIN_LOG_FILE = "admin_log.json"
+ADMIN_LOG_FILE = "admin_log.json"  # 旧版管理审计日志，启动时导入 ADMIN_LOG_DIR 的审计分段后删除
 ADMIN_ATTEMPT_FILE = "admin_attempts.json"
 SCHEDULED_TASKS_FILE = "scheduled_tasks.json"
 TEMP_USERS_FILE = "temp_users.json"
 USER_LIMITS_FILE = "user_limits.json"
-SUMMARY_LOG_FILE = "summary_log.json"
-SUMMARY_SIGNIN_FILE = "summary_signin.json"
+SCHEDULER_JOURNAL_FILE = "scheduler_journal.jsonl"
+SCHEDULER_LOCK_FILE = "scheduler.lock"
+STATE_DB_FILE = "state.db"
+
+# 管理员操作日志：按天分段的JSON Lines文件所在目录及保留天数
+ADMIN_LOG_DIR = os.getenv("ADMIN_LOG_DIR", "admin_logs")
+ADMIN_LOG_RETENTION_DAYS = int(os.getenv("ADMIN_LOG_RETENTION_DAYS", "6"))
+
+# 签到结果台账：按天分段的JSON Lines文件所在目录及保留天数
+SIGNIN_LEDGER_DIR = os.getenv("SIGNIN_LEDGER_DIR", "signin_ledger")
+SIGNIN_LEDGER_RETENTION_DAYS = int(os.getenv("SIGNIN_LEDGER_RETENTION_DAYS", "3"))
+
+# JSON后端的延迟合并写入窗口（秒）：窗口内的多次修改合并为一次写盘，0 表示每次修改立即写盘
+JSON_WRITE_BEHIND_DELAY = float(os.getenv("JSON_WRITE_BEHIND_DELAY", "1.0"))
+
+# 状态存储后端：sqlite（默认，WAL模式，首次启动时自动从JSON文件迁移）或 json（沿用各JSON文件）
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite").strip().lower()
 
 # 默认每日次数限制
 DEFAULT_DAILY_LIMIT = 3
@@ -98,30 +134,326 @@ RECOMMENDED_TIMES = [
 # 默认时间
 DEFAULT_HOUR, DEFAULT_MINUTE = 0, 10
 
+# 定时任务并发配置：全局工作线程上限及各平台同时执行的任务上限
+SCHEDULER_MAX_WORKERS = int(os.getenv("SCHEDULER_MAX_WORKERS", "16"))
+PLATFORM_CONCURRENCY = {
+    'Acck': int(os.getenv("ACCK_MAX_CONCURRENCY", "8")),
+    'Akile': int(os.getenv("AKILE_MAX_CONCURRENCY", "8")),
+}
+
+# 执行优先级：用户手动发起的签到（交互通道）总是先于排队中的定时任务执行，
+# 并为交互通道预留若干工作线程，定时任务积压时手动签到也不必等待空闲线程
+LANE_INTERACTIVE = 0
+LANE_SCHEDULED = 1
+INTERACTIVE_RESERVED_WORKERS = int(os.getenv("INTERACTIVE_RESERVED_WORKERS", "2"))
+
+# 多进程分片执行：>0 时签到请求按账号哈希分发到 N 个子进程执行，0 表示在本进程的线程中执行
+SCHEDULER_WORKER_PROCESSES = int(os.getenv("SCHEDULER_WORKER_PROCESSES", "0"))
+# 每个签到子进程内并发执行请求的线程数；总并发仍由父进程的执行池（SCHEDULER_MAX_WORKERS）和平台上限控制
+SCHEDULER_SHARD_THREADS = int(os.getenv("SCHEDULER_SHARD_THREADS", str(SCHEDULER_MAX_WORKERS)))
+# 签到子进程以 spawn 方式启动时会重新导入本模块，
+# 状态库、延迟写盘、日志分段等带副作用的全局单例只在主进程中创建
+IS_MAIN_PROCESS = multiprocessing.parent_process() is None
+
+# 平台请求限流：令牌桶速率（每秒允许发起的签到次数）与突发容量，所有签到入口共享
+PLATFORM_RATE_LIMITS = {
+    'Acck': (float(os.getenv("ACCK_RATE", "2")), int(os.getenv("ACCK_BURST", "5"))),
+    'Akile': (float(os.getenv("AKILE_RATE", "2")), int(os.getenv("AKILE_BURST", "5"))),
+}
+
+# 错过触发时间（重启、执行积压等）后的补偿策略
+MISFIRE_RUN_LATE = 'run_late'  # 在宽限时间内补执行，超出则跳过
+MISFIRE_SKIP = 'skip'  # 错过即跳过，等待下一次触发
+MISFIRE_COALESCE = 'coalesce'  # 不论错过多久、多少次，只补执行一次
+MISFIRE_POLICIES = (MISFIRE_RUN_LATE, MISFIRE_SKIP, MISFIRE_COALESCE)
+MISFIRE_POLICY = os.getenv("MISFIRE_POLICY", MISFIRE_RUN_LATE)
+# 无效的 MISFIRE_POLICY 回退为 run_late，启动时在 main() 中告警
+DEFAULT_MISFIRE_POLICY = MISFIRE_POLICY if MISFIRE_POLICY in MISFIRE_POLICIES else MISFIRE_RUN_LATE
+MISFIRE_GRACE_SECONDS = int(os.getenv("MISFIRE_GRACE_SECONDS", "3600"))
+# 触发后多少秒内开始执行仍视为准时
+MISFIRE_ON_TIME_SECONDS = 60
+
+# 调度器单实例租约：备用进程每隔 LEASE_RETRY_SECONDS 尝试接管，持有者每隔 LEASE_HEARTBEAT_SECONDS 写一次心跳
+LEASE_RETRY_SECONDS = int(os.getenv("LEASE_RETRY_SECONDS", "3"))
+LEASE_HEARTBEAT_SECONDS = int(os.getenv("LEASE_HEARTBEAT_SECONDS", "5"))
+
+# 失败自动重试：仅重试超时、5xx、非JSON响应等临时性错误，凭证类错误不重试
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))  # 每个任务每天最多自动重试次数
+RETRY_BASE_DELAY = int(os.getenv("RETRY_BASE_DELAY", "60"))  # 首次重试延迟（秒），之后逐次翻倍
+RETRY_MAX_DELAY = int(os.getenv("RETRY_MAX_DELAY", "1800"))
+TRANSIENT_ERROR_PATTERN = re.compile(r"超时|timed? ?out|非JSON|5\d\d Server Error|Connection|连接|网络错误", re.IGNORECASE)
+
+# 单次签到的端到端期限（秒）：从请求真正开始执行时计时，超时后放弃等待并按失败记录
+SIGNIN_DEADLINE_SECONDS = int(os.getenv("SIGNIN_DEADLINE_SECONDS", "90"))
+
+# 调度线程看门狗：调度循环至少每 SCHEDULER_WATCHDOG_INTERVAL 秒更新一次心跳，
+# 心跳超过 SCHEDULER_STALL_SECONDS 未更新或线程已退出时重启调度循环
+SCHEDULER_WATCHDOG_INTERVAL = int(os.getenv("SCHEDULER_WATCHDOG_INTERVAL", "30"))
+SCHEDULER_STALL_SECONDS = int(os.getenv("SCHEDULER_STALL_SECONDS", "180"))
+
+# 错峰执行：任务在标称时间之后的窗口内获得一个固定偏移，把热门时间点的登录请求摊平。
+# 只向后偏移，避免 0:00 之类的任务被提前到前一天
+SPREAD_WINDOW_MINUTES = int(os.getenv("SPREAD_WINDOW_MINUTES", "30"))
+SPREAD_DEFAULT = os.getenv("SPREAD_DEFAULT", "0") == "1"
+
+# 延迟统计：每项指标保留最近 N 个样本用于计算滚动分位数
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", "1000"))
+
+# 预登录：>0 时在计划时间前 N 秒提前登录并缓存会话，到点只发签到请求；0 表示关闭
+WARMUP_LEAD_SECONDS = int(os.getenv("WARMUP_LEAD_SECONDS", "0"))
+# 预登录会话的有效期（秒），超时未使用则丢弃并在到点时完整登录
+WARMUP_SESSION_TTL = int(os.getenv("WARMUP_SESSION_TTL", "600"))
+
+# 日志：级别、滚动日志文件（默认留空，只输出到控制台，由 start.sh 重定向到 bot.log；
+# 设置后额外写入JSON格式的滚动日志，此时宜把控制台输出重定向到 /dev/null，避免同一内容写盘两次）
+# 及其大小与保留个数；LOG_JSON=1 时控制台也输出JSON
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").strip().upper()
+LOG_FILE = os.getenv("LOG_FILE", "")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_JSON = os.getenv("LOG_JSON", "0") == "1"
+
+# ========== 日志 ==========
+# 结构化字段：通过 logger.info(..., extra={"platform": ..., "task_id": ...}) 传入
+LOG_FIELDS = ("platform", "task_id", "user_id", "phase", "duration")
+
+logger = logging.getLogger("bot")
+
+class StructuredFormatter(logging.Formatter):
+    """
+    日志格式化：文本格式在消息后附加 key=value 结构化字段，json_lines=True 时每条记录输出一行JSON
+    """
+    
+    def __init__(self, json_lines=False):
+        super().__init__("%(asctime)s %(levelname)s [%(name)s] %(message)s")
+        self.json_lines = json_lines
+    
+    @staticmethod
+    def fields(record):
+        fields = {key: getattr(record, key) for key in LOG_FIELDS if getattr(record, key, None) is not None}
+        if isinstance(fields.get("duration"), float):
+            fields["duration"] = round(fields["duration"], 3)
+        return fields
+    
+    def formatMessage(self, record):
+        text = super().formatMessage(record)
+        return text + "".join(f" {key}={value}" for key, value in self.fields(record).items())
+    
+    def format(self, record):
+        if not self.json_lines:
+            return super().format(record)
+        data = {"time": self.formatTime(record), "level": record.levelname, "logger": record.name,
+                "message": record.getMessage(), **self.fields(record)}
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+_log_listeners = []
+
+def setup_logging():
+    """
+    配置日志管线：根logger只挂一个 QueueHandler，记录放入内存队列即返回，
+    由后台 QueueListener 线程写控制台和滚动日志文件，处理器和签到线程不会因写日志阻塞
+    """
+    if _log_listeners:
+        return
+    handlers = []
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(StructuredFormatter(json_lines=LOG_JSON))
+    handlers.append(console)
+    if LOG_FILE:
+        if os.path.dirname(LOG_FILE):
+            os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES,
+                                                            backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+        file_handler.setFormatter(StructuredFormatter(json_lines=True))
+        handlers.append(file_handler)
+    
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+    # httpx 会为每次 Telegram 轮询记录一条 INFO，只保留警告以上
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _log_listeners.append(listener)
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """
+    停止后台写日志线程并写完队列中剩余的记录
+    
+    atexit 按注册的逆序执行，stop_logging 会先于 json_write_behind.flush 运行，
+    因此在停止写日志线程前先把延迟写入的数据落盘，刷盘时记录的错误仍能写出
+    """
+    if _log_listeners and json_write_behind is not None:
+        json_write_behind.flush()
+    while _log_listeners:
+        _log_listeners.pop().stop()
+
+class _PipeLogHandler(logging.handlers.QueueHandler):
+    """分片子进程的日志处理器：把记录经结果管道发回父进程，由父进程的日志管线统一输出"""
+    
+    def __init__(self, conn, send_lock):
+        super().__init__(conn)
+        self.send_lock = send_lock
+    
+    def enqueue(self, record):
+        with self.send_lock:
+            self.queue.send((None, True, record))
+
+def setup_process_logging(conn, send_lock):
+    """子进程日志配置：根logger只挂 _PipeLogHandler"""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_PipeLogHandler(conn, send_lock))
+    root.setLevel(LOG_LEVEL)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
 # ========== 工具函数 ==========
 
+def _copy_json(value):
+    """复制JSON结构（dict/list嵌套），比 copy.deepcopy 快得多"""
+    if isinstance(value, dict):
+        return {k: _copy_json(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy_json(v) for v in value]
+    return value
+
+class JsonFileCache:
+    """
+    JSON文件的内存缓存
+    
+    按 (mtime, size) 判断文件是否被外部修改，未变化时直接返回内存中的数据；
+    save_json 写入成功后同步更新缓存。延迟写入排队中的数据以 pinned 方式放入缓存，
+    落盘前始终以缓存为准，不会因刷盘途中文件时间戳变化而读回磁盘上的旧内容。
+    get 返回的对象在多个调用方之间共享，只能读取不能修改，需要修改时使用 load_json（返回独立副本）。
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # filename -> (stamp, data, {view: 派生结果}, pinned)
+    
+    @staticmethod
+    def _stamp(filename):
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+    
+    @staticmethod
+    def _read(filename, default):
+        try:
+            with open(filename, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError, OSError) as e:
+            logger.warning(f"⚠️ 读取JSON文件 {filename} 失败: {e}")
+            return default
+    
+    def get(self, filename, default, view=None):
+        """
+        读取文件内容（只读）
+        
+        Args:
+            filename: 文件名
+            default: 文件不存在或读取失败时的默认值
+            view: 可选的派生函数（如 frozenset），结果随文件内容一起缓存
+            
+        Returns:
+            缓存的数据，或 view(数据)
+        """
+        with self._lock:
+            entry = self._entries.get(filename)
+        stamp = None if entry is not None and entry[3] else self._stamp(filename)
+        if entry is None or (not entry[3] and entry[0] != stamp):
+            data = default if stamp is None else self._read(filename, default)
+            entry = (stamp, data, {}, False)
+            with self._lock:
+                current = self._entries.get(filename)
+                if current is not None and current[3]:
+                    entry = current  # 读盘期间有新的延迟写入排队，以排队的数据为准
+                else:
+                    self._entries[filename] = entry
+        if view is None:
+            return entry[1]
+        views = entry[2]
+        if view not in views:
+            views[view] = view(entry[1])
+        return views[view]
+    
+    def put(self, filename, data, pinned=False):
+        """
+        用新内容更新缓存（写入成功后，或延迟写入排队时）
+        
+        Args:
+            filename: 文件名
+            data: 新内容
+            pinned: 为True时表示数据尚未落盘，在下一次不带 pinned 的 put 之前不再按文件时间戳校验
+            
+        Returns:
+            缓存中保存的数据副本
+        """
+        entry = (self._stamp(filename), _copy_json(data), {}, pinned)
+        with self._lock:
+            self._entries[filename] = entry
+        return entry[1]
+    
+    def invalidate(self, filename):
+        with self._lock:
+            self._entries.pop(filename, None)
+
+json_file_cache = JsonFileCache()
+
 def load_json(filename, default):
     """
     安全地加载JSON文件
     
+    内容未变化时从内存缓存复制，不再重复读取和解析文件
+    
     Args:
         filename: 文件名
         default: 默认值，当文件不存在或读取失败时返回
         
     Returns:
-        解析后的JSON数据或默认值
+        解析后的JSON数据（可自由修改的副本）或默认值
+    """
+    return _copy_json(json_file_cache.get(filename, default))
+
+def _write_json_atomic(filename, data):
+    """
+    原子地写入JSON文件：先写同目录下的临时文件并fsync，再用 os.replace 替换目标文件，
+    进程在写入途中崩溃时目标文件保持旧内容，不会出现写了一半的文件
+    
+    Raises:
+        OSError, TypeError: 写入或序列化失败
     """
+    # 确保目录存在（只有当filename包含路径时才创建目录）
+    dirname = os.path.dirname(filename)
+    if dirname:  # 只有当dirname不为空时才创建目录
+        os.makedirs(dirname, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(filename)}.", suffix=".tmp", dir=dirname or ".")
     try:
-        if os.path.exists(filename):
-            with open(filename, "r", encoding="utf-8") as f:
-                return json.load(f)
-    except (json.JSONDecodeError, IOError, OSError) as e:
-        print(f"⚠️ 读取JSON文件 {filename} 失败: {e}")
-    return default
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filename)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
 
 def save_json(filename, data):
     """
-    安全地保存数据到JSON文件
+    安全地保存数据到JSON文件（原子替换）
     
     Args:
         filename: 文件名
@@ -131,60 +463,667 @@ def save_json(filename, data):
         bool: 保存是否成功
     """
     try:
-        # 确保目录存在（只有当filename包含路径时才创建目录）
-        dirname = os.path.dirname(filename)
-        if dirname:  # 只有当dirname不为空时才创建目录
-            os.makedirs(dirname, exist_ok=True)
-        
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        _write_json_atomic(filename, data)
+        json_file_cache.put(filename, data)
         return True
     except (IOError, OSError, TypeError) as e:
-        print(f"❌ 保存JSON文件 {filename} 失败: {e}")
+        json_file_cache.invalidate(filename)
+        logger.error(f"❌ 保存JSON文件 {filename} 失败: {e}")
         return False
 
+class JsonWriteBehind:
+    """
+    JSON文件的延迟合并写入
+    
+    save 立即更新内存缓存（后续读取马上能看到新内容），实际写盘推迟 delay 秒，
+    窗口内对同一文件的多次保存只落盘最后一次。进程正常退出时通过 atexit 刷盘；
+    被强制杀死时最多丢失最近 delay 秒内的修改。delay<=0 时退化为同步的 save_json。
+    """
+    
+    def __init__(self, delay):
+        self.delay = delay
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()  # 保证同一文件的多次刷盘按保存顺序进行
+        self._pending = {}  # filename -> 待写入的数据快照
+        self._thread = None
+        self.saves = 0
+        self.writes = 0
+    
+    def save(self, filename, data):
+        """
+        保存数据（延迟写盘）
+        
+        Returns:
+            bool: 是否已接受（同步模式下为写入是否成功）
+        """
+        if self.delay <= 0:
+            return save_json(filename, data)
+        with self._cond:
+            # 与 flush 中解除 pinned 的操作互斥，避免新快照被刚落盘的旧数据覆盖
+            snapshot = json_file_cache.put(filename, data, pinned=True)
+            self._pending[filename] = snapshot
+            self.saves += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return True
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            time.sleep(self.delay)  # 等待窗口期内的后续保存一起合并
+            self.flush()
+    
+    def flush(self):
+        """立即把所有待写入的数据落盘"""
+        with self._write_lock:
+            with self._cond:
+                pending, self._pending = self._pending, {}
+            for filename, data in pending.items():
+                try:
+                    _write_json_atomic(filename, data)
+                    self.writes += 1
+                except (IOError, OSError, TypeError) as e:
+                    logger.error(f"❌ 保存JSON文件 {filename} 失败: {e}")
+                    with self._cond:
+                        self._pending.setdefault(filename, data)
+                    continue
+                with self._cond:
+                    newer = filename in self._pending
+                    if not newer:
+                        # 已落盘：解除 pinned 并记录写入后的文件时间戳，避免下次读取时重新解析。
+                        # 在锁内完成，防止与此期间排队的新快照交错
+                        json_file_cache.put(filename, data)
+
+json_write_behind = JsonWriteBehind(JSON_WRITE_BEHIND_DELAY) if IS_MAIN_PROCESS else None
+if IS_MAIN_PROCESS:
+    atexit.register(json_write_behind.flush)
+
+# ========== 按天分段的追加日志 ==========
+class DailyJsonlLog:
+    """
+    按天分段的追加日志（JSON Lines）
+    
+    每条记录追加到当天的 {prefix}_{YYYY-MM-DD}.jsonl，写入代价与历史长度无关。
+    另维护一个小索引 {prefix}_index.json，记录每个分段的条数和已统计到的字节偏移，
+    汇总时只读索引。索引经 json_write_behind 延迟写盘，进程异常退出导致索引落后时，
+    首次使用会从记录的偏移处续扫分段尾部补齐。
+    过去的分段可以流式压缩为 {prefix}_{YYYY-MM-DD}.jsonl.gz 归档，过期分段按文件名整段删除。
+    """
+    
+    def __init__(self, directory, prefix):
+        self.directory = directory
+        self.prefix = prefix
+        self.index_file = os.path.join(directory, f"{prefix}_index.json")
+        self._lock = threading.RLock()
+        self._index = None  # day -> {"count": 条数, "offset": 已统计的字节数, "archived": 是否已压缩}
+    
+    def segment_path(self, day):
+        return os.path.join(self.directory, f"{self.prefix}_{day}.jsonl")
+    
+    def archive_path(self, day):
+        return self.segment_path(day) + ".gz"
+    
+    def segment_file(self, day):
+        """分段当前所在的文件（已归档时为 .gz）"""
+        archive = self.archive_path(day)
+        return archive if os.path.exists(archive) else self.segment_path(day)
+    
+    def _segment_days(self):
+        """磁盘上现有分段（含归档）的日期（按文件名解析）"""
+        head = f"{self.prefix}_"
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        days = set()
+        for name in names:
+            if name.startswith(head):
+                for tail in (".jsonl", ".jsonl.gz"):
+                    if name.endswith(tail):
+                        days.add(name[len(head):-len(tail)])
+        return sorted(days)
+    
+    @staticmethod
+    def _scan(path, offset):
+        """
+        从 offset 处统计完整的行
+        
+        Returns:
+            tuple: (行数, 最后一个完整行结束处的偏移)
+        """
+        count = 0
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # 崩溃时写了一半的最后一行
+                count += 1
+                offset += len(line)
+        return count, offset
+    
+    def _ensure_index(self):
+        """首次使用时加载索引并与磁盘上的分段核对（调用方需持有锁）"""
+        if self._index is not None:
+            return self._index
+        stored = load_json(self.index_file, {})
+        index = {}
+        for day in self._segment_days():
+            path = self.segment_path(day)
+            entry = stored.get(day) or {"count": 0, "offset": 0}
+            if os.path.exists(self.archive_path(day)):
+                if os.path.exists(path):
+                    os.remove(path)  # 压缩完成后、删除原分段前退出留下的残留
+                if not entry.get("archived"):
+                    with gzip.open(self.archive_path(day), "rb") as f:
+                        entry = {"count": sum(1 for _ in f), "offset": 0, "archived": True}
+                index[day] = entry
+                continue
+            size = os.path.getsize(path)
+            if entry.get("archived") or entry["offset"] > size:
+                entry = {"count": 0, "offset": 0}  # 分段被截断过，重新统计
+            if entry["offset"] < size:
+                count, offset = self._scan(path, entry["offset"])
+                entry = {"count": entry["count"] + count, "offset": offset}
+                if offset < size:
+                    os.truncate(path, offset)  # 去掉写了一半的行，避免与下一条记录粘连
+            index[day] = entry
+        self._index = index
+        if index != stored:
+            json_write_behind.save(self.index_file, index)
+        return index
+    
+    def append(self, record, day=None):
+        """
+        追加一条记录
+        
+        Args:
+            record: 可JSON序列化的字典
+            day: 分段日期（YYYY-MM-DD），默认为上海时间的今天
+        """
+        day = day or get_shanghai_now().strftime('%Y-%m-%d')
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            index = self._ensure_index()
+            os.makedirs(self.directory, exist_ok=True)
+            entry = index.setdefault(day, {"count": 0, "offset": 0})
+            if entry.get("archived"):
+                # 已归档的日期：追加一个新的gzip成员，读取时会连续解压
+                with gzip.open(self.archive_path(day), "ab") as f:
+                    f.write(line)
+            else:
+                with open(self.segment_path(day), "ab") as f:
+                    f.write(line)
+                entry["offset"] += len(line)
+            entry["count"] += 1
+            json_write_behind.save(self.index_file, index)
+    
+    def counts(self):
+        """各分段的记录条数（只读索引），按日期排序"""
+        with self._lock:
+            return {day: entry["count"] for day, entry in sorted(self._ensure_index().items())}
+    
+    def read(self, day):
+        """逐行读取一个分段（含归档）的记录，不整体载入内存"""
+        path = self.segment_file(day)
+        if not os.path.exists(path):
+            return
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+    
+    def archive_before(self, day):
+        """
+        把早于 day 的未归档分段流式压缩为 .jsonl.gz
+        
+        压缩在锁外按块进行，不整体读入内存；完成后若原分段在此期间有新的追加则放弃本次归档。
+        
+        Returns:
+            list: 本次归档的日期
+        """
+        with self._lock:
+            pending = [(d, e["offset"]) for d, e in sorted(self._ensure_index().items())
+                       if d < day and not e.get("archived")]
+        archived = []
+        for old_day, offset in pending:
+            path = self.segment_path(old_day)
+            fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=self.directory)
+            try:
+                with open(path, "rb") as fin, os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as fout:
+                    shutil.copyfileobj(fin, fout, 1024 * 1024)
+                with self._lock:
+                    entry = self._index.get(old_day)
+                    if entry is None or entry.get("archived") or entry["offset"] != offset or os.path.getsize(path) != offset:
+                        os.remove(tmp_path)
+                        continue
+                    os.replace(tmp_path, self.archive_path(old_day))
+                    os.remove(path)
+                    self._index[old_day] = {"count": entry["count"], "offset": 0, "archived": True}
+                    json_write_behind.save(self.index_file, self._index)
+                archived.append(old_day)
+            except OSError as e:
+                logger.error(f"❌ 归档日志分段 {path} 失败: {e}")
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        return archived
+    
+    def drop_before(self, day):
+        """
+        按文件名删除早于 day 的分段（含归档）
+        
+        Returns:
+            dict: 被删除的 日期 -> 记录条数
+        """
+        dropped = {}
+        with self._lock:
+            index = self._ensure_index()
+            for old_day in self._segment_days():
+                if old_day >= day:
+                    continue
+                for path in (self.segment_path(old_day), self.archive_path(old_day)):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                dropped[old_day] = index.pop(old_day, {}).get("count", 0)
+            if dropped:
+                json_write_behind.save(self.index_file, index)
+        return dropped
+
+# ========== 状态存储 ==========
+# 集合型存储（用户ID集合）与字典型存储（key -> JSON值）各自对应的JSON文件
+SET_STORES = {
+    'allowed_users': ALLOWED_USERS_FILE,
+    'banned_users': BANNED_USERS_FILE,
+}
+KV_STORES = {
+    'usage_stats': USAGE_STATS_FILE,
+    'user_limits': USER_LIMITS_FILE,
+    'temp_users': TEMP_USERS_FILE,
+    'scheduled_tasks': SCHEDULED_TASKS_FILE,
+    'admin_attempts': ADMIN_ATTEMPT_FILE,
+}
+
+class JsonStateStore:
+    """
+    基于JSON文件的状态存储（STATE_BACKEND=json）
+    
+    每次修改都整体重写对应文件，读操作经过 json_file_cache，写操作经过 json_write_behind 合并。
+    调度线程、执行线程池与事件循环会同时修改状态，所有读改写都在同一把锁内完成，
+    避免计数丢失或新增任务被覆盖（仅保证进程内串行，多进程共享请使用SQLite后端）。
+    """
+    
+    def __init__(self):
+        self._lock = threading.RLock()
+    
+    # ----- 集合 -----
+    def members_load(self, store):
+        return set(load_json(SET_STORES[store], []))
+    
+    def members_save(self, store, members):
+        with self._lock:
+            json_write_behind.save(SET_STORES[store], list(members))
+    
+    def is_member(self, store, member):
+        return member in json_file_cache.get(SET_STORES[store], [], view=frozenset)
+    
+    def members_add(self, store, member):
+        """加入集合，返回是否有变化"""
+        with self._lock:
+            members = self.members_load(store)
+            if member in members:
+                return False
+            members.add(member)
+            self.members_save(store, members)
+            return True
+    
+    def members_remove(self, store, member):
+        """移出集合，返回是否有变化"""
+        with self._lock:
+            members = self.members_load(store)
+            if member not in members:
+                return False
+            members.discard(member)
+            self.members_save(store, members)
+            return True
+    
+    # ----- 字典 -----
+    def kv_load(self, store):
+        return load_json(KV_STORES[store], {})
+    
+    def kv_save(self, store, data):
+        with self._lock:
+            json_write_behind.save(KV_STORES[store], data)
+    
+    def kv_get(self, store, key, default=None):
+        value = json_file_cache.get(KV_STORES[store], {}).get(key, default)
+        return _copy_json(value)
+    
+    def kv_put(self, store, key, value):
+        with self._lock:
+            data = self.kv_load(store)
+            data[key] = value
+            self.kv_save(store, data)
+    
+    def kv_delete(self, store, key):
+        with self._lock:
+            data = self.kv_load(store)
+            if data.pop(key, None) is not None:
+                self.kv_save(store, data)
+    
+    def kv_update(self, store, key, fn):
+        """用 fn(旧值或None) 的结果更新一项，fn返回None时不写入"""
+        with self._lock:
+            data = self.kv_load(store)
+            value = fn(data.get(key))
+            if value is not None:
+                data[key] = value
+                self.kv_save(store, data)
+            return value
+    
+    def kv_version(self, store):
+        """存储的版本标记（文件的 mtime 与大小），文件被修改后变化"""
+        return JsonFileCache._stamp(KV_STORES[store])
+    
+    # ----- 每日次数 -----
+    def daily_usage_load(self):
+        return load_json(DAILY_USAGE_FILE, {})
+    
+    def daily_usage_save(self, usage_data):
+        with self._lock:
+            json_write_behind.save(DAILY_USAGE_FILE, usage_data)
+    
+    def daily_usage_get(self, day, user_id):
+        return json_file_cache.get(DAILY_USAGE_FILE, {}).get(day, {}).get(str(user_id), 0)
+    
+    def daily_usage_increment(self, day, user_id):
+        with self._lock:
+            usage_data = self.daily_usage_load()
+            day_usage = usage_data.setdefault(day, {})
+            day_usage[str(user_id)] = day_usage.get(str(user_id), 0) + 1
+            self.daily_usage_save(usage_data)
+            return day_usage[str(user_id)]
+
+class SqliteStateStore:
+    """
+    基于SQLite（WAL模式）的状态存储（STATE_BACKEND=sqlite，默认）
+    
+    集合、字典、每日次数分别存放在带主键索引的表中，单项更新只改一行。
+    首次打开时把现有JSON文件一次性导入（meta 表记录迁移完成，原文件保留不动）。
+    进程内共享一个连接并用锁串行化，跨进程并发由SQLite自身的锁和 busy_timeout 处理。
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS members (store TEXT NOT NULL, member TEXT NOT NULL, PRIMARY KEY (store, member));
+        CREATE TABLE IF NOT EXISTS kv (store TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (store, key));
+        CREATE TABLE IF NOT EXISTS daily_usage (day TEXT NOT NULL, user_id TEXT NOT NULL, count INTEGER NOT NULL DEFAULT 0,
+                                                PRIMARY KEY (day, user_id));
+    """
+    
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.RLock()
+        self._conn = None
+    
+    @staticmethod
+    def _encode(value):
+        return json.dumps(value, ensure_ascii=False)
+    
+    def _connection(self):
+        """首次使用时打开数据库、建表并迁移JSON数据（调用方需持有锁）"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.filename, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.SCHEMA)
+            self._conn = conn
+            self._migrate_json()
+        return self._conn
+    
+    @contextlib.contextmanager
+    def _tx(self):
+        """写事务：BEGIN IMMEDIATE 立即取得写锁，读改写在事务内原子完成"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+    
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+    
+    def _migrate_json(self):
+        """一次性把现有JSON文件导入数据库（调用方需持有锁）"""
+        conn = self._conn
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return
+        imported = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for store, filename in SET_STORES.items():
+                if os.path.exists(filename):
+                    conn.executemany("INSERT OR IGNORE INTO members (store, member) VALUES (?, ?)",
+                                     [(store, self._encode(m)) for m in load_json(filename, [])])
+                    imported.append(filename)
+            for store, filename in KV_STORES.items():
+                if os.path.exists(filename):
+                    conn.executemany("INSERT OR REPLACE INTO kv (store, key, value) VALUES (?, ?, ?)",
+                                     [(store, str(k), self._encode(v)) for k, v in load_json(filename, {}).items()])
+                    imported.append(filename)
+            if os.path.exists(DAILY_USAGE_FILE):
+                conn.executemany("INSERT OR REPLACE INTO daily_usage (day, user_id, count) VALUES (?, ?, ?)",
+                                 [(day, str(uid), int(count))
+                                  for day, users in load_json(DAILY_USAGE_FILE, {}).items()
+                                  for uid, count in users.items()])
+                imported.append(DAILY_USAGE_FILE)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (get_shanghai_now().isoformat(),))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        if imported:
+            logger.info(f"📦 已将 {len(imported)} 个JSON状态文件迁移到 {self.filename}: {', '.join(imported)}")
+    
+    # ----- 集合 -----
+    def members_load(self, store):
+        return {json.loads(m) for (m,) in self._query("SELECT member FROM members WHERE store = ?", (store,))}
+    
+    def members_save(self, store, members):
+        wanted = {self._encode(m) for m in members}
+        with self._tx() as conn:
+            existing = {m for (m,) in conn.execute("SELECT member FROM members WHERE store = ?", (store,))}
+            conn.executemany("DELETE FROM members WHERE store = ? AND member = ?", [(store, m) for m in existing - wanted])
+            conn.executemany("INSERT INTO members (store, member) VALUES (?, ?)", [(store, m) for m in wanted - existing])
+    
+    def is_member(self, store, member):
+        return bool(self._query("SELECT 1 FROM members WHERE store = ? AND member = ?", (store, self._encode(member))))
+    
+    def members_add(self, store, member):
+        """加入集合，返回是否有变化"""
+        with self._tx() as conn:
+            return conn.execute("INSERT OR IGNORE INTO members (store, member) VALUES (?, ?)",
+                                (store, self._encode(member))).rowcount > 0
+    
+    def members_remove(self, store, member):
+        """移出集合，返回是否有变化"""
+        with self._tx() as conn:
+            return conn.execute("DELETE FROM members WHERE store = ? AND member = ?",
+                                (store, self._encode(member))).rowcount > 0
+    
+    # ----- 字典 -----
+    def kv_load(self, store):
+        return {k: json.loads(v) for k, v in self._query("SELECT key, value FROM kv WHERE store = ?", (store,))}
+    
+    def kv_save(self, store, data):
+        """整体保存：只写入有变化的项并删除已移除的项"""
+        wanted = {str(k): self._encode(v) for k, v in data.items()}
+        with self._tx() as conn:
+            existing = dict(conn.execute("SELECT key, value FROM kv WHERE store = ?", (store,)).fetchall())
+            conn.executemany("DELETE FROM kv WHERE store = ? AND key = ?", [(store, k) for k in existing.keys() - wanted.keys()])
+            conn.executemany("INSERT OR REPLACE INTO kv (store, key, value) VALUES (?, ?, ?)",
+                             [(store, k, v) for k, v in wanted.items() if existing.get(k) != v])
+    
+    def kv_get(self, store, key, default=None):
+        rows = self._query("SELECT value FROM kv WHERE store = ? AND key = ?", (store, str(key)))
+        return json.loads(rows[0][0]) if rows else default
+    
+    def kv_put(self, store, key, value):
+        with self._tx() as conn:
+            conn.execute("INSERT OR REPLACE INTO kv (store, key, value) VALUES (?, ?, ?)", (store, str(key), self._encode(value)))
+    
+    def kv_delete(self, store, key):
+        with self._tx() as conn:
+            conn.execute("DELETE FROM kv WHERE store = ? AND key = ?", (store, str(key)))
+    
+    def kv_update(self, store, key, fn):
+        """在同一事务内用 fn(旧值或None) 的结果更新一项，fn返回None时不写入"""
+        with self._tx() as conn:
+            row = conn.execute("SELECT value FROM kv WHERE store = ? AND key = ?", (store, str(key))).fetchone()
+            value = fn(json.loads(row[0]) if row else None)
+            if value is not None:
+                conn.execute("INSERT OR REPLACE INTO kv (store, key, value) VALUES (?, ?, ?)", (store, str(key), self._encode(value)))
+        return value
+    
+    def kv_version(self, store):
+        """数据库的版本标记（PRAGMA data_version）：其他进程或外部工具提交修改后变化，本进程的写入不改变该值"""
+        return self._query("PRAGMA data_version")[0][0]
+    
+    # ----- 每日次数 -----
+    def daily_usage_load(self):
+        usage_data = {}
+        for day, user_id, count in self._query("SELECT day, user_id, count FROM daily_usage"):
+            usage_data.setdefault(day, {})[user_id] = count
+        return usage_data
+    
+    def daily_usage_save(self, usage_data):
+        with self._tx() as conn:
+            conn.execute("DELETE FROM daily_usage")
+            conn.executemany("INSERT INTO daily_usage (day, user_id, count) VALUES (?, ?, ?)",
+                             [(day, str(uid), int(count)) for day, users in usage_data.items() for uid, count in users.items()])
+    
+    def daily_usage_get(self, day, user_id):
+        rows = self._query("SELECT count FROM daily_usage WHERE day = ? AND user_id = ?", (day, str(user_id)))
+        return rows[0][0] if rows else 0
+    
+    def daily_usage_increment(self, day, user_id):
+        with self._tx() as conn:
+            conn.execute("INSERT INTO daily_usage (day, user_id, count) VALUES (?, ?, 1) "
+                         "ON CONFLICT(day, user_id) DO UPDATE SET count = count + 1", (day, str(user_id)))
+            return conn.execute("SELECT count FROM daily_usage WHERE day = ? AND user_id = ?", (day, str(user_id))).fetchone()[0]
+
+state_store = None
+if IS_MAIN_PROCESS:
+    state_store = SqliteStateStore(STATE_DB_FILE) if STATE_BACKEND == "sqlite" else JsonStateStore()
+
 # 白名单
 
 def load_allowed_users():
-    return set(load_json(ALLOWED_USERS_FILE, []))
+    return state_store.members_load('allowed_users')
 
 def save_allowed_users(users):
-    save_json(ALLOWED_USERS_FILE, list(users))
+    state_store.members_save('allowed_users', users)
+
+def add_allowed_user(user_id):
+    return state_store.members_add('allowed_users', user_id)
+
+def remove_allowed_user(user_id):
+    return state_store.members_remove('allowed_users', user_id)
 
 # 黑名单
 
 def load_banned_users():
-    return set(load_json(BANNED_USERS_FILE, []))
+    return state_store.members_load('banned_users')
 
 def save_banned_users(users):
-    save_json(BANNED_USERS_FILE, list(users))
+    state_store.members_save('banned_users', users)
+
+def add_banned_user(user_id):
+    return state_store.members_add('banned_users', user_id)
+
+def remove_banned_user(user_id):
+    return state_store.members_remove('banned_users', user_id)
 
 # 日志
 
+admin_log = admin_audit = None
+if IS_MAIN_PROCESS:
+    admin_log = DailyJsonlLog(ADMIN_LOG_DIR, "admin_log")  # 管理命令日志，保留 ADMIN_LOG_RETENTION_DAYS 天
+    admin_audit = DailyJsonlLog(ADMIN_LOG_DIR, "admin_audit")  # 管理审计记录，只压缩归档、永不删除
+
 def log_admin_action(action, detail):
-    logs = load_json(ADMIN_LOG_FILE, [])
-    logs.append({
+    admin_audit.append({
         "time": get_shanghai_now().isoformat(),
         "action": action,
         "detail": detail
     })
-    save_json(ADMIN_LOG_FILE, logs)
+
+def import_legacy_admin_logs():
+    """
+    导入旧版管理日志，导入成功后才删除旧文件
+    
+    admin_log.json 是不限期保留的审计记录，导入 admin_audit；
+    按分钟命名的 admin_log_*.json 是管理命令日志，导入按保留期清理的 admin_log。
+    无法解析的旧文件原样保留，不会被删除。
+    """
+    imported_files = 0
+    imported_entries = 0
+    for target, files in ((admin_audit, [ADMIN_LOG_FILE] if os.path.exists(ADMIN_LOG_FILE) else []),
+                          (admin_log, sorted(glob.glob("admin_log_*.json")))):
+        entries = []
+        done = []
+        for f in files:
+            try:
+                with open(f, "r", encoding="utf-8") as fp:
+                    logs = json.load(fp)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error(f"❌ 旧版管理日志 {f} 无法读取，已保留原文件: {e}")
+                continue
+            if not isinstance(logs, list):
+                logger.error(f"❌ 旧版管理日志 {f} 格式不正确，已保留原文件")
+                continue
+            entries.extend(x for x in logs if isinstance(x, dict))
+            done.append(f)
+        entries.sort(key=lambda x: str(x.get("time", "")))
+        for entry in entries:
+            target.append(entry, day=str(entry.get("time", ""))[:10] or None)
+        for f in done:
+            os.remove(f)
+            json_file_cache.invalidate(f)
+        imported_files += len(done)
+        imported_entries += len(entries)
+    if imported_files:
+        logger.info(f"📦 已将 {imported_files} 个旧版管理日志文件（{imported_entries} 条记录）导入 {ADMIN_LOG_DIR}/")
 
 # 统计
 
 def load_usage_stats():
-    return load_json(USAGE_STATS_FILE, {})
+    return state_store.kv_load('usage_stats')
 
 def save_usage_stats(stats):
-    save_json(USAGE_STATS_FILE, stats)
+    state_store.kv_save('usage_stats', stats)
 
 # 每日次数
 
 def load_daily_usage():
-    return load_json(DAILY_USAGE_FILE, {})
+    return state_store.daily_usage_load()
 
 def save_daily_usage(usage_data):
-    save_json(DAILY_USAGE_FILE, usage_data)
+    state_store.daily_usage_save(usage_data)
 
 # 权限判断
 
@@ -192,7 +1131,7 @@ def is_admin(user_id):
     return str(user_id) == str(TELEGRAM_CHAT_ID)
 
 def is_banned(user_id):
-    return user_id in load_banned_users()
+    return state_store.is_member('banned_users', user_id)
 
 def is_allowed(user_id):
     # 只要不是黑名单都允许使用
@@ -200,42 +1139,231 @@ def is_allowed(user_id):
 
 # 用户专属签到次数管理
 def load_user_limits():
-    return load_json(USER_LIMITS_FILE, {})
+    return state_store.kv_load('user_limits')
 def save_user_limits(data):
-    save_json(USER_LIMITS_FILE, data)
+    state_store.kv_save('user_limits', data)
+def set_user_limit(user_id, limit):
+    state_store.kv_put('user_limits', str(user_id), limit)
 
 def get_daily_limit(user_id=None):
     # 优先查用户专属次数
     if user_id is not None:
-        user_limits = load_user_limits()
-        if str(user_id) in user_limits:
-            return user_limits[str(user_id)]
+        user_limit = state_store.kv_get('user_limits', str(user_id))
+        if user_limit is not None:
+            return user_limit
         if is_temp_user(user_id):
             return 5
-    stats = load_json("limit_config.json", {})
+    stats = json_file_cache.get("limit_config.json", {})
     return stats.get("limit", DEFAULT_DAILY_LIMIT)
 
 # 统计记录
 
 def record_usage(user_id):
-    stats = load_usage_stats()
     now = get_shanghai_now().strftime('%Y-%m-%d %H:%M:%S')
-    if str(user_id) not in stats:
-        stats[str(user_id)] = {"count": 0, "last": now}
-    stats[str(user_id)]["count"] += 1
-    stats[str(user_id)]["last"] = now
-    save_usage_stats(stats)
+    
+    def bump(entry):
+        entry = entry or {"count": 0, "last": now}
+        entry["count"] += 1
+        entry["last"] = now
+        return entry
+    
+    state_store.kv_update('usage_stats', str(user_id), bump)
 
 # 定时任务管理（新结构）
 def load_scheduled_tasks():
-    return load_json(SCHEDULED_TASKS_FILE, {})
+    return state_store.kv_load('scheduled_tasks')
 
 def save_scheduled_tasks(tasks):
-    save_json(SCHEDULED_TASKS_FILE, tasks)
+    state_store.kv_save('scheduled_tasks', tasks)
 
-def add_scheduled_task(user_id, module, username, hour, minute):
-    tasks = load_scheduled_tasks()
-    task_id = f"{user_id}_{module}_{username}_{hour:02d}{minute:02d}"
+def is_valid_cron(expr, hash_id=None):
+    """校验Cron表达式（支持 H 哈希写法，如 H(0-29) 8 * * *）"""
+    try:
+        return bool(expr) and croniter.is_valid(expr, hash_id=hash_id)
+    except Exception:
+        return False
+
+def format_task_schedule(task):
+    """
+    格式化任务的执行时间用于展示
+    
+    Args:
+        task: 任务信息字典
+        
+    Returns:
+        str: 固定时间任务返回 HH:MM，Cron任务返回表达式
+    """
+    if task.get('cron'):
+        text = f"cron({task['cron']})"
+    else:
+        text = f"{task['hour']:02d}:{task['minute']:02d}"
+    offset = task.get('offset') or 0
+    if offset:
+        text += f"(错峰+{offset // 60:02d}:{offset % 60:02d})"
+    return text
+
+def compute_spread_offset(task_id, hour, minute, tasks, load=None):
+    """
+    为错峰任务选择一个稳定的偏移量（秒）
+    
+    在 [标称时间, 标称时间 + SPREAD_WINDOW_MINUTES) 内选出当前负载最低的分钟，
+    负载相同时按任务ID的哈希决定，分钟内的秒数同样由哈希决定，保证同一任务结果稳定。
+    
+    Args:
+        task_id: 任务ID
+        hour: 标称小时
+        minute: 标称分钟
+        tasks: 现有全部任务，用于统计每分钟的任务数
+        load: 预先统计好的 分钟 -> 任务数，批量计算时传入以免每次遍历全部任务
+        
+    Returns:
+        int: 偏移秒数
+    """
+    window = max(SPREAD_WINDOW_MINUTES, 1)
+    if load is None:
+        load = collections.Counter()
+        for tid, task in tasks.items():
+            if tid == task_id or task.get('cron') or not task.get('enabled', True):
+                continue
+            fire_minute = task['hour'] * 60 + task['minute'] + (task.get('offset') or 0) // 60
+            load[fire_minute % 1440] += 1
+    base = hour * 60 + minute
+    seed = zlib.crc32(task_id.encode('utf-8'))
+    best = min(range(window), key=lambda i: (load[(base + i) % 1440], (i - seed) % window))
+    return best * 60 + (seed >> 8) % 60
+
+def get_task_next_run(task, after):
+    """
+    计算任务在指定时间之后的下一次触发时间
+    
+    Args:
+        task: 任务信息字典
+        after: 起始时间（上海时间，不带时区信息）
+        
+    Returns:
+        datetime: 下一次触发时间（已计入错峰偏移）
+    """
+    offset = timedelta(seconds=task.get('offset') or 0)
+    after = after - offset
+    if task.get('cron'):
+        return croniter(task['cron'], after, hash_id=task.get('id')).get_next(datetime) + offset
+    candidate = after.replace(hour=task['hour'], minute=task['minute'], second=0, microsecond=0)
+    if candidate <= after:
+        candidate += timedelta(days=1)
+    return candidate + offset
+
+def get_task_prev_run(task, before):
+    """
+    计算任务在指定时间（含）之前的最近一次触发时间
+    
+    Args:
+        task: 任务信息字典
+        before: 截止时间（上海时间，不带时区信息）
+        
+    Returns:
+        datetime: 最近一次触发时间（已计入错峰偏移）
+    """
+    offset = timedelta(seconds=task.get('offset') or 0)
+    before = before - offset
+    if task.get('cron'):
+        return croniter(task['cron'], before, hash_id=task.get('id')).get_prev(datetime) + offset
+    candidate = before.replace(hour=task['hour'], minute=task['minute'], second=0, microsecond=0)
+    if candidate > before:
+        candidate -= timedelta(days=1)
+    return candidate + offset
+
+def get_task_misfire_policy(task):
+    """获取任务的错过补偿策略，无效配置回退为默认策略"""
+    policy = task.get('misfire', DEFAULT_MISFIRE_POLICY)
+    return policy if policy in MISFIRE_POLICIES else DEFAULT_MISFIRE_POLICY
+
+def should_run_misfired(task, fire_time, now):
+    """
+    判断一次（可能已延迟的）触发是否应当执行
+    
+    Args:
+        task: 任务信息字典
+        fire_time: 计划触发时间
+        now: 当前时间
+        
+    Returns:
+        bool: 是否执行
+    """
+    lateness = (now - fire_time).total_seconds()
+    if lateness <= MISFIRE_ON_TIME_SECONDS:
+        return True
+    policy = get_task_misfire_policy(task)
+    if policy == MISFIRE_SKIP:
+        return False
+    if policy == MISFIRE_RUN_LATE:
+        return lateness <= MISFIRE_GRACE_SECONDS
+    return True
+
+def parse_task_time(value):
+    """解析任务中保存的ISO时间字符串，失败返回None"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+def update_task_last_run(task_id, last_run):
+    """
+    持久化任务的最后执行时间
+    
+    Args:
+        task_id: 任务ID
+        last_run: 最后执行时间（ISO格式字符串）
+    """
+    def set_last_run(task):
+        if task is not None:
+            task['last_run'] = last_run
+        return task
+    
+    state_store.kv_update('scheduled_tasks', task_id, set_last_run)
+
+def update_task_last_fire(task_id, last_fire):
+    """
+    持久化任务最近一次已处理的计划触发时间
+    
+    无论执行成功、失败、超时还是因封禁、限额等原因跳过都会记录，
+    执行日志压缩掉完成记录后，重启时据此判断该次触发已处理，不会被当作错过再次执行
+    
+    Args:
+        task_id: 任务ID
+        last_fire: 计划触发时间（ISO格式字符串）
+    """
+    def set_last_fire(task):
+        if task is not None:
+            task['last_fire'] = last_fire
+        return task
+    
+    state_store.kv_update('scheduled_tasks', task_id, set_last_fire)
+
+def add_scheduled_task(user_id, module, username, hour=None, minute=None, cron=None, spread=False):
+    """
+    添加定时任务
+    
+    Args:
+        user_id: 用户ID
+        module: 模块名称
+        username: 账号
+        hour: 固定执行小时（cron为空时使用）
+        minute: 固定执行分钟（cron为空时使用）
+        cron: Cron表达式，如 "0 8 * * 1-5"（工作日8点）、"0 */6 * * *"（每6小时）
+        spread: 是否错峰执行（仅固定时间任务），在标称时间后的窗口内自动分配偏移
+        
+    Returns:
+        tuple: (success, task_id或错误信息)
+    """
+    if cron:
+        cron = " ".join(cron.split())
+        task_id = f"{user_id}_{module}_{username}_cron{hashlib.md5(cron.encode('utf-8')).hexdigest()[:6]}"
+        if not is_valid_cron(cron, hash_id=task_id):
+            return False, "Cron表达式无效"
+    else:
+        task_id = f"{user_id}_{module}_{username}_{hour:02d}{minute:02d}"
     task = {
         "id": task_id,
         "user_id": str(user_id),
@@ -243,23 +1371,27 @@ def add_scheduled_task(user_id, module, username, hour, minute):
         "username": username,
         "hour": hour,
         "minute": minute,
+        "cron": cron,
+        "offset": compute_spread_offset(task_id, hour, minute, load_scheduled_tasks()) if spread and not cron else 0,
         "enabled": True,
+        "misfire": DEFAULT_MISFIRE_POLICY,
         "created_at": get_shanghai_now().isoformat(),
         "last_run": None
     }
-    tasks[task_id] = task
-    save_scheduled_tasks(tasks)
+    state_store.kv_put('scheduled_tasks', task_id, task)
+    if task_scheduler:
+        task_scheduler.schedule_task(task)
     return True, task_id
 
 def remove_scheduled_task(task_id, user_id):
-    tasks = load_scheduled_tasks()
-    if task_id not in tasks:
+    task = state_store.kv_get('scheduled_tasks', task_id)
+    if task is None:
         return False, "任务不存在"
-    task = tasks[task_id]
     if str(task["user_id"]) != str(user_id) and not is_admin(int(user_id)):
         return False, "无权限删除此任务"
-    del tasks[task_id]
-    save_scheduled_tasks(tasks)
+    state_store.kv_delete('scheduled_tasks', task_id)
+    if task_scheduler:
+        task_scheduler.unschedule_task(task_id)
     return True, "任务已删除"
 
 def get_user_tasks(user_id):
@@ -283,39 +1415,164 @@ def parse_time_input(time_str):
 
 # 日志保存函数
 
-def save_task_log(module, username, status, message, error=None):
+class SigninLedger:
+    """
+    签到结果台账
+    
+    每次执行追加一条结构化记录（平台、账号、任务ID、状态、结果、耗时）到按天分段的 DailyJsonlLog，
+    并在内存中维护 (日期, 平台, 账号) -> 当日汇总 的索引，查询某账号今日状态为O(1)。
+    同时随每条记录增量维护各用户当日的失败任务集合：失败时加入，该账号成功后移除；
+    以及各任务当日已执行到的自动重试序号，重启后调度器据此延续每日重试上限。
+    某一天的索引在首次查询或写入时从对应分段回放一次建立。
+    """
+    
+    def __init__(self, directory):
+        self.log = DailyJsonlLog(directory, "signin")
+        self._lock = threading.RLock()
+        self._index = {}  # (day, platform, username) -> {"status": 当日状态, "last": 最后一条记录}
+        self._failed = {}  # (day, user_id) -> {task_id: 最后一条失败记录}
+        self._retries = {}  # (day, task_id) -> 当天已执行的最大自动重试序号
+        self._loaded_days = set()
+    
+    def _apply(self, day, record):
+        account = (record.get("platform"), record.get("username"))
+        entry = self._index.setdefault((day,) + account, {"status": "none", "last": None})
+        if entry["status"] != "success":
+            entry["status"] = record.get("status")  # 当天成功过即视为已成功
+        entry["last"] = record
+        
+        task_id = record.get("task_id")
+        if task_id and record.get("attempt"):
+            self._retries[(day, task_id)] = max(self._retries.get((day, task_id), 0), record["attempt"])
+        user_id = record.get("user_id")
+        if user_id is None and task_id and state_store is not None:
+            # 早期版本写入的记录没有 user_id，按任务归属补上
+            task = state_store.kv_get('scheduled_tasks', task_id)
+            user_id = task.get("user_id") if isinstance(task, dict) else None
+        if user_id is None or not task_id:
+            return
+        failed = self._failed.setdefault((day, str(user_id)), {})
+        if entry["status"] == "success":
+            # 账号已成功，该账号下的所有任务都不再算失败
+            for tid in [tid for tid, r in failed.items() if (r.get("platform"), r.get("username")) == account]:
+                del failed[tid]
+        else:
+            failed[task_id] = record
+    
+    def _ensure_day(self, day):
+        """回放某天的分段建立索引（调用方需持有锁）"""
+        if day not in self._loaded_days:
+            for record in self.log.read(day):
+                self._apply(day, record)
+            self._loaded_days.add(day)
+    
+    def record(self, platform, username, status, message, task_id=None, user_id=None, error=None, timings=None, attempt=0):
+        """
+        追加一条签到结果
+        
+        Args:
+            platform: 平台（模块名称）
+            username: 账号
+            status: 状态 (success/error/timeout)
+            message: 结果消息
+            task_id: 定时任务ID
+            user_id: 任务所属用户ID
+            error: 错误信息
+            timings: 各阶段耗时（秒）
+            attempt: 自动重试序号，首次执行为0
+        """
+        now = get_shanghai_now()
+        day = now.strftime('%Y-%m-%d')
+        record = {"time": now.isoformat(), "platform": platform, "username": username,
+                  "task_id": task_id, "status": status, "message": message}
+        if user_id is not None:
+            record["user_id"] = str(user_id)
+        if error:
+            record["error"] = error
+        if timings:
+            record["timings"] = {k: round(v, 3) if isinstance(v, float) else v for k, v in timings.items()}
+        if attempt:
+            record["attempt"] = attempt
+        with self._lock:
+            self._ensure_day(day)
+            self.log.append(record, day=day)
+            self._apply(day, record)
+    
+    def get(self, platform, username, day=None):
+        """
+        查询账号某天的汇总
+        
+        Returns:
+            dict: {"status": ..., "last": 最后一条记录}，当天没有记录时返回None
+        """
+        day = day or get_shanghai_now().strftime('%Y-%m-%d')
+        with self._lock:
+            self._ensure_day(day)
+            return _copy_json(self._index.get((day, platform, username)))
+    
+    def failed(self, user_id, day=None):
+        """
+        用户某天失败且之后未成功的任务
+        
+        Returns:
+            dict: task_id -> 最后一条失败记录
+        """
+        day = day or get_shanghai_now().strftime('%Y-%m-%d')
+        with self._lock:
+            self._ensure_day(day)
+            return _copy_json(self._failed.get((day, str(user_id)), {}))
+    
+    def retry_attempts(self, task_id, day=None):
+        """任务某天已执行到的最大自动重试序号，没有重试记录时返回0"""
+        day = day or get_shanghai_now().strftime('%Y-%m-%d')
+        with self._lock:
+            self._ensure_day(day)
+            return self._retries.get((day, task_id), 0)
+    
+    def drop_before(self, day):
+        """删除早于 day 的分段及其索引，返回被删除的 日期 -> 记录条数"""
+        with self._lock:
+            dropped = self.log.drop_before(day)
+            self._index = {key: entry for key, entry in self._index.items() if key[0] >= day}
+            self._failed = {key: failed for key, failed in self._failed.items() if key[0] >= day}
+            self._retries = {key: n for key, n in self._retries.items() if key[0] >= day}
+            self._loaded_days = {d for d in self._loaded_days if d >= day}
+        return dropped
+
+signin_ledger = SigninLedger(SIGNIN_LEDGER_DIR) if IS_MAIN_PROCESS else None
+
+def save_task_log(module, username, status, message, error=None, task_id=None, user_id=None, timings=None, attempt=0):
     """
-    保存任务执行日志
+    保存任务执行结果到签到台账
     
     Args:
         module: 模块名称
         username: 用户名
-        status: 状态 (success/error)
+        status: 状态 (success/error/timeout)
         message: 消息
         error: 错误信息
+        task_id: 任务ID
+        user_id: 任务所属用户ID
+        timings: 各阶段耗时
+        attempt: 自动重试序号，首次执行为0
     """
     try:
         # 检查模块名称是否有效
         if not module or module.strip() == '':
-            print(f"⚠️ 跳过保存任务日志：模块名称为空 (用户名: {username})")
+            logger.warning(f"⚠️ 跳过保存任务日志：模块名称为空 (用户名: {username})")
             return
-            
-        now = get_shanghai_now().strftime('%Y%m%d_%H%M%S')
-        log_dir = get_log_dir(module)
-        os.makedirs(log_dir, exist_ok=True)
-        
-        if status == 'success':
-            log_file = os.path.join(log_dir, f"{now}_success.log")
-        else:
-            log_file = os.path.join(log_dir, f"{now}_error.log")
-        
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(f"账号: {username}\n时间: {now}\n状态: {status}\n结果: {message}\n")
-            if error:
-                f.write(f"错误原因: {error}\n")
-            f.write("-"*30+"\n")
+        signin_ledger.record(module, username, status, message, task_id=task_id, user_id=user_id, error=error, timings=timings, attempt=attempt)
     except Exception as e:
-        print(f"❌ 保存任务日志失败: {e}")
+        logger.error(f"❌ 保存任务日志失败: {e}")
+
+def format_ledger_record(record):
+    """把台账记录格式化为展示文本（与原先的文本日志格式一致）"""
+    time_text = parse_task_time(record.get("time"))
+    text = (f"账号: {record.get('username')}\n时间: {time_text.strftime('%Y%m%d_%H%M%S') if time_text else record.get('time')}\n"
+            f"状态: {record.get('status')}\n结果: {record.get('message')}\n")
+    if record.get("error"):
+        text += f"错误原因: {record['error']}\n"
+    return text + "-"*30 + "\n"
 
 # 操作日志保存函数
 
@@ -335,7 +1592,7 @@ def save_op_log(module, username, op_type, task_id, status, message, error=None)
     try:
         # 检查模块名称是否有效
         if not module or module.strip() == '':
-            print(f"⚠️ 跳过保存操作日志：模块名称为空 (任务ID: {task_id})")
+            logger.warning(f"⚠️ 跳过保存操作日志：模块名称为空 (任务ID: {task_id})")
             return
             
         now = get_shanghai_now().strftime('%Y%m%d_%H%M%S')
@@ -349,7 +1606,7 @@ def save_op_log(module, username, op_type, task_id, status, message, error=None)
                 f.write(f"错误原因: {error}\n")
             f.write("-"*30+"\n")
     except Exception as e:
-        print(f"❌ 保存操作日志失败: {e}")
+        logger.error(f"❌ 保存操作日志失败: {e}")
 
 def get_task_today_status(module, username):
     """
@@ -362,32 +1619,10 @@ def get_task_today_status(module, username):
     Returns:
         str: 状态 ('success', 'error', 'none')
     """
-    today = get_shanghai_now().strftime('%Y%m%d')
-    log_dir = get_log_dir(module)
-    
-    # 检查成功日志
-    success_logs = glob.glob(os.path.join(log_dir, f"{today}_*_success.log"))
-    for log_file in success_logs:
-        try:
-            with open(log_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                if username in content:
-                    return 'success'
-        except Exception:
-            pass
-    
-    # 检查错误日志
-    error_logs = glob.glob(os.path.join(log_dir, f"{today}_*_error.log"))
-    for log_file in error_logs:
-        try:
-            with open(log_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                if username in content:
-                    return 'error'
-        except Exception:
-            pass
-    
-    return 'none'
+    entry = signin_ledger.get(module, username)
+    if entry is None:
+        return 'none'
+    return 'success' if entry["status"] == 'success' else 'error'
 
 def get_failed_tasks(user_id):
     """
@@ -400,229 +1635,1625 @@ def get_failed_tasks(user_id):
         list: 失败的任务列表，每个元素包含任务ID、模块、用户名等信息
     """
     failed_tasks = []
-    today = get_shanghai_now().strftime('%Y%m%d')
-    
-    # 获取用户的所有任务
-    user_tasks = get_user_tasks(user_id)
     
-    for task_id, task in user_tasks.items():
+    # 失败集合随执行结果增量维护，这里只需逐个补充任务信息
+    for task_id, last in signin_ledger.failed(user_id).items():
+        task = state_store.kv_get('scheduled_tasks', task_id)
+        if task is None:
+            continue  # 任务已删除
         module = task['module']
         username = task.get('username', '')
         
-        # 检查今天是否有错误日志
-        log_dir = get_log_dir(module)
-        error_logs = glob.glob(os.path.join(log_dir, f"{today}_*_error.log"))
-        success_logs = glob.glob(os.path.join(log_dir, f"{today}_*_success.log"))
+        # 检查是否是凭证不存在的错误
+        if last.get("message") == '凭证不存在':
+            if os.path.exists(get_user_file(module, username)):
+                # 凭证已重新配置，失败记录已过时，跳过
+                logger.warning(f"⚠️ 跳过旧日志：{username} 的凭证文件已存在")
+                continue
+            error_type = 'credential_missing'
+        else:
+            error_type = 'other'
+        failed_tasks.append({
+            'task_id': task_id,
+            'module': module,
+            'username': username,
+            'hour': task.get('hour'),
+            'minute': task.get('minute'),
+            'error': last.get('error') or last.get('message'),
+            'error_type': error_type
+        })
+    
+    return failed_tasks
+
+async def execute_task_manually(task_id, user_id):
+    """
+    手动执行指定任务并等待执行结束
+    
+    Args:
+        task_id: 任务ID
+        user_id: 用户ID
+        
+    Returns:
+        tuple: (success, message) 执行结果，success 仅在签到成功时为True
+    """
+    try:
+        # 获取任务信息
+        task = state_store.kv_get('scheduled_tasks', task_id)
+        if task is None:
+            return False, "❌ 任务不存在"
+        
+        # 验证任务所有者
+        if str(task.get('user_id')) != str(user_id):
+            return False, "❌ 您无权执行此任务"
         
-        # 先检查是否有成功日志（如果成功了就不算失败）
-        has_success = False
-        for log_file in success_logs:
+        # 检查任务是否启用
+        if not task.get('enabled', True):
+            return False, "❌ 任务已禁用"
+        
+        # 提交到交互通道，优先于排队中的定时任务执行；等待执行结束后再返回结果
+        if not task_scheduler:
+            return False, "❌ 任务调度器未启动"
+        future = task_scheduler.executor.submit(task.get('module'), task_scheduler._execute_task, task,
+                                                lane=LANE_INTERACTIVE, owner=user_id)
+        outcome = await asyncio.wrap_future(future)
+        if outcome is None:
+            return False, "❌ 任务未执行（账号受限、凭证缺失或任务数据不完整），详情见推送消息"
+        status, result = outcome
+        return status == 'success', f"平台: {task.get('module')}\n账号: {task.get('username')}\n结果: {result}"
+            
+    except Exception as e:
+        return False, f"❌ 执行任务失败: {e}"
+
+async def run_interactive_signin(user_id, module, func, *args):
+    """
+    在交互通道执行一次用户手动发起的签到并等待结果
+    
+    调度器未启动时退回到事件循环的默认线程池
+    
+    Args:
+        user_id: 用户ID
+        module: 平台名称（Acck/Akile）
+        func: 签到函数
+        *args: 签到函数参数
+        
+    Returns:
+        str: 签到结果文本
+    """
+    if task_scheduler and not task_scheduler.executor.is_shutdown:
+        future = task_scheduler.executor.submit(module, func, *args, lane=LANE_INTERACTIVE, owner=user_id)
+        return await asyncio.wrap_future(future)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, func, *args)
+
+# ========== 平台签到限流 ==========
+class TokenBucket:
+    """
+    线程安全的令牌桶
+    
+    令牌不足时调用方预订一个未来的令牌（令牌数可为负）并休眠到可用时刻，
+    因此等待者按到达顺序依次放行。
+    """
+    
+    def __init__(self, rate, burst, clock=None, sleep=None):
+        """
+        Args:
+            rate: 每秒补充的令牌数
+            burst: 桶容量（允许的突发请求数）
+            clock: 返回秒数的单调时钟，默认 time.monotonic（压测时替换为虚拟时钟）
+            sleep: 休眠函数，默认 time.sleep
+        """
+        self.rate = max(rate, 0.001)
+        self.burst = max(burst, 1)
+        self.clock = clock or time.monotonic
+        self.sleep = sleep or time.sleep
+        self._tokens = float(self.burst)
+        self._updated = self.clock()
+        self._lock = threading.Lock()
+        self.waiting = 0  # 当前排队等待令牌的调用数
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+    
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def acquire(self):
+        """
+        获取一个令牌，必要时阻塞等待
+        
+        Returns:
+            float: 实际等待的秒数
+        """
+        with self._lock:
+            self._refill(self.clock())
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            if wait > 0:
+                self.waiting += 1
+        if wait > 0:
+            self.sleep(wait)
+        with self._lock:
+            if wait > 0:
+                self.waiting -= 1
+            self.acquired += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.last_wait = wait
+        return wait
+    
+    def stats(self):
+        """当前限流状态快照"""
+        with self._lock:
+            self._refill(self.clock())
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "tokens": max(self._tokens, 0.0),
+                "waiting": self.waiting,
+                "acquired": self.acquired,
+                "avg_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+                "max_wait": self.max_wait,
+                "last_wait": self.last_wait,
+            }
+
+class PlatformRateLimiter:
+    """按平台划分的令牌桶集合"""
+    
+    def __init__(self, limits, clock=None, sleep=None):
+        """
+        Args:
+            limits: 平台 -> (rate, burst)
+            clock: 传给各令牌桶的单调时钟，默认 time.monotonic
+            sleep: 传给各令牌桶的休眠函数，默认 time.sleep
+        """
+        self.buckets = {platform: TokenBucket(rate, burst, clock, sleep) for platform, (rate, burst) in limits.items()}
+    
+    def acquire(self, platform):
+        """获取指定平台的令牌，未配置限流的平台直接放行"""
+        bucket = self.buckets.get(platform)
+        return bucket.acquire() if bucket else 0.0
+    
+    def stats(self):
+        return {platform: bucket.stats() for platform, bucket in self.buckets.items()}
+
+platform_rate_limiter = PlatformRateLimiter(PLATFORM_RATE_LIMITS)
+
+def is_transient_failure(result):
+    """判断失败原因是否为可重试的临时性错误（超时、5xx、非JSON响应等）"""
+    return bool(TRANSIENT_ERROR_PATTERN.search(result or ""))
+
+_CREDENTIAL_SALT = os.urandom(16)
+
+def credential_digest(password, totp=None):
+    """凭证摘要（加进程内随机盐），用于确认缓存的结果属于同一凭证，内存中不保存明文"""
+    return hashlib.sha256(_CREDENTIAL_SALT + f"{password}\0{totp or ''}".encode("utf-8")).hexdigest()
+
+class SigninResultCache:
+    """
+    账号级当日签到结果缓存
+    
+    以 (平台, 账号, 上海日期) 为键缓存签到模块明确报告成功（含今日已签到）的结果，同一账号当天的后续签到直接返回缓存，
+    不再发起网络请求；同一账号的并发签到按账号串行，后到者直接复用先到者的结果。
+    每条缓存记录签到所用凭证的摘要，凭证不一致时不返回缓存，而是重新签到。
+    超时后仍在执行的签到登记为进行中，结束前同一账号不再发起新的签到。
+    """
+    
+    def __init__(self):
+        self._results = {}  # key -> (result, 签到时间, 凭证摘要)
+        self._locks = {}  # key -> threading.Lock
+        self._pending = {}  # key -> 超时后仍在执行的签到请求（Future）
+        self._lock = threading.Lock()
+        self._day = None
+        self.hits = 0
+    
+    def make_key(self, platform, username):
+        return (platform, str(username).strip().lower(), get_shanghai_now().date().isoformat())
+    
+    def _roll_day(self, day):
+        """跨天时丢弃前一天的缓存（调用方需持有锁）"""
+        if day != self._day:
+            self._day = day
+            self._results = {k: v for k, v in self._results.items() if k[2] == day}
+            self._locks = {k: v for k, v in self._locks.items() if k[2] == day}
+    
+    def lock_for(self, key):
+        """获取账号级互斥锁"""
+        with self._lock:
+            self._roll_day(key[2])
+            return self._locks.setdefault(key, threading.Lock())
+    
+    def get(self, key, digest):
+        """
+        Args:
+            key: make_key 生成的键
+            digest: 本次签到凭证的 credential_digest
+            
+        Returns:
+            str: 缓存的签到结果（附带缓存说明），无缓存或凭证不一致时返回None
+        """
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is None or not hmac.compare_digest(cached[2], digest):
+                return None
+            self.hits += 1
+        result, signed_at, _ = cached
+        return f"{result}\n(今日已于 {signed_at} 签到成功，本次未重复请求)"
+    
+    def put(self, key, result, digest):
+        with self._lock:
+            self._roll_day(key[2])
+            self._results[key] = (result, get_shanghai_now().strftime('%H:%M:%S'), digest)
+    
+    def hold(self, key, future, digest, unwrap=None):
+        """
+        登记一个超时后仍在执行的签到请求，请求结束前 in_flight 返回True，成功的结果到达后写入缓存
+        
+        Args:
+            key: make_key 生成的键
+            future: 请求的 Future
+            digest: 该请求凭证的 credential_digest
+            unwrap: 从 Future 的结果中取出 (ok, 结果文本) 的函数，默认结果本身即是
+        """
+        with self._lock:
+            self._pending[key] = future
+        
+        def done(f):
+            with self._lock:
+                if self._pending.get(key) is f:
+                    del self._pending[key]
+            if f.cancelled() or f.exception() is not None:
+                return
+            ok, result = unwrap(f.result()) if unwrap else f.result()
+            if ok:
+                self.put(key, result, digest)
+        
+        future.add_done_callback(done)
+    
+    def in_flight(self, key):
+        """账号是否还有超时后仍在执行的签到请求"""
+        with self._lock:
+            future = self._pending.get(key)
+        return future is not None and not future.done()
+
+signin_result_cache = SigninResultCache()
+
+class SigninDeadlineExceeded(Exception):
+    """签到超过端到端期限，pending 为仍在执行、结果尚未返回的请求"""
+    
+    def __init__(self, message, pending=None):
+        super().__init__(message)
+        self.pending = pending
+
+class SigninFuture(concurrent.futures.Future):
+    """记录开始执行时刻的 Future：签到期限从请求真正开始执行时算起，不含排队时间"""
+    
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.started_at = None
+    
+    def mark_started(self):
+        self.started_at = time.monotonic()
+        self.started.set()
+
+def wait_signin(future, timeout, what="签到"):
+    """
+    等待签到请求完成：先最多等待 timeout 秒让请求开始执行，再从开始时刻起最多等待 timeout 秒
+    
+    Args:
+        future: SigninFuture
+        timeout: 期限（秒），为0或None时不限
+        what: 错误信息中的操作名称
+        
+    Raises:
+        SigninDeadlineExceeded: 未能在期限内开始或完成
+    """
+    if not timeout:
+        return future.result()
+    if not future.started.wait(timeout):
+        raise SigninDeadlineExceeded(f"{what}排队超时（{timeout} 秒内未开始执行）", pending=future)
+    remaining = future.started_at + timeout - time.monotonic()
+    try:
+        return future.result(timeout=max(remaining, 0))
+    except concurrent.futures.TimeoutError:
+        raise SigninDeadlineExceeded(f"{what}超时（超过 {timeout} 秒），已放弃等待", pending=future)
+
+SIGNIN_FUNCS = {
+    'Acck': acck_main,
+    'Akile': akile_main,
+}
+
+# 平台 -> (预登录函数, 使用已登录会话签到的函数)
+WARMUP_FUNCS = {
+    'Acck': (acck_warmup, acck_checkin_with),
+    'Akile': (akile_warmup, akile_checkin_with),
+}
+
+class WarmSessionCache:
+    """
+    预登录会话缓存
+    
+    会话对象只在创建它的进程内有效；分片模式下预登录与签到按同一账号哈希落到同一子进程，
+    因此每个子进程各自维护一份缓存。会话只使用一次，取出后即移除。
+    会话绑定预登录所用凭证的摘要，签到时凭证不一致则丢弃会话、按原流程完整登录。
+    """
+    
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sessions = {}  # (平台, 账号) -> (账户对象, 过期时间, 凭证摘要)
+    
+    @staticmethod
+    def make_key(platform, username):
+        return (platform, str(username).strip().lower())
+    
+    def put(self, platform, username, account, digest):
+        now = time.monotonic()
+        with self._lock:
+            self._sessions = {k: v for k, v in self._sessions.items() if v[1] > now}
+            self._sessions[self.make_key(platform, username)] = (account, now + self.ttl, digest)
+    
+    def take(self, platform, username, digest):
+        """取出未过期且凭证一致的会话，没有时返回None"""
+        with self._lock:
+            entry = self._sessions.pop(self.make_key(platform, username), None)
+        if entry is None or entry[1] <= time.monotonic() or not hmac.compare_digest(entry[2], digest):
+            return None
+        return entry[0]
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+warm_sessions = WarmSessionCache(WARMUP_SESSION_TTL)
+
+def warmup_signin_local(module, username, password, totp=None):
+    """在当前进程中预登录并缓存会话，登录失败时抛出异常"""
+    account = WARMUP_FUNCS[module][0](username, password, totp)
+    warm_sessions.put(module, username, account, credential_digest(password, totp))
+
+def run_signin_local(module, username, password, totp=None, timings=None):
+    """
+    在当前进程中执行签到：有预登录会话时直接签到，否则完整登录后签到
+    
+    Returns:
+        tuple: (ok, 签到结果文本)，ok 为签到模块给出的成功标志
+    """
+    if timings is None:
+        timings = {}
+    account = warm_sessions.take(module, username, credential_digest(password, totp))
+    if account is not None:
+        timings["warm"] = True
+        return WARMUP_FUNCS[module][1](account, timings)
+    return SIGNIN_FUNCS[module](username, password, totp, timings)
+
+def _signin_shard_worker(conn, num_threads):
+    """
+    分片子进程主循环：把父进程分发的签到请求交给进程内的线程池执行并回传结果
+    
+    每个请求开始执行时先回传一条 ok=None 的开始通知，父进程据此开始计算签到期限；
+    子进程的日志也经同一管道以 request_id=None 的消息发回父进程
+    
+    Args:
+        conn: 与父进程之间的管道，收到None或管道关闭时退出
+        num_threads: 进程内并发执行请求的线程数
+    """
+    send_lock = threading.Lock()
+    setup_process_logging(conn, send_lock)
+    
+    def send(message):
+        try:
+            with send_lock:
+                conn.send(message)
+        except (OSError, ValueError):
+            pass  # 父进程已关闭管道
+    
+    def handle(item):
+        request_id, op, module, username, password, totp = item
+        send((request_id, None, None))  # 通知父进程请求已开始执行，签到期限从此刻算起
+        try:
+            if op == "warmup":
+                warmup_signin_local(module, username, password, totp)
+                send((request_id, True, None))
+                return
+            timings = {}
+            result = run_signin_local(module, username, password, totp, timings)
+            send((request_id, True, (result, timings)))
+        except Exception as e:
+            send((request_id, False, f"{type(e).__name__}: {e}"))
+    
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, num_threads))
+    while True:
+        try:
+            item = conn.recv()
+        except (EOFError, OSError):
+            break
+        if item is None:
+            break
+        executor.submit(handle, item)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+class ShardedSigninPool:
+    """
+    多进程分片签到池
+    
+    按账号的稳定哈希把签到请求分发到固定的子进程，父进程只负责分发和收集结果，
+    curl_cffi 的 TLS 等重计算不再与 Telegram 事件循环争抢 GIL。
+    每个子进程内由线程池并发执行请求，总并发仍受父进程执行池和平台上限约束。
+    每个子进程使用独立的管道，不共享跨进程锁；子进程意外退出时，
+    其未完成的请求以异常结束，并自动拉起新的子进程。
+    """
+    
+    def __init__(self, num_shards, num_threads=SCHEDULER_SHARD_THREADS):
+        self._ctx = multiprocessing.get_context("spawn")
+        self.num_threads = num_threads
+        self._lock = threading.Lock()
+        self._futures = {}  # request_id -> (shard, Future)
+        self._next_id = 0
+        self._running = True
+        self._shards = [self._spawn() for _ in range(max(1, num_shards))]
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+    
+    def _spawn(self):
+        """启动一个子进程，返回 (process, 父进程端管道, 发送锁)"""
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_signin_shard_worker, args=(child_conn, self.num_threads), daemon=True)
+        process.start()
+        child_conn.close()
+        return process, parent_conn, threading.Lock()
+    
+    def shard_of(self, module, username):
+        """账号对应的分片序号"""
+        return zlib.crc32(f"{module}:{str(username).strip().lower()}".encode("utf-8")) % len(self._shards)
+    
+    def submit(self, module, username, password, totp=None, op="signin"):
+        """
+        分发一次签到或预登录请求
+        
+        Args:
+            op: "signin" 签到，"warmup" 在账号对应的子进程中预登录并缓存会话
+        
+        Returns:
+            SigninFuture: 签到时为 ((ok, 签到结果文本), 各阶段耗时)，预登录时为None
+        """
+        future = SigninFuture()
+        shard = self.shard_of(module, username)
+        with self._lock:
+            if not self._running:
+                raise RuntimeError("分片签到池已关闭")
+            self._next_id += 1
+            request_id = self._next_id
+            self._futures[request_id] = (shard, future)
+            _, conn, send_lock = self._shards[shard]
+        try:
+            with send_lock:
+                conn.send((request_id, op, module, username, password, totp))
+        except (OSError, ValueError) as e:
+            with self._lock:
+                self._futures.pop(request_id, None)
+            future.set_exception(Exception(f"签到子进程不可用: {e}"))
+        return future
+    
+    def call(self, module, username, password, totp=None, timings=None, timeout=None):
+        """
+        分发一次签到请求并等待结果，子进程测得的各阶段耗时写入 timings
+        
+        期限从子进程开始执行该请求时算起；超时只放弃这一个请求（子进程继续执行，迟到的结果被丢弃），
+        同一子进程中的其他请求不受影响。请求在期限内一直未能开始执行，说明子进程的线程
+        已全部被卡住的请求占满，此时才终止整个子进程（随后自动重启）。
+        
+        Raises:
+            SigninDeadlineExceeded: 超过期限
+        """
+        result, child_timings = self._wait(self.submit(module, username, password, totp), module, username, timeout, "签到")
+        if timings is not None:
+            timings.update(child_timings)
+        return result
+    
+    def warmup(self, module, username, password, totp=None, timeout=None):
+        """在账号对应的子进程中预登录并等待完成，期限规则同 call"""
+        self._wait(self.submit(module, username, password, totp, op="warmup"), module, username, timeout, "预登录")
+    
+    def _wait(self, future, module, username, timeout, what):
+        try:
+            return wait_signin(future, timeout, what)
+        except SigninDeadlineExceeded:
+            if not future.started.is_set():
+                self.kill_shard(self.shard_of(module, username))
+            raise
+    
+    def kill_shard(self, index):
+        """强制终止一个卡住的子进程，其未完成的请求由 _check_shards 以异常结束并重启子进程"""
+        with self._lock:
+            process = self._shards[index][0]
+        logger.warning(f"⚠️ 签到子进程 {index} 的线程已全部卡住，强制终止")
+        process.kill()
+    
+    def _collect(self):
+        """收集子进程结果，并定期检查子进程存活情况"""
+        while self._running:
+            with self._lock:
+                conns = [conn for _, conn, _ in self._shards]
             try:
-                with open(log_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    if username in content:
-                        has_success = True
-                        break
-            except Exception as e:
-                print(f"❌ 读取成功日志失败: {e}")
+                ready = multiprocessing.connection.wait(conns, timeout=1)
+            except OSError:
+                ready = []
+            for conn in ready:
+                try:
+                    request_id, ok, payload = conn.recv()
+                except (EOFError, OSError):
+                    continue  # 子进程已退出，由 _check_shards 处理
+                if request_id is None:
+                    logging.getLogger(payload.name).handle(payload)  # 子进程转发的日志记录
+                    continue
+                if ok is None:
+                    # 子进程开始执行该请求
+                    with self._lock:
+                        entry = self._futures.get(request_id)
+                    if entry is not None:
+                        entry[1].mark_started()
+                    continue
+                with self._lock:
+                    entry = self._futures.pop(request_id, None)
+                if entry is None:
+                    continue
+                _, future = entry
+                if ok:
+                    future.set_result(payload)
+                else:
+                    future.set_exception(Exception(payload))
+            self._check_shards()
+    
+    def _check_shards(self):
+        """子进程意外退出时结束其未完成的请求并重新拉起"""
+        with self._lock:
+            for index, (process, conn, _) in enumerate(self._shards):
+                if process.is_alive() or not self._running:
+                    continue
+                logger.warning(f"⚠️ 签到子进程 {index} 已退出 (exitcode={process.exitcode})，正在重启")
+                conn.close()
+                for request_id, (shard, future) in list(self._futures.items()):
+                    if shard == index:
+                        del self._futures[request_id]
+                        future.set_exception(Exception("签到子进程异常退出"))
+                self._shards[index] = self._spawn()
+    
+    def shutdown(self):
+        """关闭全部子进程"""
+        with self._lock:
+            self._running = False
+            shards = list(self._shards)
+        for _, conn, send_lock in shards:
+            try:
+                with send_lock:
+                    conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for process, conn, _ in shards:
+            process.join(timeout=5)
+            conn.close()
+
+# 多进程分片签到池，SCHEDULER_WORKER_PROCESSES > 0 时在 main() 中创建
+signin_process_pool = None
+
+# call_with_deadline 的辅助线程上限：超时遗留的调用在自行结束前一直占用名额
+_deadline_slots = threading.BoundedSemaphore(max(1, SCHEDULER_MAX_WORKERS))
+
+def call_with_deadline(fn, *args, timeout=None):
+    """
+    在辅助线程中执行 fn，从开始执行起最多等待 timeout 秒
+    
+    线程无法被强制终止：超时后放弃等待、释放调用方的工作线程，遗留线程在请求自身的超时后自行结束。
+    辅助线程总数不超过 SCHEDULER_MAX_WORKERS，名额被遗留线程占满时新的调用排队，排队超过期限同样按超时处理。
+    
+    Raises:
+        SigninDeadlineExceeded: 超过期限，pending 为仍在执行的调用
+    """
+    if not timeout:
+        return fn(*args)
+    if not _deadline_slots.acquire(timeout=timeout):
+        raise SigninDeadlineExceeded(f"签到排队超时（{timeout} 秒内没有空闲的执行线程）")
+    future = SigninFuture()
+    
+    def runner():
+        future.mark_started()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            _deadline_slots.release()
+    
+    threading.Thread(target=runner, daemon=True).start()
+    return wait_signin(future, timeout)
+
+def platform_signin(module, username, password, totp=None, timings=None):
+    """
+    统一的签到入口：当日已用同一凭证成功的账号直接返回缓存结果，否则经过平台限流后调用对应模块的 main，
+    只有签到模块明确报告成功时才写入当日缓存
+    
+    Args:
+        module: 模块名称 (Acck/Akile)
+        username: 账号
+        password: 密码
+        totp: TOTP密钥
+        timings: 可选字典，写入 rate_wait 及 login/checkin/balance 各阶段耗时（秒），命中缓存时写入 cached
         
-        # 如果有成功日志，跳过这个任务
-        if has_success:
-            continue
+    Returns:
+        tuple: (ok, 签到结果文本)
+    """
+    if module not in SIGNIN_FUNCS:
+        raise Exception(f"未知模块: {module}")
+    if timings is None:
+        timings = {}
+    key = signin_result_cache.make_key(module, username)
+    digest = credential_digest(password, totp)
+    with signin_result_cache.lock_for(key):
+        cached = signin_result_cache.get(key, digest)
+        if cached is not None:
+            timings["cached"] = True
+            return True, cached
+        if signin_result_cache.in_flight(key):
+            raise SigninDeadlineExceeded("上一次超时的签到仍在执行，为避免重复签到本次未发起请求")
+        timings["rate_wait"] = platform_rate_limiter.acquire(module)
+        try:
+            if signin_process_pool is not None:
+                ok, result = signin_process_pool.call(module, username, password, totp, timings, timeout=SIGNIN_DEADLINE_SECONDS)
+            else:
+                ok, result = call_with_deadline(run_signin_local, module, username, password, totp, timings,
+                                                timeout=SIGNIN_DEADLINE_SECONDS)
+        except SigninDeadlineExceeded as e:
+            # 放弃等待不等于请求已结束：结束前账号保持占用，避免重试时重复签到
+            if e.pending is not None:
+                signin_result_cache.hold(key, e.pending, digest, unwrap=(lambda value: value[0]) if signin_process_pool is not None else None)
+            raise
+        if ok:
+            signin_result_cache.put(key, result, digest)
+        return ok, result
+
+def platform_warmup(module, username, password, totp=None):
+    """
+    预登录：提前完成登录并缓存会话，当日已签到成功的账号跳过
+    
+    Args:
+        module: 模块名称 (Acck/Akile)
+        username: 账号
+        password: 密码
+        totp: TOTP密钥
         
-        # 检查错误日志中是否包含该用户名的记录
-        for log_file in error_logs:
+    Returns:
+        bool: 是否完成了预登录
+    """
+    if module not in WARMUP_FUNCS:
+        return False
+    key = signin_result_cache.make_key(module, username)
+    with signin_result_cache.lock_for(key):
+        if signin_result_cache.get(key, credential_digest(password, totp)) is not None:
+            return False
+        platform_rate_limiter.acquire(module)
+        if signin_process_pool is not None:
+            signin_process_pool.warmup(module, username, password, totp, timeout=SIGNIN_DEADLINE_SECONDS)
+        else:
+            call_with_deadline(warmup_signin_local, module, username, password, totp, timeout=SIGNIN_DEADLINE_SECONDS)
+        return True
+
+def acck_signin(username, password, totp=None):
+    """Acck签到（经过平台限流），返回签到结果文本"""
+    return platform_signin('Acck', username, password, totp)[1]
+
+def akile_signin(username, password, totp=None):
+    """Akile签到（经过平台限流），返回签到结果文本"""
+    return platform_signin('Akile', username, password, totp)[1]
+
+class LatencyStats:
+    """
+    滚动延迟统计
+    
+    每项指标保留最近 window 个样本，按需计算分位数，
+    用于区分签到变慢是来自调度积压、平台响应还是 Telegram 通知。
+    """
+    
+    def __init__(self, window):
+        self.window = max(window, 1)
+        self._lock = threading.Lock()
+        self._samples = {}  # 指标名 -> deque[秒]
+        self._counts = collections.Counter()  # 指标名 -> 累计样本数
+        self._recent = collections.deque(maxlen=20)  # 最近的定时任务执行记录
+    
+    def record(self, metric, seconds):
+        """记录一个样本（秒）"""
+        if seconds is None:
+            return
+        with self._lock:
+            samples = self._samples.get(metric)
+            if samples is None:
+                samples = self._samples[metric] = collections.deque(maxlen=self.window)
+            samples.append(float(seconds))
+            self._counts[metric] += 1
+    
+    def summary(self, metric, percentiles=(50, 95, 99)):
+        """
+        计算指标的滚动分位数
+        
+        Returns:
+            dict: {"count": 累计样本数, "p50": 秒, ...}，无样本时返回None
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(metric, ()))
+            count = self._counts[metric]
+        if not samples:
+            return None
+        result = {"count": count, "max": samples[-1]}
+        for pct in percentiles:
+            rank = max(-(-pct * len(samples) // 100) - 1, 0)
+            result[f"p{pct}"] = samples[rank]
+        return result
+    
+    def metrics(self):
+        with self._lock:
+            return sorted(self._samples)
+    
+    def record_execution(self, entry):
+        """记录一次定时任务执行的明细（计划分钟、实际开始时间、各阶段耗时）"""
+        with self._lock:
+            self._recent.append(entry)
+    
+    def recent(self):
+        with self._lock:
+            return list(self._recent)
+
+latency_stats = LatencyStats(LATENCY_WINDOW)
+
+# 任务并发执行池
+class TaskExecutor:
+    """
+    有界并发、分优先级的执行池
+    
+    全局最多 max_workers 个工作线程；交互通道的任务总是先于定时任务执行，
+    并预留 reserved_workers 个线程只给交互通道使用。定时任务每个平台同时执行的数量不超过各自上限，
+    某个平台已满时先执行其他平台排队的任务；同一平台内按用户轮转，
+    避免一个用户的大量任务挤占其他用户。
+    """
+    
+    def __init__(self, max_workers, platform_limits=None, reserved_workers=0):
+        """
+        初始化执行池
+        
+        Args:
+            max_workers: 全局工作线程数上限
+            platform_limits: 平台 -> 并发上限，未配置的平台只受全局上限约束
+            reserved_workers: 只给交互通道使用的线程数
+        """
+        self.max_workers = max(1, max_workers)
+        self.platform_limits = dict(platform_limits or {})
+        self.reserved_workers = min(max(reserved_workers, 0), self.max_workers - 1)
+        self._cond = threading.Condition()
+        # 通道 -> platform -> OrderedDict[owner -> deque[(seq, fn, args, future)]]，owner 按轮转顺序排列
+        self._lanes = {LANE_INTERACTIVE: {}, LANE_SCHEDULED: {}}
+        self._active = collections.Counter()  # platform -> 正在执行的任务数
+        self._seq = 0
+        self._threads = []
+        self._shutdown = False
+    
+    def submit(self, platform, fn, *args, lane=LANE_SCHEDULED, owner=None):
+        """
+        提交一个任务
+        
+        Args:
+            platform: 平台名称（Acck/Akile）
+            fn: 执行函数
+            *args: 执行函数参数
+            lane: 执行通道，LANE_INTERACTIVE 或 LANE_SCHEDULED
+            owner: 任务所属用户，同一平台内按用户轮转执行
+            
+        Returns:
+            concurrent.futures.Future: 任务结果
+        """
+        future = concurrent.futures.Future()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("执行池已关闭")
+            self._seq += 1
+            owners = self._lanes[lane].setdefault(platform, collections.OrderedDict())
+            owners.setdefault(str(owner), collections.deque()).append((self._seq, fn, args, future))
+            if len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._worker, daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify()
+        return future
+    
+    @property
+    def is_shutdown(self):
+        """执行池是否已关闭"""
+        return self._shutdown
+    
+    def pending_count(self, lane=None):
+        """排队中（尚未开始执行）的任务数，lane为None时统计全部通道"""
+        with self._cond:
+            lanes = self._lanes.values() if lane is None else [self._lanes[lane]]
+            return sum(len(q) for platforms in lanes for owners in platforms.values() for q in owners.values())
+    
+    def shutdown(self):
+        """关闭执行池，丢弃尚未开始的任务"""
+        with self._cond:
+            self._shutdown = True
+            for platforms in self._lanes.values():
+                for owners in platforms.values():
+                    for queue in owners.values():
+                        for _, _, _, future in queue:
+                            future.cancel()
+                    owners.clear()
+            self._cond.notify_all()
+    
+    def _take(self):
+        """
+        取出下一个要执行的任务（调用方需持有锁）
+        
+        先看交互通道（不受平台并发上限约束），再看定时通道；
+        同一通道内取各平台轮转队首中最早提交的一项。
+        """
+        busy = sum(self._active.values())
+        for lane in (LANE_INTERACTIVE, LANE_SCHEDULED):
+            if lane == LANE_SCHEDULED and busy >= self.max_workers - self.reserved_workers:
+                break
+            best = None
+            best_seq = None
+            for platform, owners in self._lanes[lane].items():
+                if not owners:
+                    continue
+                limit = self.platform_limits.get(platform)
+                if lane == LANE_SCHEDULED and limit is not None and self._active[platform] >= limit:
+                    continue
+                seq = next(iter(owners.values()))[0][0]
+                if best is None or seq < best_seq:
+                    best, best_seq = platform, seq
+            if best is None:
+                continue
+            owners = self._lanes[lane][best]
+            owner, queue = next(iter(owners.items()))
+            _, fn, args, future = queue.popleft()
+            if queue:
+                owners.move_to_end(owner)
+            else:
+                del owners[owner]
+            self._active[best] += 1
+            return best, fn, args, future
+        return None
+    
+    def _worker(self):
+        """工作线程主循环"""
+        while True:
+            with self._cond:
+                item = self._take()
+                while item is None and not self._shutdown:
+                    self._cond.wait()
+                    item = self._take()
+                if item is None:
+                    return
+            platform, fn, args, future = item
             try:
-                with open(log_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    if username in content:
-                        # 检查是否是凭证不存在的错误
-                        if "凭证不存在" in content:
-                            # 检查用户文件是否真的不存在
-                            user_file = get_user_file(module, username)
-                            if not os.path.exists(user_file):
-                                # 确实不存在，添加到失败列表
-                                failed_tasks.append({
-                                    'task_id': task_id,
-                                    'module': module,
-                                    'username': username,
-                                    'hour': task['hour'],
-                                    'minute': task['minute'],
-                                    'error_log': log_file,
-                                    'error_type': 'credential_missing'
-                                })
-                            else:
-                                # 文件存在但日志显示不存在，可能是旧日志，跳过
-                                print(f"⚠️ 跳过旧日志：{username} 的凭证文件已存在")
-                        else:
-                            # 其他类型的错误，正常添加
-                            failed_tasks.append({
-                                'task_id': task_id,
-                                'module': module,
-                                'username': username,
-                                'hour': task['hour'],
-                                'minute': task['minute'],
-                                'error_log': log_file,
-                                'error_type': 'other'
-                            })
-                        break  # 找到一个错误日志就够了
-            except Exception as e:
-                print(f"❌ 读取错误日志失败: {e}")
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args))
+                    except Exception as e:
+                        future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._active[platform] -= 1
+                    self._cond.notify_all()
+
+# 定时任务执行日志（预写日志）
+def make_run_id(task_id, scheduled_for):
+    """一次计划执行的唯一标识：任务ID + 计划触发时间"""
+    return f"{task_id}@{scheduled_for.isoformat()}"
+
+class RunJournal:
+    """
+    定时任务执行的预写日志（JSON Lines）
     
-    return failed_tasks
-
-def execute_task_manually(task_id, user_id):
+    每次计划执行依次追加 queued / started / finished 三条记录并立即落盘。
+    进程重启后回放日志，即可找出已入队但未完成的执行并恢复。
     """
-    手动执行指定任务
     
-    Args:
-        task_id: 任务ID
-        user_id: 用户ID
+    # 累计多少条完成记录后压缩一次日志
+    COMPACT_EVERY = 500
+    
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._inflight = {}  # run_id -> queued 记录
+        self._finished_since_compact = 0
+    
+    def _append(self, record):
+        """追加一条记录并fsync（调用方需持有锁）"""
+        with open(self.filename, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def queued(self, run_id, task_id, scheduled_for, attempt=0):
+        record = {"event": "queued", "run_id": run_id, "task_id": task_id,
+                  "scheduled_for": scheduled_for.isoformat(), "time": get_shanghai_now().isoformat()}
+        if attempt:
+            record["attempt"] = attempt
+        with self._lock:
+            self._inflight[run_id] = record
+            self._append(record)
+    
+    def started(self, run_id):
+        with self._lock:
+            self._append({"event": "started", "run_id": run_id, "time": get_shanghai_now().isoformat()})
+    
+    def finished(self, run_id, status):
+        with self._lock:
+            self._inflight.pop(run_id, None)
+            self._append({"event": "finished", "run_id": run_id, "status": status,
+                          "time": get_shanghai_now().isoformat()})
+            self._finished_since_compact += 1
+            if self._finished_since_compact >= self.COMPACT_EVERY:
+                self._compact()
+    
+    def _compact(self):
+        """只保留未完成执行的 queued 记录，原子替换日志文件（调用方需持有锁）"""
+        tmp_file = self.filename + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            for record in self._inflight.values():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.filename)
+        self._finished_since_compact = 0
+    
+    def replay(self):
+        """
+        回放日志并压缩
         
-    Returns:
-        tuple: (success, message) 执行结果
+        Returns:
+            tuple: (pending, finished)
+                pending: 未完成执行的 queued 记录列表（按入队顺序）
+                finished: 日志中已完成的 run_id 集合
+        """
+        pending = {}
+        finished = set()
+        with self._lock:
+            if os.path.exists(self.filename):
+                with open(self.filename, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue  # 崩溃时写了一半的最后一行
+                        run_id = record.get("run_id")
+                        if record.get("event") == "queued":
+                            pending[run_id] = record
+                        elif record.get("event") == "finished":
+                            pending.pop(run_id, None)
+                            finished.add(run_id)
+            self._inflight = dict(pending)
+            self._compact()
+        return list(pending.values()), finished
+
+# 调度器单实例租约
+class SchedulerLease:
     """
-    try:
-        # 获取任务信息
-        tasks = load_scheduled_tasks()
-        if task_id not in tasks:
-            return False, "❌ 任务不存在"
-        
-        task = tasks[task_id]
-        
-        # 验证任务所有者
-        if str(task.get('user_id')) != str(user_id):
-            return False, "❌ 您无权执行此任务"
-        
-        # 检查任务是否启用
-        if not task.get('enabled', True):
-            return False, "❌ 任务已禁用"
+    调度器单实例租约
+    
+    基于锁文件的独占 flock：持有者进程退出（包括崩溃）时由操作系统自动释放，
+    备用进程每隔 LEASE_RETRY_SECONDS 尝试获取，因此几秒内即可接管。
+    持有者定期把 pid 和心跳时间写入锁文件，便于排查当前由哪个进程运行调度器。
+    """
+    
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = None
+        self._stop_heartbeat = threading.Event()
+        self._heartbeat_thread = None
+    
+    @property
+    def held(self):
+        return self._file is not None
+    
+    def _try_lock(self):
+        """尝试非阻塞获取锁，成功返回True"""
+        if fcntl is None:
+            return True
+        f = open(self.filename, "a+", encoding="utf-8")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+    
+    def acquire(self, keep_waiting):
+        """
+        阻塞直到获得租约
         
-        # 执行任务
-        if task_scheduler:
-            task_scheduler._execute_task(task)
-            return True, "✅ 任务已提交执行，请稍后查看结果"
-        else:
-            return False, "❌ 任务调度器未启动"
+        Args:
+            keep_waiting: 无参函数，返回False时放弃等待
             
-    except Exception as e:
-        return False, f"❌ 执行任务失败: {e}"
+        Returns:
+            bool: 是否获得租约
+        """
+        announced = False
+        while keep_waiting():
+            if self._try_lock():
+                self._write_heartbeat()
+                self._stop_heartbeat.clear()
+                self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+                self._heartbeat_thread.start()
+                return True
+            if not announced:
+                logger.info(f"⏸️ 另一个进程正在运行定时任务调度器，本进程进入备用状态（锁文件: {self.filename}）")
+                announced = True
+            time.sleep(LEASE_RETRY_SECONDS)
+        return False
+    
+    def _write_heartbeat(self):
+        if self._file is None:
+            return
+        try:
+            self._file.seek(0)
+            self._file.truncate()
+            self._file.write(json.dumps({"pid": os.getpid(), "heartbeat": get_shanghai_now().isoformat()}))
+            self._file.flush()
+        except OSError as e:
+            logger.warning(f"⚠️ 写入调度器心跳失败: {e}")
+    
+    def _heartbeat_loop(self):
+        while not self._stop_heartbeat.wait(LEASE_HEARTBEAT_SECONDS):
+            self._write_heartbeat()
+    
+    def release(self):
+        """释放租约"""
+        self._stop_heartbeat.set()
+        if self._file is not None:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            except OSError:
+                pass
+            self._file.close()
+            self._file = None
 
 # 定时任务执行器（新逻辑）
 class TaskScheduler:
     """
     定时任务调度器
     
-    负责管理和执行用户的定时签到任务，支持多线程安全操作
+    负责管理和执行用户的定时签到任务，支持多线程安全操作。
+    内部维护一个按下一次触发时间排序的小顶堆 (next_fire_time, task_id)，
+    调度线程精确休眠到最近一个到期任务，增删任务时原地更新堆。
     """
     
-    def __init__(self, application, loop):
+    # 堆中过期条目超过有效条目的倍数时压缩一次
+    HEAP_COMPACT_RATIO = 2
+    # 影响触发时间的任务字段，存储中的任务被外部修改时据此判断是否需要重新计算触发时间
+    SCHEDULE_FIELDS = ("hour", "minute", "cron", "offset", "enabled")
+    
+    def __init__(self, application, loop, clock=None):
         """
         初始化调度器
         
         Args:
             application: Telegram应用实例
             loop: 主事件循环
+            clock: 返回当前上海时间的无参函数，默认 get_shanghai_now（压测时替换为虚拟时钟）
         """
         self.application = application
         self.loop = loop
+        self.clock = clock or get_shanghai_now
         self.running = False
         self.thread = None
+        self._cond = threading.Condition()
+        self._heap = []  # (next_fire_time, task_id)
+        self._tasks = {}  # task_id -> 任务信息
+        self._next_fire = {}  # task_id -> 当前有效的触发时间，用于识别堆中的过期条目
+        self._watch_store = False  # 任务从存储加载时为True，调度循环据此同步外部修改
+        self._tasks_version = None  # 上次同步时存储的版本标记
+        self.executor = TaskExecutor(SCHEDULER_MAX_WORKERS, PLATFORM_CONCURRENCY, INTERACTIVE_RESERVED_WORKERS)
+        self.journal = RunJournal(SCHEDULER_JOURNAL_FILE)
+        self.lease = SchedulerLease(SCHEDULER_LOCK_FILE)
+        self._retry_heap = []  # (retry_at, seq, task_id, scheduled_for, attempt)
+        self._retry_attempts = collections.Counter()  # (task_id, 日期) -> 当天已安排的重试次数
+        self._retry_seq = 0
+        self._retry_day = None
+        self._warmup_heap = []  # (warmup_time, fire_time, task_id)，提前登录的时间点
+        self._loop_generation = 0  # 看门狗重启调度循环时递增，旧循环据此退出
+        self._heartbeat = None  # 调度循环最近一次心跳（time.monotonic），循环启动前为None
+        self._watchdog_stop = threading.Event()
+        self._watchdog_thread = None
+        self.watchdog_restarts = 0
     
     def start(self):
         """启动定时任务调度器"""
         if self.running:
-            print("⚠️ 定时任务调度器已在运行中")
+            logger.warning("⚠️ 定时任务调度器已在运行中")
             return
         
         try:
+            if self.executor.is_shutdown:
+                self.executor = TaskExecutor(SCHEDULER_MAX_WORKERS, PLATFORM_CONCURRENCY, INTERACTIVE_RESERVED_WORKERS)
             self.running = True
-            self.thread = threading.Thread(target=self._scheduler_loop, daemon=True)
+            self._heartbeat = None
+            self.thread = threading.Thread(target=self._run, daemon=True)
             self.thread.start()
-            print("✅ 定时任务调度器已启动")
+            self._watchdog_stop.clear()
+            self._watchdog_thread = threading.Thread(target=self._watchdog, daemon=True)
+            self._watchdog_thread.start()
+            logger.info("✅ 定时任务调度器已启动")
         except Exception as e:
             self.running = False
-            print(f"❌ 启动定时任务调度器失败: {e}")
+            logger.error(f"❌ 启动定时任务调度器失败: {e}")
             raise
     
+    def _run(self):
+        """
+        调度线程入口
+        
+        先获取单实例租约（多个bot进程同时运行时只有一个执行定时任务），
+        获得后回放执行日志、加载任务并进入调度主循环
+        """
+        if not self.lease.acquire(lambda: self.running):
+            return
+        logger.info("🔒 已获得调度器租约，开始执行定时任务")
+        pending, finished = self.journal.replay()
+        self.load_tasks(handled_runs=finished | {r["run_id"] for r in pending})
+        self._resume_pending(pending)
+        self._scheduler_loop(self._loop_generation)
+    
+    def _watchdog(self):
+        """
+        看门狗线程：调度循环线程退出或心跳长时间未更新时重启调度循环
+        
+        租约由看门狗之外的 stop() 释放，重启循环不会让出调度权；
+        卡住的旧循环醒来后发现代数已变化会自行退出，不会与新循环重复派发。
+        """
+        while not self._watchdog_stop.wait(SCHEDULER_WATCHDOG_INTERVAL):
+            if not self.running or self._heartbeat is None:
+                continue
+            stalled = time.monotonic() - self._heartbeat
+            if self.thread.is_alive() and stalled < SCHEDULER_STALL_SECONDS:
+                continue
+            reason = "已退出" if not self.thread.is_alive() else f"已 {stalled:.0f} 秒无心跳"
+            with self._cond:
+                self._loop_generation += 1
+                generation = self._loop_generation
+            self.watchdog_restarts += 1
+            logger.warning(f"⚠️ 调度循环{reason}，看门狗正在重启（第 {self.watchdog_restarts} 次）")
+            self._heartbeat = time.monotonic()
+            self.thread = threading.Thread(target=self._scheduler_loop, args=(generation,), daemon=True)
+            self.thread.start()
+    
     def stop(self):
         """停止定时任务调度器"""
         if not self.running:
             return
         
         try:
-            self.running = False
+            with self._cond:
+                self.running = False
+                self._cond.notify_all()
+            self._watchdog_stop.set()
+            self.executor.shutdown()
             if self.thread and self.thread.is_alive():
                 self.thread.join(timeout=5)
                 if self.thread.is_alive():
-                    print("⚠️ 定时任务调度器线程未能在5秒内正常停止")
-            print("⏹️ 定时任务调度器已停止")
+                    logger.warning("⚠️ 定时任务调度器线程未能在5秒内正常停止")
+            self.lease.release()
+            logger.info("⏹️ 定时任务调度器已停止")
+        except Exception as e:
+            logger.error(f"❌ 停止定时任务调度器时出错: {e}")
+    
+    def load_tasks(self, tasks=None, handled_runs=()):
+        """
+        加载全部任务并重建触发队列
+        
+        Args:
+            tasks: 任务字典，为None时从存储中读取
+            handled_runs: 执行日志中已完成或待恢复的 run_id，不再按错过触发重复补执行
+        """
+        self._watch_store = tasks is None
+        if tasks is None:
+            self._tasks_version = state_store.kv_version('scheduled_tasks')
+            tasks = load_scheduled_tasks()
+        now = self.clock()
+        overdue = 0
+        with self._cond:
+            self._tasks = {}
+            self._next_fire = {}
+            self._heap = []
+            self._warmup_heap = []
+            for task_id, task in tasks.items():
+                self._tasks[task_id] = task
+                if not task.get("enabled", True):
+                    continue
+                fire_time = self._get_overdue_fire_time(task, now)
+                if fire_time is not None and make_run_id(task_id, fire_time) in handled_runs:
+                    fire_time = None
+                if fire_time is not None:
+                    overdue += 1
+                else:
+                    fire_time = get_task_next_run(task, now)
+                self._next_fire[task_id] = fire_time
+                self._heap.append((fire_time, task_id))
+                self._push_warmup(task_id, fire_time)
+            heapq.heapify(self._heap)
+            self._cond.notify_all()
+        if overdue:
+            logger.warning(f"⚠️ 发现 {overdue} 个错过触发时间的任务，将按补偿策略处理")
+    
+    def _get_overdue_fire_time(self, task, now):
+        """
+        根据持久化的 last_fire / last_run 判断任务最近一次触发是否被错过
+        
+        Args:
+            task: 任务信息字典
+            now: 当前时间
+            
+        Returns:
+            datetime: 被错过的触发时间；未错过时返回None
+        """
+        prev_fire = get_task_prev_run(task, now)
+        handled = [t.replace(tzinfo=None) for t in map(parse_task_time, (task.get("last_fire"), task.get("last_run"), task.get("created_at"))) if t]
+        handled_at = max(handled, default=None)
+        if handled_at is None or handled_at >= prev_fire:
+            return None
+        return prev_fire
+    
+    def schedule_task(self, task):
+        """
+        新增或更新一个任务，原地调整触发队列
+        
+        Args:
+            task: 任务信息字典
+        """
+        task_id = task["id"]
+        with self._cond:
+            self._tasks[task_id] = task
+            if not task.get("enabled", True):
+                self._next_fire.pop(task_id, None)
+                return
+            fire_time = get_task_next_run(task, self.clock())
+            if self._next_fire.get(task_id) == fire_time:
+                return
+            self._next_fire[task_id] = fire_time
+            heapq.heappush(self._heap, (fire_time, task_id))
+            self._push_warmup(task_id, fire_time)
+            self._cond.notify_all()
+    
+    def unschedule_task(self, task_id):
+        """
+        移除一个任务
+        
+        堆中残留的条目在弹出时会因与 _next_fire 不一致而被丢弃（惰性删除）
+        
+        Args:
+            task_id: 任务ID
+        """
+        with self._cond:
+            self._tasks.pop(task_id, None)
+            self._next_fire.pop(task_id, None)
+            if len(self._heap) > self.HEAP_COMPACT_RATIO * max(len(self._next_fire), 1):
+                self._heap = [(t, tid) for t, tid in self._heap if self._next_fire.get(tid) == t]
+                heapq.heapify(self._heap)
+                self._warmup_heap = [e for e in self._warmup_heap if self._next_fire.get(e[2]) == e[1]]
+                heapq.heapify(self._warmup_heap)
+    
+    def _refresh_tasks(self):
+        """
+        存储中的任务被外部修改（其他进程、手工编辑JSON文件或数据库）后同步到触发队列
+        
+        只在版本标记变化时重新读取；新增或触发时间相关字段变化的任务重新调度，
+        已删除的任务移出队列，其余任务只更新任务信息，不重复补执行
+        """
+        if not self._watch_store:
+            return
+        version = state_store.kv_version('scheduled_tasks')
+        if version == self._tasks_version:
+            return
+        self._tasks_version = version
+        tasks = load_scheduled_tasks()
+        with self._cond:
+            for task_id in [tid for tid in self._tasks if tid not in tasks]:
+                self.unschedule_task(task_id)
+            for task_id, task in tasks.items():
+                old = self._tasks.get(task_id)
+                if old is None or any(old.get(k) != task.get(k) for k in self.SCHEDULE_FIELDS):
+                    self.schedule_task(dict(task, id=task_id))
+                else:
+                    self._tasks[task_id] = task
+    
+    def _resume_pending(self, pending):
+        """
+        恢复上次进程退出时已入队但未完成的执行，每个 run_id 只恢复一次
+        
+        Args:
+            pending: 执行日志回放得到的 queued 记录列表
+        """
+        now = self.clock()
+        resumed = 0
+        for record in pending:
+            run_id = record["run_id"]
+            with self._cond:
+                task = self._tasks.get(record.get("task_id"))
+            fire_time = parse_task_time(record.get("scheduled_for"))
+            if task is None or fire_time is None or not task.get("enabled", True):
+                self.journal.finished(run_id, "dropped")
+                continue
+            if not should_run_misfired(task, fire_time, now):
+                self.journal.finished(run_id, "skipped")
+                continue
+            self.executor.submit(task.get("module"), self._run_journaled, task, fire_time, run_id, record.get("attempt", 0),
+                                 owner=task.get("user_id"))
+            resumed += 1
+        if resumed:
+            logger.info(f"♻️ 已从执行日志恢复 {resumed} 个未完成的定时任务")
+    
+    def _dispatch(self, task, fire_time):
+        """记录入队后把一次计划执行交给执行池"""
+        run_id = make_run_id(task["id"], fire_time)
+        self.journal.queued(run_id, task["id"], fire_time)
+        self.executor.submit(task.get("module"), self._run_journaled, task, fire_time, run_id, owner=task.get("user_id"))
+    
+    def _dispatch_retry(self, task, fire_time, attempt):
+        """记录入队后把一次自动重试交给执行池"""
+        run_id = f"{make_run_id(task['id'], fire_time)}#retry{attempt}"
+        self.journal.queued(run_id, task["id"], fire_time, attempt)
+        self.executor.submit(task.get("module"), self._run_journaled, task, fire_time, run_id, attempt, owner=task.get("user_id"))
+    
+    def _run_journaled(self, task, fire_time, run_id, attempt=0):
+        """执行一次计划任务，在执行日志中记录开始与完成，临时性失败时安排重试"""
+        self.journal.started(run_id)
+        outcome = None
+        try:
+            outcome = self._execute_task(task, fire_time, attempt)
+        finally:
+            # 先记下该次触发已处理（不论结果），再写完成记录，避免日志压缩后重启时重复执行
+            task['last_fire'] = fire_time.isoformat()
+            try:
+                update_task_last_fire(task["id"], task['last_fire'])
+            except Exception as e:
+                logger.error(f"❌ 保存任务 {task['id']} 的触发时间失败: {e}")
+            self.journal.finished(run_id, outcome[0] if outcome else "done")
+        if outcome and outcome[0] in ("error", "timeout") and is_transient_failure(outcome[1]):
+            self._schedule_retry(task, fire_time)
+    
+    def _schedule_retry(self, task, fire_time):
+        """
+        为临时性失败的任务安排指数退避重试
+        
+        受每日重试次数上限和用户每日使用次数限制约束
+        
+        Args:
+            task: 任务信息字典
+            fire_time: 原计划触发时间
+            
+        Returns:
+            bool: 是否已安排重试
+        """
+        task_id = task["id"]
+        try:
+            can_use, _ = check_daily_limit(int(task["user_id"]))
+        except (ValueError, TypeError, KeyError):
+            return False
+        if not can_use:
+            logger.info(f"⏭️ 任务 {task_id} 的用户已达每日使用限制，不再自动重试")
+            return False
+        now = self.clock()
+        key = (task_id, now.date().isoformat())
+        with self._cond:
+            if self._retry_day != key[1]:
+                # 跨天后清空旧的重试计数
+                self._retry_day = key[1]
+                self._retry_attempts.clear()
+            if key not in self._retry_attempts:
+                # 重启后内存计数为空，从签到台账中当天已执行的重试序号延续
+                self._retry_attempts[key] = signin_ledger.retry_attempts(task_id, key[1])
+            if self._retry_attempts[key] >= RETRY_MAX_ATTEMPTS:
+                logger.info(f"⏭️ 任务 {task_id} 今日自动重试已达上限 ({RETRY_MAX_ATTEMPTS} 次)")
+                return False
+            self._retry_attempts[key] += 1
+            attempt = self._retry_attempts[key]
+            delay = min(RETRY_BASE_DELAY * 2 ** (attempt - 1), RETRY_MAX_DELAY)
+            retry_at = now + timedelta(seconds=delay)
+            self._retry_seq += 1
+            heapq.heappush(self._retry_heap, (retry_at, self._retry_seq, task_id, fire_time, attempt))
+            self._cond.notify_all()
+        logger.warning(f"🔁 任务 {task_id} 临时性失败，{delay} 秒后第 {attempt} 次自动重试",
+                       extra={"platform": task.get('module'), "task_id": task_id, "phase": "retry"})
+        return True
+    
+    def _pop_due_retries(self, now):
+        """
+        弹出所有已到期的重试（调用方需持有锁）
+        
+        Returns:
+            list: (任务信息, 原计划触发时间, 重试序号) 列表，已删除或禁用的任务被丢弃
+        """
+        due = []
+        while self._retry_heap and self._retry_heap[0][0] <= now:
+            _, _, task_id, fire_time, attempt = heapq.heappop(self._retry_heap)
+            task = self._tasks.get(task_id)
+            if task is not None and task.get("enabled", True):
+                due.append((task, fire_time, attempt))
+        return due
+    
+    def get_next_run(self, task_id):
+        """
+        获取任务预先计算好的下一次触发时间
+        
+        Args:
+            task_id: 任务ID
+            
+        Returns:
+            datetime: 下一次触发时间，任务未调度时返回None
+        """
+        with self._cond:
+            return self._next_fire.get(task_id)
+    
+    def _pop_due_tasks(self, now):
+        """
+        弹出所有已到期的任务并为其安排下一次触发（调用方需持有锁）
+        
+        Args:
+            now: 当前时间
+            
+        Returns:
+            list: 到期且应执行的 (任务信息, 计划触发时间) 列表
+        """
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_time, task_id = heapq.heappop(self._heap)
+            if self._next_fire.get(task_id) != fire_time:
+                continue  # 已删除或已重新调度的过期条目
+            task = self._tasks[task_id]
+            # 从当前时间推算下一次触发，期间错过的多次触发合并为这一次
+            next_fire = get_task_next_run(task, max(fire_time, now))
+            self._next_fire[task_id] = next_fire
+            heapq.heappush(self._heap, (next_fire, task_id))
+            self._push_warmup(task_id, next_fire)
+            if should_run_misfired(task, fire_time, now):
+                due.append((task, fire_time))
+            else:
+                logger.info(f"⏭️ 任务 {task_id} 错过触发时间 {fire_time.strftime('%Y-%m-%d %H:%M')}，按策略 {get_task_misfire_policy(task)} 跳过")
+        return due
+    
+    def _push_warmup(self, task_id, fire_time):
+        """启用预登录时为一次触发安排提前登录（调用方需持有锁）"""
+        if WARMUP_LEAD_SECONDS > 0:
+            warmup_time = fire_time - timedelta(seconds=WARMUP_LEAD_SECONDS)
+            heapq.heappush(self._warmup_heap, (warmup_time, fire_time, task_id))
+    
+    def _pop_due_warmups(self, now):
+        """
+        弹出所有已到预登录时间的任务（调用方需持有锁）
+        
+        Returns:
+            list: (任务信息, 计划触发时间) 列表，触发时间已变更或已过的条目被丢弃
+        """
+        due = []
+        while self._warmup_heap and self._warmup_heap[0][0] <= now:
+            _, fire_time, task_id = heapq.heappop(self._warmup_heap)
+            if self._next_fire.get(task_id) != fire_time or fire_time <= now:
+                continue
+            due.append((self._tasks[task_id], fire_time))
+        return due
+    
+    def _warmup_task(self, task, fire_time):
+        """读取凭证并预登录，失败时到点按原流程完整登录；被封禁或已达每日使用限制的用户不预登录"""
+        module = task.get('module')
+        username = task.get('username')
+        try:
+            user_id = int(task['user_id'])
+            if is_banned(user_id) or not check_daily_limit(user_id)[0]:
+                return
+            with open(get_user_file(module, username), 'r', encoding='utf-8') as f:
+                user_info = json.load(f)
+            if platform_warmup(module, user_info['username'], user_info['password'], user_info.get('totp')):
+                logger.info(f"🔥 已为 {module} 账号 {username} 预登录，将于 {fire_time.strftime('%H:%M:%S')} 签到",
+                            extra={"platform": module, "task_id": task.get('id'), "phase": "warmup"})
         except Exception as e:
-            print(f"❌ 停止定时任务调度器时出错: {e}")
+            logger.warning(f"⚠️ 预登录失败 {task.get('id')}: {e}，到点将完整登录",
+                           extra={"platform": module, "task_id": task.get('id'), "phase": "warmup"})
+    
+    def _seconds_until_next(self, now):
+        """距离最近一个到期任务、重试或预登录的秒数，都没有时返回None（无限等待直到被唤醒）"""
+        candidates = [heap[0][0] for heap in (self._heap, self._retry_heap, self._warmup_heap) if heap]
+        if not candidates:
+            return None
+        return max((min(candidates) - now).total_seconds(), 0)
     
-    def _scheduler_loop(self):
+    def _scheduler_loop(self, generation):
         """
         调度器主循环
         
-        每分钟检查一次是否有需要执行的任务
+        休眠到最近一个任务的触发时间，醒来后把已到期的任务交给执行池并发执行；
+        每轮更新心跳并同步存储中任务的外部修改，休眠不超过看门狗检查间隔
+        
+        Args:
+            generation: 循环代数，看门狗重启后旧循环发现代数不一致即退出
         """
-        while self.running:
+        while self.running and generation == self._loop_generation:
+            self._heartbeat = time.monotonic()
             try:
-                now = get_shanghai_now()
-                tasks = load_scheduled_tasks()
-                
-                for task_id, task in tasks.items():
-                    if not self.running:
+                self._refresh_tasks()
+                with self._cond:
+                    if not self.running or generation != self._loop_generation:
                         break
-                    
-                    # 检查任务是否启用
-                    if not task.get("enabled", True):
+                    now = self.clock()
+                    due = self._pop_due_tasks(now)
+                    retries = self._pop_due_retries(now)
+                    warmups = self._pop_due_warmups(now)
+                    if not due and not retries and not warmups:
+                        wait = self._seconds_until_next(now)
+                        self._cond.wait(SCHEDULER_WATCHDOG_INTERVAL if wait is None else min(wait, SCHEDULER_WATCHDOG_INTERVAL))
                         continue
-                    
-                    # 检查是否到了执行时间
-                    if now.hour == task["hour"] and now.minute == task["minute"]:
-                        self._execute_task(task)
                 
-                # 等待1分钟后再次检查
-                time.sleep(60)
+                for task, fire_time in due:
+                    if not self.running:
+                        break
+                    self._dispatch(task, fire_time)
+                for task, fire_time, attempt in retries:
+                    if not self.running:
+                        break
+                    self._dispatch_retry(task, fire_time, attempt)
+                for task, fire_time in warmups:
+                    if not self.running:
+                        break
+                    self.executor.submit(task.get("module"), self._warmup_task, task, fire_time, owner=task.get("user_id"))
                 
             except Exception as e:
-                print(f"❌ 定时任务调度器循环错误: {e}")
-                # 发生错误时等待1分钟后继续
-                time.sleep(60)
-    def _execute_task(self, task):
+                logger.error(f"❌ 定时任务调度器循环错误: {e}")
+                # 发生错误时稍作等待后继续
+                time.sleep(1)
+    def _execute_task(self, task, scheduled_for=None, attempt=0):
         """
         执行单个定时任务
         
         Args:
             task: 任务信息字典，包含模块、用户名、时间等信息
+            scheduled_for: 本次执行对应的计划触发时间，手动执行时为None
+            attempt: 自动重试序号，首次执行为0
+            
+        Returns:
+            tuple: 发起了签到时返回 (status, 结果或错误信息)，未发起签到时返回None
         """
+        started_at = self.clock()
+        if scheduled_for is not None and not attempt:
+            latency_stats.record("dispatch_lag", (started_at - scheduled_for).total_seconds())
         try:
-            print(f"🔄 执行定时任务: {task['module']} {task['hour']:02d}:{task['minute']:02d} (用户: {task['user_id']}, 账号: {task['username']})")
-            
             # 验证任务数据完整性
-            required_fields = ['user_id', 'module', 'username', 'hour', 'minute']
+            required_fields = ['user_id', 'module', 'username'] if task.get('cron') else ['user_id', 'module', 'username', 'hour', 'minute']
             for field in required_fields:
                 if field not in task:
-                    print(f"❌ 任务数据不完整，缺少字段: {field}")
+                    logger.error(f"❌ 任务数据不完整，缺少字段: {field}")
                     return
             
+            log_fields = {"platform": task['module'], "task_id": task.get('id'), "user_id": task['user_id']}
+            logger.info(f"🔄 执行定时任务: {task['module']} {format_task_schedule(task)} (用户: {task['user_id']}, 账号: {task['username']})",
+                        extra=dict(log_fields, phase="start"))
+            
             # 解析用户ID
             try:
                 user_id = int(task['user_id'])
             except (ValueError, TypeError):
-                print(f"❌ 无效的用户ID: {task['user_id']}")
+                logger.error(f"❌ 无效的用户ID: {task['user_id']}")
                 return
             
             # 检查用户是否被封禁
             if is_banned(user_id):
-                print(f"❌ 用户 {user_id} 已被封禁，跳过任务执行")
+                logger.error(f"❌ 用户 {user_id} 已被封禁，跳过任务执行")
                 return
             
             # 检查用户每日使用限制
             can_use, usage = check_daily_limit(user_id)
             if not can_use:
-                print(f"❌ 用户 {user_id} 已达到每日使用限制 ({usage}/{get_daily_limit(user_id)})")
+                logger.error(f"❌ 用户 {user_id} 已达到每日使用限制 ({usage}/{get_daily_limit(user_id)})")
                 return
             
             module = task['module']
@@ -632,8 +3263,8 @@ class TaskScheduler:
             user_file = get_user_file(module, username)
             if not os.path.exists(user_file):
                 err_msg = f"❌ 用户 {user_id} 的 {module} 账号 {username} 凭证不存在"
-                print(err_msg)
-                save_task_log(module, username, 'error', '凭证不存在', error=err_msg)
+                logger.error(err_msg)
+                save_task_log(module, username, 'error', '凭证不存在', error=err_msg, task_id=task.get('id'), user_id=user_id, attempt=attempt)
                 
                 # 安全地发送错误消息到用户
                 self._send_task_result(user_id, err_msg)
@@ -645,57 +3276,67 @@ class TaskScheduler:
                     user_info = json.load(f)
             except (json.JSONDecodeError, IOError) as e:
                 err_msg = f"❌ 读取用户凭证失败: {e}"
-                print(err_msg)
-                save_task_log(module, username, 'error', '读取凭证失败', error=str(e))
+                logger.error(err_msg)
+                save_task_log(module, username, 'error', '读取凭证失败', error=str(e), task_id=task.get('id'), user_id=user_id, attempt=attempt)
                 self._send_task_result(user_id, err_msg)
                 return
             
             # 执行签到任务
             try:
-                if module == 'Acck':
-                    result = acck_signin(user_info['username'], user_info['password'], user_info.get('totp'))
-                elif module == 'Akile':
-                    result = akile_signin(user_info['username'], user_info['password'], user_info.get('totp'))
-                else:
-                    raise Exception(f"未知模块: {module}")
+                timings = {}
+                signin_start = time.monotonic()
+                ok, result = platform_signin(module, user_info['username'], user_info['password'], user_info.get('totp'), timings)
+                timings["total"] = time.monotonic() - signin_start
+                if not timings.get("cached"):
+                    for phase in ("rate_wait", "login", "checkin", "balance", "total"):
+                        latency_stats.record(f"{module}.{phase}", timings.get(phase))
                 
                 # 更新使用统计
                 increment_daily_usage(user_id)
                 record_usage(user_id)
                 
-                # 更新任务最后执行时间
+                # 更新任务最后执行时间（重启后据此判断是否错过触发）
                 task['last_run'] = get_shanghai_now().isoformat()
-                save_scheduled_tasks(load_scheduled_tasks())
+                update_task_last_run(task.get('id'), task['last_run'])
                 
                 # 判断执行结果
-                status = "success" if ("成功" in result or "已签到" in result) else "error"
-                message = f"🕐 定时任务执行结果\n\n平台: {module}\n账号: {username}\n时间: {task['hour']:02d}:{task['minute']:02d}\n状态: {'✅ 成功' if status=='success' else '❌ 失败'}\n结果: {result}"
+                status = "success" if ok else "error"
+                title = f"🕐 定时任务执行结果（第{attempt}次自动重试）" if attempt else "🕐 定时任务执行结果"
+                message = f"{title}\n\n平台: {module}\n账号: {username}\n时间: {format_task_schedule(task)}\n状态: {'✅ 成功' if status=='success' else '❌ 失败'}\n结果: {result}"
                 
-                # 保存任务日志
-                save_task_log(module, username, status, result)
-                
-                # 保存操作日志
+                # 发送结果消息
                 task_id = task.get('id', 'unknown')
-                save_op_log(module, username, '执行任务', task_id, status, result)
+                timings["notify"] = self._send_task_result(user_id, message)
                 
-                # 发送结果消息
-                self._send_task_result(user_id, message)
+                # 保存任务日志（含各阶段耗时）
+                save_task_log(module, username, status, result, task_id=task_id, user_id=user_id, timings=timings, attempt=attempt)
+                latency_stats.record_execution({
+                    "task_id": task_id,
+                    "module": module,
+                    "scheduled": scheduled_for.strftime('%H:%M') if scheduled_for else None,
+                    "started": started_at.strftime('%H:%M:%S'),
+                    "status": status,
+                    "timings": timings,
+                })
                 
-                print(f"✅ 定时任务执行完成: {task['module']} {task['hour']:02d}:{task['minute']:02d} 账号: {username}")
+                logger.info(f"✅ 定时任务执行完成: {task['module']} {format_task_schedule(task)} 账号: {username}",
+                            extra=dict(log_fields, phase=status, duration=timings.get("total")))
+                return status, result
                 
             except Exception as e:
                 err_msg = f"❌ 执行定时任务错误 {task.get('id', 'unknown')}: {e}"
-                save_task_log(module, username, 'error', '执行任务异常', error=str(e))
-                
-                # 保存操作日志
-                task_id = task.get('id', 'unknown')
-                save_op_log(module, username, '执行任务', task_id, 'error', '执行任务异常', error=str(e))
+                # 超过端到端期限的执行单独记为 timeout，便于和普通失败区分
+                status = 'timeout' if isinstance(e, SigninDeadlineExceeded) else 'error'
+                if status == 'timeout':
+                    latency_stats.record(f"{module}.timeout", time.monotonic() - signin_start)
+                save_task_log(module, username, status, '执行任务异常', error=str(e), task_id=task.get('id', 'unknown'), user_id=user_id, attempt=attempt)
                 
                 self._send_task_result(user_id, err_msg)
-                print(err_msg)
+                logger.error(err_msg, extra=dict(log_fields, phase=status, duration=time.monotonic() - signin_start))
+                return status, str(e)
                 
         except Exception as e:
-            print(f"❌ 执行定时任务时发生未知错误: {e}")
+            logger.error(f"❌ 执行定时任务时发生未知错误: {e}")
     
     def _send_task_result(self, user_id, message):
         """
@@ -704,8 +3345,12 @@ class TaskScheduler:
         Args:
             user_id: 用户ID
             message: 消息内容
+            
+        Returns:
+            float: 通知送达耗时（秒）
         """
         success = False
+        start = time.monotonic()
         
         # 方法1：异步方式发送消息
         if self.loop and self.loop.is_running():
@@ -718,16 +3363,18 @@ class TaskScheduler:
                 result = future.result(timeout=TELEGRAM_TIMEOUT)
                 if result:
                     success = True
-                    return
             except Exception as e:
-                print(f"异步发送消息失败: {e}")
+                logger.warning(f"异步发送消息失败: {e}")
         
         # 方法2：同步方式发送消息
         if not success:
             success = send_telegram_sync(TELEGRAM_BOT_TOKEN, user_id, message)
         
+        elapsed = time.monotonic() - start
+        latency_stats.record("notify" if success else "notify_failed", elapsed)
         if not success:
-            print(f"❌ 发送任务结果消息失败，用户ID: {user_id}")
+            logger.error(f"❌ 发送任务结果消息失败，用户ID: {user_id}")
+        return elapsed
     
     async def _send_message_async(self, user_id, message):
         """异步发送消息，带重试机制"""
@@ -740,7 +3387,7 @@ class TaskScheduler:
                 )
                 return True
             except Exception as e:
-                print(f"异步发送失败 (尝试 {attempt + 1}/{TELEGRAM_RETRY_COUNT}): {e}")
+                logger.warning(f"异步发送失败 (尝试 {attempt + 1}/{TELEGRAM_RETRY_COUNT}): {e}")
                 if attempt < TELEGRAM_RETRY_COUNT - 1:
                     await asyncio.sleep(TELEGRAM_RETRY_DELAY)
         
@@ -786,13 +3433,13 @@ def get_bot_owner_id(token):
         if response.status_code == 200:
             bot_info = response.json()
             if bot_info.get('ok'):
-                print(f"✅ Bot信息验证成功: {bot_info['result']['first_name']} (@{bot_info['result']['username']})")
+                logger.info(f"✅ Bot信息验证成功: {bot_info['result']['first_name']} (@{bot_info['result']['username']})")
                 # 由于Telegram API限制，无法直接获取Bot创建者
                 # 我们使用配置的Chat ID进行验证
                 return None
         return None
     except Exception as e:
-        print(f"获取Bot信息失败: {e}")
+        logger.warning(f"获取Bot信息失败: {e}")
         return None
 
 def verify_bot_owner(token, chat_id):
@@ -956,7 +3603,10 @@ async def input_totp(update: Update, context: ContextTypes.DEFAULT_TYPE):
     })
     
     try:
-        result = module_func(
+        result = await run_interactive_signin(
+            user_id,
+            module_dir,
+            module_func,
             context.user_data['username'],
             context.user_data['password'],
             context.user_data['totp']
@@ -1026,9 +3676,7 @@ async def allow_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         await update.message.reply_text("用户ID格式错误。")
         return
-    allowed_users = load_allowed_users()
-    allowed_users.add(target_id)
-    save_allowed_users(allowed_users)
+    add_allowed_user(target_id)
     await update.message.reply_text(f"已授权用户 {target_id} 使用Bot。")
     log_admin_action_daily(user_id, 'allow', context.args, f"授权用户 {target_id}")
 
@@ -1129,9 +3777,7 @@ async def ban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         await update.message.reply_text("用户ID格式错误。")
         return
-    banned = load_banned_users()
-    banned.add(target_id)
-    save_banned_users(banned)
+    add_banned_user(target_id)
     log_admin_action("ban", f"封禁用户 {target_id}")
     await update.message.reply_text(f"已封禁用户 {target_id}", reply_markup=ReplyKeyboardRemove())
 
@@ -1149,10 +3795,7 @@ async def unban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         await update.message.reply_text("用户ID格式错误。")
         return
-    banned = load_banned_users()
-    if target_id in banned:
-        banned.remove(target_id)
-        save_banned_users(banned)
+    if remove_banned_user(target_id):
         add_temp_user(target_id)  # 记录为临时用户
         log_admin_action("unban", f"解封用户 {target_id}")
         log_admin_action_daily(user_id, 'unban', context.args, f"解封用户 {target_id}")
@@ -1174,10 +3817,7 @@ async def disallow_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         await update.message.reply_text("用户ID格式错误。")
         return
-    allowed = load_allowed_users()
-    if target_id in allowed:
-        allowed.remove(target_id)
-        save_allowed_users(allowed)
+    if remove_allowed_user(target_id):
         log_admin_action("disallow", f"移除白名单用户 {target_id}")
         await update.message.reply_text(f"已移除白名单用户 {target_id}", reply_markup=ReplyKeyboardRemove())
     else:
@@ -1231,6 +3871,80 @@ async def top_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         msg.append(f"`{i}`. `{uid}` - *{info.get('count', 0)}* 次")
     await update.message.reply_text("\n".join(msg), reply_markup=ReplyKeyboardRemove())
 
+async def ratelimit_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """查看各平台限流状态：排队数与等待时间"""
+    user_id = update.effective_user.id
+    is_ok, warn_msg = check_admin_and_warn(user_id, 'ratelimit')
+    if not is_ok:
+        await update.message.reply_text(warn_msg, reply_markup=ReplyKeyboardRemove())
+        return
+    msg = ["平台限流状态："]
+    for platform, info in platform_rate_limiter.stats().items():
+        msg.append(
+            f"\n【{platform}】\n"
+            f"速率: {info['rate']:g}/秒，突发: {info['burst']}，可用令牌: {info['tokens']:.1f}\n"
+            f"排队中: {info['waiting']}，累计放行: {info['acquired']}\n"
+            f"平均等待: {info['avg_wait']:.2f}s，最大等待: {info['max_wait']:.2f}s，最近等待: {info['last_wait']:.2f}s"
+        )
+    if task_scheduler:
+        executor = task_scheduler.executor
+        msg.append(f"\n执行池排队: 手动 {executor.pending_count(LANE_INTERACTIVE)}，定时 {executor.pending_count(LANE_SCHEDULED)}")
+    await update.message.reply_text("\n".join(msg), reply_markup=ReplyKeyboardRemove())
+
+LATENCY_PHASE_NAMES = {
+    "rate_wait": "限流等待",
+    "login": "登录",
+    "checkin": "签到",
+    "balance": "查询余额",
+    "total": "总耗时",
+}
+
+def format_latency_line(name, summary):
+    """格式化一行分位数统计"""
+    return (f"{name}: p50 {summary['p50']:.2f}s / p95 {summary['p95']:.2f}s / "
+            f"p99 {summary['p99']:.2f}s / max {summary['max']:.2f}s（{summary['count']}次）")
+
+async def latency_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """查看定时任务调度延迟、各平台签到阶段耗时与通知送达耗时的滚动分位数"""
+    user_id = update.effective_user.id
+    is_ok, warn_msg = check_admin_and_warn(user_id, 'latency')
+    if not is_ok:
+        await update.message.reply_text(warn_msg, reply_markup=ReplyKeyboardRemove())
+        return
+    msg = [f"执行延迟统计（每项最近 {latency_stats.window} 次）："]
+    lag = latency_stats.summary("dispatch_lag")
+    msg.append("\n【调度】")
+    msg.append(format_latency_line("触发延迟", lag) if lag else "触发延迟: 暂无数据")
+    for platform in SIGNIN_FUNCS:
+        lines = []
+        for phase, name in LATENCY_PHASE_NAMES.items():
+            summary = latency_stats.summary(f"{platform}.{phase}")
+            if summary:
+                lines.append(format_latency_line(name, summary))
+        timeouts = latency_stats.summary(f"{platform}.timeout")
+        if timeouts:
+            lines.append(f"超时: {timeouts['count']}次")
+        msg.append(f"\n【{platform}】")
+        msg.extend(lines or ["暂无数据"])
+    msg.append("\n【Telegram通知】")
+    notify = latency_stats.summary("notify")
+    msg.append(format_latency_line("送达", notify) if notify else "送达: 暂无数据")
+    failed = latency_stats.summary("notify_failed")
+    if failed:
+        msg.append(format_latency_line("失败", failed))
+    recent = latency_stats.recent()[-5:]
+    if recent:
+        msg.append("\n【最近执行】")
+        for entry in recent:
+            timings = entry["timings"]
+            msg.append(
+                f"{entry['module']} {entry['task_id']} 计划 {entry['scheduled'] or '-'} 开始 {entry['started']} "
+                f"签到 {timings.get('total', 0):.2f}s 通知 {timings.get('notify', 0):.2f}s"
+                + ("（缓存）" if timings.get("cached") else "")
+                + ("（预登录）" if timings.get("warm") else "")
+            )
+    await update.message.reply_text("\n".join(msg), reply_markup=ReplyKeyboardRemove())
+
 async def broadcast_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     is_ok, warn_msg = check_admin_and_warn(user_id, 'broadcast')
@@ -1338,15 +4052,8 @@ async def export_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         export_data["log_files"] = log_files
         
         # 7. 管理员日志
-        admin_logs = []
-        for file in glob.glob("admin_log_*.json"):
-            try:
-                with open(file, 'r', encoding='utf-8') as f:
-                    logs = json.load(f)
-                    admin_logs.extend(logs)
-            except Exception:
-                pass
-        export_data["admin_logs"] = admin_logs
+        export_data["admin_logs"] = [entry for day in admin_log.counts() for entry in admin_log.read(day)]
+        export_data["admin_audit"] = [entry for day in admin_audit.counts() for entry in admin_audit.read(day)]
         
         # 8. 系统信息
         export_data["system_info"] = {
@@ -1377,12 +4084,12 @@ async def export_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # 记录操作日志
         log_admin_action_daily(user_id, 'export', [], f"导出到{export_file}")
         
-        print(f"✅ 管理员 {user_id} 成功导出数据到 {export_file}")
+        logger.info(f"✅ 管理员 {user_id} 成功导出数据到 {export_file}")
         
     except Exception as e:
         error_msg = f"❌ 导出数据失败：{e}"
         await update.message.reply_text(error_msg, reply_markup=ReplyKeyboardRemove())
-        print(f"❌ 导出数据失败：{e}")
+        logger.error(f"❌ 导出数据失败：{e}")
 
 def generate_export_report(export_data, export_file):
     """生成导出数据报告"""
@@ -1400,7 +4107,7 @@ def generate_export_report(export_data, export_file):
     total_banned = len(user_perms.get("banned_users", []))
     total_temp = len(user_perms.get("temp_users", {}))  # temp_users 是字典
     total_tasks = len(scheduled_tasks)  # scheduled_tasks 是字典
-    total_admin_logs = len(admin_logs)
+    total_admin_logs = len(admin_logs) + len(export_data.get("admin_audit", []))
     
     # 计算今日使用情况
     today = date.today().isoformat()
@@ -1484,9 +4191,7 @@ async def setlimit_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         target_id = int(context.args[0])
         limit = int(context.args[1])
-        user_limits = load_user_limits()
-        user_limits[str(target_id)] = limit
-        save_user_limits(user_limits)
+        set_user_limit(target_id, limit)
         await update.message.reply_text(f"已设置用户 {target_id} 的每日签到次数上限为 {limit} 次。", reply_markup=ReplyKeyboardRemove())
         log_admin_action("setlimit", f"设置用户 {target_id} 每日签到次数上限为 {limit}")
     except Exception:
@@ -1504,6 +4209,8 @@ async def restart_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f.write('restarting')
     python = sys.executable
     script = os.path.abspath(__file__)
+    # execv 不会执行 atexit，先把延迟写入的数据落盘，再写完日志队列中剩余的记录
+    stop_logging()
     os.execv(python, [python, script])
 
 async def shutdown_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1514,6 +4221,8 @@ async def shutdown_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     await update.message.reply_text("Bot即将关闭...", reply_markup=ReplyKeyboardRemove())
     log_admin_action("shutdown", "关闭Bot")
+    # os._exit 不会执行 atexit，先把延迟写入的数据落盘，再写完日志队列中剩余的记录
+    stop_logging()
     os._exit(0)
 
 # ========== 帮助命令 ==========
@@ -1581,6 +4290,8 @@ async def menu_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             ("restart", "重启Bot"),
             ("shutdown", "关闭Bot"),
             ("summary", "查看汇总日志"),
+            ("ratelimit", "平台限流状态"),
+            ("latency", "执行延迟统计"),
             ("clean_cache", "清理缓存")
         ]
         
@@ -1618,32 +4329,31 @@ async def menu_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=ReplyKeyboardRemove()
         )
         
-        print(f"✅ 管理员 {user_id} 成功更新了Bot命令菜单")
+        logger.info(f"✅ 管理员 {user_id} 成功更新了Bot命令菜单")
         
     except Exception as e:
         error_msg = f"❌ 设置命令菜单失败：{e}"
         await update.message.reply_text(error_msg, reply_markup=ReplyKeyboardRemove())
-        print(f"❌ 设置命令菜单失败：{e}")
+        logger.error(f"❌ 设置命令菜单失败：{e}")
 
 # ========== 非管理员尝试管理命令计数与自动拉黑 ==========
 def record_admin_attempt(user_id, command):
-    data = load_json(ADMIN_ATTEMPT_FILE, {})
     today = date.today().isoformat()
     key = f"{user_id}_{today}"
-    if key not in data:
-        data[key] = {"count": 0, "last": []}
-    data[key]["count"] += 1
-    data[key]["last"].append(command)
-    save_json(ADMIN_ATTEMPT_FILE, data)
-    return data[key]["count"]
+    
+    def bump(entry):
+        entry = entry or {"count": 0, "last": []}
+        entry["count"] += 1
+        entry["last"].append(command)
+        return entry
+    
+    return state_store.kv_update('admin_attempts', key, bump)["count"]
 
 def check_admin_and_warn(user_id, command):
     if not is_admin(user_id):
         count = record_admin_attempt(user_id, command)
         if count >= 3:
-            banned = load_banned_users()
-            banned.add(user_id)
-            save_banned_users(banned)
+            add_banned_user(user_id)
             return False, "你不是管理员，已被自动拉黑。请勿反复尝试管理命令。"
         else:
             return False, f"你不是管理员，无权使用此命令。警告 {count}/3，超过3次将被拉黑。"
@@ -1651,17 +4361,13 @@ def check_admin_and_warn(user_id, command):
 
 # ========== 管理员操作日志 ========== 
 def log_admin_action_daily(user_id, command, args, result):
-    now = get_shanghai_now()
-    log_file = f"admin_log_{now.strftime(LOG_TIME_FMT)}.json"
-    logs = load_json(log_file, [])
-    logs.append({
-        "time": now.isoformat(),
+    admin_log.append({
+        "time": get_shanghai_now().isoformat(),
         "user_id": user_id,
         "command": command,
         "args": args,
         "result": result
     })
-    save_json(log_file, logs)
 
 # ========== 汇总日志命令 ========== 
 async def send_md(message_func, text, **kwargs):
@@ -1679,19 +4385,14 @@ async def summary_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_ok:
         await send_md(update.message.reply_text, "只有管理员才能查看汇总数据。")
         return
-    files = sorted(glob.glob("admin_log_*.json"))
+    files = {log.segment_file(day): count for log in (admin_audit, admin_log) for day, count in log.counts().items()}
     
     if not files:
         await send_md(update.message.reply_text, "未找到任何管理员日志文件。")
         return
         
-    total = 0
-    summary = []
-    for f in files:
-        logs = load_json(f, [])
-        total += len(logs)
-        summary.append(f"`{f}`: *{len(logs)}* 条记录")
-    text = f"共*{len(files)}*个日志文件，*{total}*条操作记录：\n" + "\n".join(summary)
+    summary = [f"`{os.path.basename(path)}`: *{count}* 条记录" for path, count in files.items()]
+    text = f"共*{len(files)}*个日志文件，*{sum(files.values())}*条操作记录：\n" + "\n".join(summary)
     await send_md(update.message.reply_text, text)
 
 async def acck_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1724,7 +4425,7 @@ async def acck_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             with open(user_file, 'r', encoding='utf-8') as f:
                 user_info = json.load(f)
-            result = acck_signin(user_info['username'], user_info['password'], user_info.get('totp'))
+            result = await run_interactive_signin(user_id, 'Acck', acck_signin, user_info['username'], user_info['password'], user_info.get('totp'))
             increment_daily_usage(user_id)
             record_usage(user_id)
             await update.message.reply_text(f"✅ Acck签到结果:\n{result}", reply_markup=ReplyKeyboardRemove())
@@ -1769,7 +4470,7 @@ async def akile_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             with open(user_file, 'r', encoding='utf-8') as f:
                 user_info = json.load(f)
-            result = akile_signin(user_info['username'], user_info['password'], user_info.get('totp'))
+            result = await run_interactive_signin(user_id, 'Akile', akile_signin, user_info['username'], user_info['password'], user_info.get('totp'))
             increment_daily_usage(user_id)
             record_usage(user_id)
             await update.message.reply_text(f"✅ Akile签到结果:\n{result}", reply_markup=ReplyKeyboardRemove())
@@ -1821,6 +4522,9 @@ async def add_select_time(update, context, edit=False):
             label += " (默认)"
         buttons.append([InlineKeyboardButton(label, callback_data=f"add_time_{hour}_{minute}")])
     buttons.append([InlineKeyboardButton("⏰ 自定义时间", callback_data="add_custom_time")])
+    buttons.append([InlineKeyboardButton("📅 Cron表达式", callback_data="add_custom_cron")])
+    spread = context.user_data.get('add_spread', SPREAD_DEFAULT)
+    buttons.append([InlineKeyboardButton(f"🔀 错峰执行：{'开' if spread else '关'}", callback_data="add_toggle_spread")])
     reply_markup = InlineKeyboardMarkup(buttons)
     
     if edit:
@@ -1835,7 +4539,7 @@ async def add_select_time(update, context, edit=False):
                     reply_markup=reply_markup
                 )
         except Exception as e:
-            print(f"编辑消息失败: {e}")
+            logger.warning(f"编辑消息失败: {e}")
             # 如果编辑失败，发送新消息
             msg = await bot_reply_prompt(update, "请选择定时任务时间：", reply_markup=reply_markup)
             add_flow_msg_id(context, msg.message_id)
@@ -1960,7 +4664,7 @@ async def del_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # 构建删除选项
     buttons = []
     for task_id, task in tasks.items():
-        label = f"{task['module']} {task['hour']:02d}:{task['minute']:02d}"
+        label = f"{task['module']} {format_task_schedule(task)}"
         buttons.append([InlineKeyboardButton(f"❌ {label}", callback_data=f"del_{task_id}")])
     # 不再添加退出按钮，用户需用/cancel退出
     reply_markup = InlineKeyboardMarkup(buttons)
@@ -1995,7 +4699,7 @@ async def del_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # 构建新的删除选项
     buttons = []
     for tid, task in tasks.items():
-        label = f"{task['module']} {task['hour']:02d}:{task['minute']:02d}"
+        label = f"{task['module']} {format_task_schedule(task)}"
         buttons.append([InlineKeyboardButton(f"❌ {label}", callback_data=f"del_{tid}")])
     reply_markup = InlineKeyboardMarkup(buttons)
     msg = await bot_send_message(context, update.effective_chat.id, "请选择要删除的定时任务：\n如需退出请发送 /cancel", reply_markup=reply_markup)
@@ -2070,30 +4774,26 @@ async def all_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         number_str = f"[{task_number}] " if is_failed else ""
         if is_failed:
             failed_task_number_map[task_number] = task_id
-        message += f"{status_icon} {number_str}{task['module']} {task['hour']:02d}:{task['minute']:02d} 账号: {task.get('username','')}\n"
+        message += f"{status_icon} {number_str}{task['module']} {format_task_schedule(task)} 账号: {task.get('username','')}\n"
         message += f"   状态: {status_text}\n"
         message += f"   最后运行: {last_run}\n"
+        next_run = task_scheduler.get_next_run(task_id) if task_scheduler else None
+        if next_run:
+            message += f"   下次运行: {next_run.strftime('%Y-%m-%d %H:%M')}\n"
         message += f"   任务ID: {task_id}\n\n"
     # 保存编号映射到用户会话，供后续手动执行用
     context.user_data['failed_task_number_map'] = failed_task_number_map
-    # 显示当天日志摘要
-    today = get_shanghai_now().strftime('%Y%m%d')
+    # 显示当天日志摘要（仅本用户的账号，每个账号取最后一条记录）
     log_summary = "\n📑 今日签到日志摘要：\n"
     for module in ['Acck', 'Akile']:
-        log_dir = get_log_dir(module)
-        success_logs = glob.glob(os.path.join(log_dir, f"{today}_*_success.log"))
-        error_logs = glob.glob(os.path.join(log_dir, f"{today}_*_error.log"))
-        if not success_logs and not error_logs:
+        usernames = dict.fromkeys(task.get('username', '') for task in tasks.values() if task['module'] == module)
+        entries = [entry for entry in (signin_ledger.get(module, username) for username in usernames) if entry]
+        if not entries:
             continue
         log_summary += f"\n【{module}】\n"
-        for log_file in success_logs:
-            with open(log_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                log_summary += f"✅ 成功：{''.join(lines)}\n"
-        for log_file in error_logs:
-            with open(log_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                log_summary += f"❌ 失败：{''.join(lines)}\n"
+        for entry in entries:
+            prefix = "✅ 成功" if entry["last"].get("status") == 'success' else "❌ 失败"
+            log_summary += f"{prefix}：{format_ledger_record(entry['last'])}\n"
     message += log_summary
     # 构建操作按钮
     buttons = [
@@ -2138,6 +4838,20 @@ async def add_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context.user_data['current_flow_msg_ids'] = []
         context.user_data['current_flow_msg_ids'].append(query.message.message_id)
         return "ADD_CUSTOM_TIME"
+    if query.data == "add_toggle_spread":
+        context.user_data['add_spread'] = not context.user_data.get('add_spread', SPREAD_DEFAULT)
+        return await add_select_time(update, context)
+    if query.data == "add_custom_cron":
+        await query.edit_message_text(
+            "请输入Cron表达式（分 时 日 月 周），例如：\n"
+            "0 8 * * 1-5  工作日 08:00\n"
+            "0 */6 * * *  每6小时\n"
+            "H(0-29) 8 * * *  08:00-08:29 之间固定的随机分钟"
+        )
+        if 'current_flow_msg_ids' not in context.user_data:
+            context.user_data['current_flow_msg_ids'] = []
+        context.user_data['current_flow_msg_ids'].append(query.message.message_id)
+        return "ADD_CUSTOM_CRON"
     # 推荐时间
     data = query.data.split('_')
     hour, minute = int(data[2]), int(data[3])
@@ -2148,9 +4862,11 @@ async def add_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if 'current_flow_msg_ids' not in context.user_data:
         context.user_data['current_flow_msg_ids'] = []
     context.user_data['current_flow_msg_ids'].append(query.message.message_id)
-    success, task_id = add_scheduled_task(user_id, module, username, hour, minute)
+    spread = context.user_data.get('add_spread', SPREAD_DEFAULT)
+    success, task_id = add_scheduled_task(user_id, module, username, hour, minute, spread=spread)
     if success:
-        msg = f"✅ 定时任务添加成功！\n平台: {module}\n账号: {username}\n时间: {hour:02d}:{minute:02d}\n任务ID: {task_id}"
+        schedule_text = format_task_schedule(load_scheduled_tasks().get(task_id, {'hour': hour, 'minute': minute}))
+        msg = f"✅ 定时任务添加成功！\n平台: {module}\n账号: {username}\n时间: {schedule_text}\n任务ID: {task_id}"
         await query.edit_message_text(msg)
         save_op_log(module, username, '添加任务', task_id, 'success', msg)
         
@@ -2202,7 +4918,7 @@ async def add_custom_time_confirm(update: Update, context: ContextTypes.DEFAULT_
                     text=f"❌ {result[2]}\n请重新输入时间（格式：HH:MM）："
                 )
         except Exception as e:
-            print(f"编辑消息失败: {e}")
+            logger.warning(f"编辑消息失败: {e}")
             # 如果编辑失败，发送新消息
             msg = await bot_reply_prompt(update, f"❌ {result[2]}\n请重新输入时间（格式：HH:MM）：")
             add_flow_msg_id(context, msg.message_id)
@@ -2211,9 +4927,11 @@ async def add_custom_time_confirm(update: Update, context: ContextTypes.DEFAULT_
     module = context.user_data['add_module']
     username = context.user_data['add_username']
     user_id = str(update.effective_user.id)
-    success, task_id = add_scheduled_task(user_id, module, username, hour, minute)
+    spread = context.user_data.get('add_spread', SPREAD_DEFAULT)
+    success, task_id = add_scheduled_task(user_id, module, username, hour, minute, spread=spread)
     if success:
-        msg = f"✅ 定时任务添加成功！\n平台: {module}\n账号: {username}\n时间: {hour:02d}:{minute:02d}\n任务ID: {task_id}"
+        schedule_text = format_task_schedule(load_scheduled_tasks().get(task_id, {'hour': hour, 'minute': minute}))
+        msg = f"✅ 定时任务添加成功！\n平台: {module}\n账号: {username}\n时间: {schedule_text}\n任务ID: {task_id}"
         # 编辑消息显示成功结果，10秒后自动撤回
         try:
             current_msg_id = context.user_data.get('current_flow_msg_ids', [None])[-1]
@@ -2225,7 +4943,7 @@ async def add_custom_time_confirm(update: Update, context: ContextTypes.DEFAULT_
                     reply_markup=ReplyKeyboardRemove()
                 )
         except Exception as e:
-            print(f"编辑消息失败: {e}")
+            logger.warning(f"编辑消息失败: {e}")
             # 如果编辑失败，发送新消息
             result_msg = await bot_send_message(context, update.effective_chat.id, msg, reply_markup=ReplyKeyboardRemove())
             add_flow_msg_id(context, result_msg.message_id)
@@ -2244,7 +4962,7 @@ async def add_custom_time_confirm(update: Update, context: ContextTypes.DEFAULT_
                     reply_markup=ReplyKeyboardRemove()
                 )
         except Exception as e:
-            print(f"编辑消息失败: {e}")
+            logger.warning(f"编辑消息失败: {e}")
             # 如果编辑失败，发送新消息
             result_msg = await bot_send_message(context, update.effective_chat.id, msg, reply_markup=ReplyKeyboardRemove())
             add_flow_msg_id(context, result_msg.message_id)
@@ -2252,6 +4970,52 @@ async def add_custom_time_confirm(update: Update, context: ContextTypes.DEFAULT_
         await auto_delete_message(update, context, 10)
     return ConversationHandler.END
 
+# 3. add_custom_cron_confirm
+async def add_custom_cron_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cron = " ".join(update.message.text.split())
+    
+    # 删除用户输入的表达式消息
+    await delete_user_message(update)
+    
+    module = context.user_data['add_module']
+    username = context.user_data['add_username']
+    user_id = str(update.effective_user.id)
+    success, task_id = add_scheduled_task(user_id, module, username, cron=cron)
+    if not success:
+        # 编辑消息显示错误提示，等待重新输入
+        try:
+            current_msg_id = context.user_data.get('current_flow_msg_ids', [None])[-1]
+            if current_msg_id:
+                await update.get_bot().edit_message_text(
+                    chat_id=update.effective_chat.id,
+                    message_id=current_msg_id,
+                    text=f"❌ {task_id}\n请重新输入Cron表达式（如 0 8 * * 1-5）："
+                )
+        except Exception as e:
+            logger.warning(f"编辑消息失败: {e}")
+            msg = await bot_reply_prompt(update, f"❌ {task_id}\n请重新输入Cron表达式（如 0 8 * * 1-5）：")
+            add_flow_msg_id(context, msg.message_id)
+        return "ADD_CUSTOM_CRON"
+    next_run = task_scheduler.get_next_run(task_id) if task_scheduler else None
+    msg = f"✅ 定时任务添加成功！\n平台: {module}\n账号: {username}\n时间: cron({cron})\n任务ID: {task_id}"
+    if next_run:
+        msg += f"\n下次运行: {next_run.strftime('%Y-%m-%d %H:%M')}"
+    try:
+        current_msg_id = context.user_data.get('current_flow_msg_ids', [None])[-1]
+        if current_msg_id:
+            await update.get_bot().edit_message_text(
+                chat_id=update.effective_chat.id,
+                message_id=current_msg_id,
+                text=msg
+            )
+    except Exception as e:
+        logger.warning(f"编辑消息失败: {e}")
+        result_msg = await bot_send_message(context, update.effective_chat.id, msg, reply_markup=ReplyKeyboardRemove())
+        add_flow_msg_id(context, result_msg.message_id)
+    save_op_log(module, username, '添加任务', task_id, 'success', msg)
+    await auto_delete_message(update, context, 10)
+    return ConversationHandler.END
+
 # ConversationHandler注册
 add_conv_handler = ConversationHandler(
     entry_points=[CommandHandler('add', add_cmd)],
@@ -2260,8 +5024,9 @@ add_conv_handler = ConversationHandler(
         "ADD_INPUT_USERNAME": [MessageHandler(filters.TEXT & ~filters.COMMAND, add_input_username)],
         "ADD_INPUT_PASSWORD": [MessageHandler(filters.TEXT & ~filters.COMMAND, add_input_password)],
         "ADD_INPUT_TOTP": [MessageHandler(filters.TEXT & ~filters.COMMAND, add_input_totp)],
-        "ADD_SELECT_TIME": [CallbackQueryHandler(add_confirm, pattern="^add_time_\\d+_\\d+$|^add_custom_time$")],
+        "ADD_SELECT_TIME": [CallbackQueryHandler(add_confirm, pattern="^add_time_\\d+_\\d+$|^add_custom_time$|^add_custom_cron$|^add_toggle_spread$")],
         "ADD_CUSTOM_TIME": [MessageHandler(filters.TEXT & ~filters.COMMAND, add_custom_time_confirm)],
+        "ADD_CUSTOM_CRON": [MessageHandler(filters.TEXT & ~filters.COMMAND, add_custom_cron_confirm)],
         "ADD_USE_EXISTING": [MessageHandler(filters.TEXT & ~filters.COMMAND, add_use_existing)],
     },
     fallbacks=[CommandHandler('cancel', cancel)],
@@ -2352,7 +5117,7 @@ async def manual_execute_input(update: Update, context: ContextTypes.DEFAULT_TYP
     processing_msg = await update.message.reply_text("🔄 正在执行任务，请稍候...")
     
     # 执行任务
-    success, message = execute_task_manually(task_id, user_id)
+    success, message = await execute_task_manually(task_id, user_id)
     
     # 删除执行中提示
     try:
@@ -2366,11 +5131,8 @@ async def manual_execute_input(update: Update, context: ContextTypes.DEFAULT_TYP
         if not failed_tasks:
             # 成功消息不自动撤回
             result_msg = f"✅ *任务执行成功！*\n\n{message}\n\n🎉 *恭喜！当前没有失败的任务了！*"
-            await update.message.reply_text(
-                result_msg, 
-                parse_mode=ParseMode.MARKDOWN,
-                reply_markup=ReplyKeyboardRemove()
-            )
+            # 结果中含签到返回的原文，Markdown解析失败时退回纯文本
+            await send_md(update.message.reply_text, result_msg, reply_markup=ReplyKeyboardRemove())
             # 清理手动执行模式标记
             context.user_data.pop('manual_execute_mode', None)
             # 重置用户状态
@@ -2387,12 +5149,12 @@ async def manual_execute_input(update: Update, context: ContextTypes.DEFAULT_TYP
             for number, tid in context.user_data['failed_task_number_map'].items():
                 msg_text += f"[{number}] 任务ID: `{tid}`\n"
             # 结果消息不自动撤回
-            await update.message.reply_text(msg_text, parse_mode=ParseMode.MARKDOWN)
+            await send_md(update.message.reply_text, msg_text)
             return "MANUAL_EXECUTE_INPUT"
     else:
         # 失败消息不自动撤回
         error_msg = f"❌ *任务执行失败！*\n\n{message}\n\n请重新输入编号，或发送 /cancel 退出。"
-        await update.message.reply_text(error_msg, parse_mode=ParseMode.MARKDOWN)
+        await send_md(update.message.reply_text, error_msg)
         return "MANUAL_EXECUTE_INPUT"
 
 # ConversationHandler注册
@@ -2406,8 +5168,9 @@ all_cmd_conv_handler = ConversationHandler(
         "ADD_INPUT_USERNAME": [MessageHandler(filters.TEXT & ~filters.COMMAND, add_input_username)],
         "ADD_INPUT_PASSWORD": [MessageHandler(filters.TEXT & ~filters.COMMAND, add_input_password)],
         "ADD_INPUT_TOTP": [MessageHandler(filters.TEXT & ~filters.COMMAND, add_input_totp)],
-        "ADD_SELECT_TIME": [CallbackQueryHandler(add_confirm, pattern="^add_time_\\d+_\\d+$|^add_custom_time$")],
+        "ADD_SELECT_TIME": [CallbackQueryHandler(add_confirm, pattern="^add_time_\\d+_\\d+$|^add_custom_time$|^add_custom_cron$|^add_toggle_spread$")],
         "ADD_CUSTOM_TIME": [MessageHandler(filters.TEXT & ~filters.COMMAND, add_custom_time_confirm)],
+        "ADD_CUSTOM_CRON": [MessageHandler(filters.TEXT & ~filters.COMMAND, add_custom_cron_confirm)],
         "ADD_USE_EXISTING": [MessageHandler(filters.TEXT & ~filters.COMMAND, add_use_existing)],
         "DEL_SELECT_TASK": [CallbackQueryHandler(del_confirm, pattern="^del_.*$")],
     },
@@ -2417,22 +5180,29 @@ all_cmd_conv_handler = ConversationHandler(
 # main函数注册
 def main():
     import sys
+    setup_logging()
+    if MISFIRE_POLICY != DEFAULT_MISFIRE_POLICY:
+        logger.warning(f"⚠️ 无效的 MISFIRE_POLICY: {MISFIRE_POLICY}，可选值: {', '.join(MISFIRE_POLICIES)}，已回退为 {DEFAULT_MISFIRE_POLICY}")
     TOKEN = TELEGRAM_BOT_TOKEN
     CHAT_ID = TELEGRAM_CHAT_ID
     
     if TOKEN == '在这里填写你的Bot Token' or CHAT_ID == '在这里填写你的Chat ID':
-        print('❌ 配置错误：请先在代码顶部填写TELEGRAM_BOT_TOKEN和TELEGRAM_CHAT_ID')
+        logger.error('❌ 配置错误：请先在代码顶部填写TELEGRAM_BOT_TOKEN和TELEGRAM_CHAT_ID')
         sys.exit(1)
     
-    print('🔍 正在验证Bot Token和Chat ID的匹配性...')
+    logger.info('🔍 正在验证Bot Token和Chat ID的匹配性...')
     is_valid, message = verify_bot_owner(TOKEN, CHAT_ID)
     if not is_valid:
-        print(f'❌ 验证失败：{message}')
+        logger.error(f'❌ 验证失败：{message}')
         sys.exit(1)
     
-    print('✅ 验证成功！Bot Token和Chat ID匹配')
-    print(f'   {message}')
-    print('-' * 50)
+    logger.info(f'✅ 验证成功！Bot Token和Chat ID匹配 {message}')
+    
+    # 多进程分片执行签到，需在启动其他线程之前创建子进程
+    global signin_process_pool
+    if SCHEDULER_WORKER_PROCESSES > 0:
+        signin_process_pool = ShardedSigninPool(SCHEDULER_WORKER_PROCESSES)
+        logger.info(f'✅ 已启动 {SCHEDULER_WORKER_PROCESSES} 个签到子进程')
     
     app = Application.builder().token(TOKEN).build()
     # 获取主线程事件循环
@@ -2441,6 +5211,9 @@ def main():
     task_scheduler = TaskScheduler(app, loop)
     task_scheduler.start()
     
+    # 旧版管理日志一次性导入按天分段的日志
+    import_legacy_admin_logs()
+    
     # 添加账号配置流程的对话处理器
     conv_handler = ConversationHandler(
         entry_points=[
@@ -2473,6 +5246,8 @@ def main():
     app.add_handler(CommandHandler('unban', unban_user))
     app.add_handler(CommandHandler('stats', stats_cmd))
     app.add_handler(CommandHandler('top', top_cmd))
+    app.add_handler(CommandHandler('ratelimit', ratelimit_cmd))
+    app.add_handler(CommandHandler('latency', latency_cmd))
     app.add_handler(CommandHandler('broadcast', broadcast_cmd))
     app.add_handler(CommandHandler('export', export_cmd))
     app.add_handler(CommandHandler('setlimit', setlimit_cmd))
@@ -2489,8 +5264,8 @@ def main():
     app.add_handler(CommandHandler('clean_cache', clean_cache_cmd))
     app.add_handler(CommandHandler('clean_logs', clean_logs_cmd))  # 日志清理命令
     
-    print('🚀 Bot已启动...')
-    print('🕐 定时任务调度器已启动...')
+    logger.info('🚀 Bot已启动...')
+    logger.info('🕐 定时任务调度器已启动...')
     app.run_polling(drop_pending_updates=True)
 
 def save_user_info(user_id, module, info):
@@ -2508,7 +5283,7 @@ def save_user_info(user_id, module, info):
         
         username = info.get('username')
         if not username:
-            print(f"❌ 保存用户信息失败：缺少用户名")
+            logger.error(f"❌ 保存用户信息失败：缺少用户名")
             return False
             
         info['user_id'] = user_id  # 记录归属用户
@@ -2518,35 +5293,30 @@ def save_user_info(user_id, module, info):
             json.dump(info, f, ensure_ascii=False, indent=2)
         return True
     except Exception as e:
-        print(f"❌ 保存用户信息失败: {e}")
+        logger.error(f"❌ 保存用户信息失败: {e}")
         return False
 
 # 临时用户管理
 
 def load_temp_users():
-    return load_json(TEMP_USERS_FILE, {})
+    return state_store.kv_load('temp_users')
 
 def save_temp_users(data):
-    save_json(TEMP_USERS_FILE, data)
+    state_store.kv_save('temp_users', data)
 
 def add_temp_user(user_id):
-    data = load_temp_users()
-    data[str(user_id)] = datetime.now().isoformat()
-    save_temp_users(data)
+    state_store.kv_put('temp_users', str(user_id), datetime.now().isoformat())
 
 def remove_temp_user(user_id):
-    data = load_temp_users()
-    if str(user_id) in data:
-        del data[str(user_id)]
-        save_temp_users(data)
+    state_store.kv_delete('temp_users', str(user_id))
 
 def is_temp_user(user_id):
-    data = load_temp_users()
-    if str(user_id) not in data:
+    since = state_store.kv_get('temp_users', str(user_id))
+    if since is None:
         return False
     # 检查是否超过3天
     try:
-        dt = datetime.fromisoformat(data[str(user_id)])
+        dt = datetime.fromisoformat(since)
         if datetime.now() - dt < timedelta(days=3):
             return True
         else:
@@ -2558,105 +5328,146 @@ def is_temp_user(user_id):
         return False
 
 def is_whitelist(user_id):
-    return user_id in load_allowed_users()
+    return state_store.is_member('allowed_users', user_id)
 
 def check_daily_limit(user_id):
     if is_admin(user_id):
         return True, 0
-    today = date.today().isoformat()
-    usage_data = load_daily_usage()
-    if today not in usage_data:
-        usage_data[today] = {}
-    user_usage = usage_data[today].get(str(user_id), 0)
+    user_usage = state_store.daily_usage_get(date.today().isoformat(), user_id)
     return user_usage < get_daily_limit(user_id), user_usage
 
 def increment_daily_usage(user_id):
     if is_admin(user_id):
         return
-    today = date.today().isoformat()
-    usage_data = load_daily_usage()
-    if today not in usage_data:
-        usage_data[today] = {}
-    if str(user_id) not in usage_data[today]:
-        usage_data[today][str(user_id)] = 0
-    usage_data[today][str(user_id)] += 1
-    save_daily_usage(usage_data)
+    state_store.daily_usage_increment(date.today().isoformat(), user_id)
 
 # 汇总并清理缓存
 
+def _gzip_member_names(path):
+    """
+    流式读取gzip归档中各成员头部记录的原文件名（FNAME），解压结果直接丢弃，不占用额外内存
+    
+    Returns:
+        set: 成员文件名集合，头部不含文件名的成员不计入
+    """
+    names = set()
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(10)
+            if len(header) < 10 or header[:2] != b"\x1f\x8b":
+                return names
+            flags = header[3]
+            if flags & 4:  # FEXTRA
+                f.read(int.from_bytes(f.read(2), "little"))
+            for flag in (8, 16):  # FNAME, FCOMMENT：以 \0 结尾的字符串
+                if flags & flag:
+                    value = bytearray()
+                    while (c := f.read(1)) not in (b"\x00", b""):
+                        value += c
+                    if flag == 8:
+                        names.add(value.decode("latin-1"))
+            if flags & 2:  # FHCRC
+                f.read(2)
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            while not decompressor.eof:
+                chunk = f.read(1024 * 1024)
+                if not chunk:
+                    return names
+                while chunk and not decompressor.eof:
+                    decompressor.decompress(chunk, 1024 * 1024)
+                    chunk = decompressor.unconsumed_tail
+            # 跳过成员尾部的 CRC32 和长度（8字节），定位到下一个成员
+            f.seek(8 - len(decompressor.unused_data), os.SEEK_CUR)
+
+def archive_text_logs(log_dir, before_day, cutoff_day):
+    """
+    把模块日志目录中的文本日志（YYYYMMDD_HHMMSS_*.log）按天流式追加到 YYYYMMDD.log.gz，
+    并按文件名删除过期的归档，全程不把日志内容整体读入内存。
+    每个文件作为一个以原文件名命名的gzip成员写入；上次归档后未能删除的源文件不会重复写入，只补做删除
+    
+    Args:
+        log_dir: 日志目录
+        before_day: 早于该日期（YYYYMMDD）的文本日志归档
+        cutoff_day: 早于该日期（YYYYMMDD）的归档删除
+        
+    Returns:
+        tuple: (归档的文件数, 删除的归档路径列表)
+    """
+    archived = 0
+    dropped = []
+    if not os.path.isdir(log_dir):
+        return archived, dropped
+    pending = collections.defaultdict(list)  # 日期 -> 待归档的文本日志
+    for name in sorted(os.listdir(log_dir)):
+        path = os.path.join(log_dir, name)
+        day = name[:8]
+        if not day.isdigit():
+            continue
+        if name.endswith(".log.gz"):
+            if day < cutoff_day:
+                try:
+                    os.remove(path)
+                    dropped.append(path)
+                except OSError as e:
+                    logger.error(f"❌ 删除过期归档 {path} 失败: {e}")
+        elif name.endswith(".log") and day < before_day:
+            pending[day].append(path)
+    for day, paths in sorted(pending.items()):
+        if day >= cutoff_day:
+            # 先写临时文件：复制已有归档，再把每个文件作为一个gzip成员追加（读取时会连续解压），
+            # 完成后原子替换，中途失败不会留下损坏的归档
+            archive_path = os.path.join(log_dir, f"{day}.log.gz")
+            tmp_path = None
+            try:
+                existing = _gzip_member_names(archive_path) if os.path.exists(archive_path) else set()
+                new_paths = [path for path in paths if os.path.basename(path) not in existing]
+                if new_paths:
+                    fd, tmp_path = tempfile.mkstemp(prefix=f".{day}.log.gz.", suffix=".tmp", dir=log_dir)
+                    with os.fdopen(fd, "wb") as raw:
+                        if os.path.exists(archive_path):
+                            with open(archive_path, "rb") as fin:
+                                shutil.copyfileobj(fin, raw, 1024 * 1024)
+                        for path in new_paths:
+                            with open(path, "rb") as fin, \
+                                    gzip.GzipFile(filename=os.path.basename(path), fileobj=raw, mode="wb") as fout:
+                                shutil.copyfileobj(fin, fout, 1024 * 1024)
+                    os.replace(tmp_path, archive_path)
+            except OSError as e:
+                logger.error(f"❌ 归档 {day} 的日志失败: {e}")
+                if tmp_path is not None:
+                    try:
+                        os.remove(tmp_path)
+                    except OSError:
+                        pass
+                continue
+            archived += len(new_paths)
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.error(f"❌ 删除已归档日志 {path} 失败: {e}")
+    return archived, dropped
+
 def clean_cache(context=None):
     now = datetime.now()
-    summary_logs = []
-    deleted_logs = []
     
-    # 清理管理日志文件（3天）
-    for f in glob.glob("admin_log_*.json"):
-        t = os.path.getmtime(f)
-        if now - datetime.fromtimestamp(t) > timedelta(days=3):
-            try:
-                with open(f, "r", encoding="utf-8") as fin:
-                    summary_logs.extend(json.load(fin))
-            except Exception:
-                pass
-            deleted_logs.append(f)
-            os.remove(f)
+    # 清理管理日志：按文件名中的日期整段删除，无需读取内容（审计记录 admin_audit 只归档不删除）
+    cutoff_day = (get_shanghai_now() - timedelta(days=ADMIN_LOG_RETENTION_DAYS)).strftime('%Y-%m-%d')
+    deleted_logs = admin_log.drop_before(cutoff_day)
     
-    # 汇总到 summary_log.json
-    if summary_logs:
-        try:
-            if os.path.exists(SUMMARY_LOG_FILE):
-                with open(SUMMARY_LOG_FILE, "r", encoding="utf-8") as f:
-                    old = json.load(f)
-            else:
-                old = []
-            # 保留3天内的汇总日志
-            old = [x for x in old if (now - datetime.fromisoformat(x['time'])).days <= 3]
-            all_logs = old + summary_logs
-            with open(SUMMARY_LOG_FILE, "w", encoding="utf-8") as f:
-                json.dump(all_logs, f, ensure_ascii=False, indent=2)
-        except Exception:
-            pass
+    # 清理签到台账：同样按日期整段删除，今天以前的分段压缩归档
+    deleted_ledger = signin_ledger.drop_before((get_shanghai_now() - timedelta(days=SIGNIN_LEDGER_RETENTION_DAYS)).strftime('%Y-%m-%d'))
+    today_day = get_shanghai_now().strftime('%Y-%m-%d')
+    archived_days = signin_ledger.log.archive_before(today_day) + admin_log.archive_before(today_day) + admin_audit.archive_before(today_day)
     
-    # 清理签到日志文件（3天）
-    summary_signin = []
+    # 各模块日志目录中的文本日志：过去的按天流式压缩归档，过期归档按文件名删除
+    archived_signin = {}
     deleted_signin = []
+    text_cutoff = (get_shanghai_now() - timedelta(days=3)).strftime('%Y%m%d')
     for module in ['Acck', 'Akile']:
-        log_dir = get_log_dir(module)
-        for f in glob.glob(os.path.join(log_dir, "*_success.log")) + glob.glob(os.path.join(log_dir, "*_error.log")):
-            t = os.path.getmtime(f)
-            if now - datetime.fromtimestamp(t) > timedelta(days=3):
-                try:
-                    with open(f, "r", encoding="utf-8") as fin:
-                        content = fin.read()
-                        # 提取关键信息用于汇总
-                        file_info = {
-                            "file": os.path.basename(f),
-                            "module": module,
-                            "content": content,
-                            "mtime": t,
-                            "size": len(content)
-                        }
-                        summary_signin.append(file_info)
-                except Exception:
-                    pass
-                deleted_signin.append(f)
-                os.remove(f)
-    
-    # 汇总签到日志
-    if summary_signin:
-        try:
-            if os.path.exists(SUMMARY_SIGNIN_FILE):
-                with open(SUMMARY_SIGNIN_FILE, "r", encoding="utf-8") as f:
-                    old = json.load(f)
-            else:
-                old = []
-            # 保留3天内的汇总日志
-            old = [x for x in old if (now - datetime.fromtimestamp(x['mtime'])).days <= 3]
-            all_signin = old + summary_signin
-            with open(SUMMARY_SIGNIN_FILE, "w", encoding="utf-8") as f:
-                json.dump(all_signin, f, ensure_ascii=False, indent=2)
-        except Exception:
-            pass
+        archived, dropped = archive_text_logs(get_log_dir(module), get_shanghai_now().strftime('%Y%m%d'), text_cutoff)
+        archived_signin[module] = archived
+        deleted_signin.extend(dropped)
     
     # 清理广播日志文件（3天）
     deleted_broadcast = []
@@ -2667,22 +5478,16 @@ def clean_cache(context=None):
             os.remove(f)
     
     # 清理临时用户数据（3天）
-    data = load_temp_users()
-    changed = False
+    # 逐项删除，避免整体重写覆盖清理期间新加入的临时用户
     deleted_temp = []
-    for uid, ts in list(data.items()):
+    for uid, ts in load_temp_users().items():
         try:
-            dt = datetime.fromisoformat(ts)
-            if now - dt > timedelta(days=3):
-                deleted_temp.append(uid)
-                del data[uid]
-                changed = True
+            expired = now - datetime.fromisoformat(ts) > timedelta(days=3)
         except Exception:
+            expired = True
+        if expired:
             deleted_temp.append(uid)
-            del data[uid]
-            changed = True
-    if changed:
-        save_temp_users(data)
+            remove_temp_user(uid)
     
     # 生成详细的汇总消息
     summary = f"🗑️ **日志清理汇总报告**\n\n"
@@ -2691,17 +5496,23 @@ def clean_cache(context=None):
     
     if deleted_logs:
         summary += f"📋 **管理日志清理**\n"
-        summary += f"   删除文件: {len(deleted_logs)} 个\n"
-        summary += f"   汇总记录: {len(summary_logs)} 条\n\n"
+        summary += f"   删除分段: {len(deleted_logs)} 个（{ADMIN_LOG_RETENTION_DAYS}天前）\n"
+        summary += f"   删除记录: {sum(deleted_logs.values())} 条\n\n"
     
-    if deleted_signin:
+    if deleted_signin or any(archived_signin.values()):
         summary += f"📊 **签到日志清理**\n"
-        acck_count = len([f for f in deleted_signin if 'Acck' in f])
-        akile_count = len([f for f in deleted_signin if 'Akile' in f])
-        summary += f"   Acck模块: {acck_count} 个文件\n"
-        summary += f"   Akile模块: {akile_count} 个文件\n"
-        summary += f"   总计: {len(deleted_signin)} 个文件\n"
-        summary += f"   汇总记录: {len(summary_signin)} 条\n\n"
+        summary += f"   Acck模块: 归档 {archived_signin['Acck']} 个文件\n"
+        summary += f"   Akile模块: 归档 {archived_signin['Akile']} 个文件\n"
+        summary += f"   删除过期归档: {len(deleted_signin)} 个\n\n"
+    
+    if archived_days:
+        summary += f"🗜️ **分段压缩归档**\n"
+        summary += f"   压缩分段: {len(archived_days)} 个\n\n"
+    
+    if deleted_ledger:
+        summary += f"🧾 **签到台账清理**\n"
+        summary += f"   删除分段: {len(deleted_ledger)} 个（{SIGNIN_LEDGER_RETENTION_DAYS}天前）\n"
+        summary += f"   删除记录: {sum(deleted_ledger.values())} 条\n\n"
     
     if deleted_broadcast:
         summary += f"📢 **广播日志清理**\n"
@@ -2711,18 +5522,19 @@ def clean_cache(context=None):
         summary += f"👥 **临时用户清理**\n"
         summary += f"   清理用户: {len(deleted_temp)} 个\n\n"
     
-    if not any([deleted_logs, deleted_signin, deleted_broadcast, deleted_temp]):
+    if not any([deleted_logs, deleted_ledger, deleted_signin, any(archived_signin.values()), archived_days, deleted_broadcast, deleted_temp]):
         summary += f"✅ 本次清理无文件需要删除\n"
     else:
         summary += f"💾 **汇总文件**\n"
-        summary += f"   summary_log.json: 管理日志汇总\n"
-        summary += f"   summary_signin.json: 签到日志汇总\n"
-        summary += f"   (汇总文件保留3天，3天后自动覆盖)\n\n"
+        summary += f"   {ADMIN_LOG_DIR}/: 管理日志按天分段，保留{ADMIN_LOG_RETENTION_DAYS}天；审计记录只归档不删除\n"
+        summary += f"   {SIGNIN_LEDGER_DIR}/: 签到台账按天分段，保留{SIGNIN_LEDGER_RETENTION_DAYS}天\n"
+        summary += f"   {{模块}}_logs/YYYYMMDD.log.gz: 文本日志按天压缩归档，保留3天\n"
+        summary += f"   (今天以前的分段压缩为 .gz，到期按文件名整段删除)\n\n"
         summary += f"🎯 **清理完成**\n"
-        summary += f"   总计删除: {len(deleted_logs) + len(deleted_signin) + len(deleted_broadcast)} 个文件\n"
+        summary += f"   总计删除: {len(deleted_logs) + len(deleted_ledger) + len(deleted_signin) + len(deleted_broadcast)} 个文件\n"
         summary += f"   清理用户: {len(deleted_temp)} 个\n"
     
-    print("[CLEAN] 缓存清理和数据汇总完成")
+    logger.info("[CLEAN] 缓存清理和数据汇总完成")
     return summary
 
 # 新增：异步包装clean_cache，供JobQueue调用
@@ -2738,12 +5550,12 @@ async def clean_cache_async(context=None):
                 parse_mode=ParseMode.MARKDOWN
             )
         except Exception as e:
-            print(f"[CLEAN] 汇总消息发送失败: {e}")
+            logger.warning(f"[CLEAN] 汇总消息发送失败: {e}")
             # 如果异步发送失败，尝试同步发送
             try:
                 send_telegram_sync(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, summary)
             except Exception as e2:
-                print(f"[CLEAN] 同步发送也失败: {e2}")
+                logger.warning(f"[CLEAN] 同步发送也失败: {e2}")
 
 # PTB JobQueue定时任务
 
@@ -2775,11 +5587,11 @@ def clean_old_logs():
                             try:
                                 os.remove(file_path)
                                 cleaned_count += 1
-                                print(f"🗑️ 已删除过期日志: {file_path}")
+                                logger.info(f"🗑️ 已删除过期日志: {file_path}")
                             except Exception as e:
-                                print(f"❌ 删除日志文件失败 {file_path}: {e}")
+                                logger.error(f"❌ 删除日志文件失败 {file_path}: {e}")
     except Exception as e:
-        print(f"❌ 清理日志时出错: {e}")
+        logger.error(f"❌ 清理日志时出错: {e}")
     
     return cleaned_count
 
@@ -2829,7 +5641,7 @@ async def clean_logs_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         cleaned_count = clean_old_logs()
         await update.message.reply_text(f"✅ 日志清理完成！已删除 {cleaned_count} 个过期日志文件。")
     except Exception as e:
-        print(f"清理日志失败: {e}")
+        logger.warning(f"清理日志失败: {e}")
         await update.message.reply_text("❌ 清理日志失败，请稍后重试")
 
 # 同步推送Telegram消息（用于线程/异常场景）
@@ -2851,22 +5663,22 @@ def send_telegram_sync(token, chat_id, text):
                 if result.get('ok'):
                     return True
                 else:
-                    print(f"Telegram API错误: {result.get('description', '未知错误')}")
+                    logger.warning(f"Telegram API错误: {result.get('description', '未知错误')}")
             else:
-                print(f"HTTP错误: {response.status_code}")
+                logger.warning(f"HTTP错误: {response.status_code}")
         except requests.exceptions.Timeout:
-            print(f"请求超时 (尝试 {attempt + 1}/{TELEGRAM_RETRY_COUNT})")
+            logger.warning(f"请求超时 (尝试 {attempt + 1}/{TELEGRAM_RETRY_COUNT})")
         except requests.exceptions.ConnectionError as e:
-            print(f"连接错误 (尝试 {attempt + 1}/{TELEGRAM_RETRY_COUNT}): {e}")
+            logger.warning(f"连接错误 (尝试 {attempt + 1}/{TELEGRAM_RETRY_COUNT}): {e}")
         except requests.exceptions.RequestException as e:
-            print(f"请求错误 (尝试 {attempt + 1}/{TELEGRAM_RETRY_COUNT}): {e}")
+            logger.warning(f"请求错误 (尝试 {attempt + 1}/{TELEGRAM_RETRY_COUNT}): {e}")
         except Exception as e:
-            print(f"未知错误 (尝试 {attempt + 1}/{TELEGRAM_RETRY_COUNT}): {e}")
+            logger.warning(f"未知错误 (尝试 {attempt + 1}/{TELEGRAM_RETRY_COUNT}): {e}")
         
         if attempt < TELEGRAM_RETRY_COUNT - 1:
             time.sleep(TELEGRAM_RETRY_DELAY)
     
-    print(f"❌ 同步推送Telegram失败，已重试 {TELEGRAM_RETRY_COUNT} 次")
+    logger.error(f"❌ 同步推送Telegram失败，已重试 {TELEGRAM_RETRY_COUNT} 次")
     return False
 
 # 处理手动执行任务选择
@@ -2879,7 +5691,7 @@ async def manual_execute_select(update: Update, context: ContextTypes.DEFAULT_TY
         user_id = query.from_user.id
         
         # 执行任务
-        success, message = execute_task_manually(task_id, user_id)
+        success, message = await execute_task_manually(task_id, user_id)
         
         if success:
             # 执行成功后，重新检查失败任务
@@ -2967,16 +5779,16 @@ async def bot_reply_message(update, text, **kwargs):
             return msg
             
         except Exception as e:
-            print(f"发送消息失败 (尝试 {attempt + 1}/{TELEGRAM_RETRY_COUNT}): {e}")
+            logger.warning(f"发送消息失败 (尝试 {attempt + 1}/{TELEGRAM_RETRY_COUNT}): {e}")
             if attempt < TELEGRAM_RETRY_COUNT - 1:
                 await asyncio.sleep(TELEGRAM_RETRY_DELAY)
             else:
-                print(f"❌ 发送消息最终失败: {e}")
+                logger.error(f"❌ 发送消息最终失败: {e}")
                 # 最后的备用方案：使用同步方式
                 try:
                     send_telegram_sync(TELEGRAM_BOT_TOKEN, update.effective_chat.id, text)
                 except Exception as sync_e:
-                    print(f"❌ 同步发送也失败: {sync_e}")
+                    logger.error(f"❌ 同步发送也失败: {sync_e}")
                 return None
 
 # ========== Bot提示消息发送工具（不自动撤回）==========
@@ -3110,13 +5922,13 @@ async def edit_current_message(update, context, text, **kwargs):
                     **kwargs
                 )
     except Exception as e:
-        print(f"编辑消息失败: {e}")
+        logger.warning(f"编辑消息失败: {e}")
         # 如果编辑失败，发送新消息
         try:
             msg = await bot_reply_prompt(update, text, **kwargs)
             add_flow_msg_id(context, msg.message_id)
         except Exception as send_e:
-            print(f"发送新消息也失败: {send_e}")
+            logger.warning(f"发送新消息也失败: {send_e}")
 
 async def delete_user_message(update):
     """
@@ -3193,7 +6005,7 @@ async def delete_bot_messages_in_flow(update, context):
         context.user_data['current_flow_msg_ids'] = []
         
     except Exception as e:
-        print(f"删除流程消息失败: {e}")
+        logger.warning(f"删除流程消息失败: {e}")
 
 async def clear_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -3255,7 +6067,7 @@ async def clear_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 pass
             
     except Exception as e:
-        print(f"清屏操作失败: {e}")
+        logger.warning(f"清屏操作失败: {e}")
         try:
             await update.get_bot().send_message(
                 chat_id=chat_id,
@@ -0,0 +1,363 @@
+# ========== 定时任务调度器压测工具 ==========
+# 用虚拟时钟驱动真实的 TaskScheduler 触发堆、TaskExecutor 执行池、platform_signin 与平台令牌桶，
+# 只把 SIGNIN_FUNCS 中的签到函数替换为按延迟分布在虚拟时钟上休眠的模拟实现，
+# 不访问网络、不读写任务文件，用于在上线前发现 1k/10k/100k 任务规模下的性能退化。
+#
+# 用法示例：
+#   python scheduler_benchmark.py --tasks 10000
+#   python scheduler_benchmark.py --tasks 100000 --hot-ratio 0.9 --latency lognormal:1.0:0.6
+#   python scheduler_benchmark.py --tasks 10000 --spread --no-rate-limit
+import os
+import argparse
+import collections
+import heapq
+import math
+import random
+import threading
+import time
+import tracemalloc
+import warnings
+from datetime import datetime, timedelta
+
+# 压测不连接 Telegram，只需满足 bot.py 导入时的配置检查
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "benchmark")
+os.environ.setdefault("TELEGRAM_CHAT_ID", "0")
+os.environ["SCHEDULER_WORKER_PROCESSES"] = "0"
+# 签到期限按真实时间计算，在虚拟时钟下没有意义
+os.environ["SIGNIN_DEADLINE_SECONDS"] = "0"
+
+# 只屏蔽导入 bot 时 ConversationHandler 的 per_message 提示，压测过程中的警告照常输出
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    import bot
+
+PLATFORMS = ['Acck', 'Akile']
+
+
+def parse_latency(spec):
+    """
+    解析签到延迟分布
+
+    Args:
+        spec: fixed:秒 | uniform:最小:最大 | lognormal:mu:sigma | exp:均值
+
+    Returns:
+        callable: 接收 random.Random，返回一次签到耗时（秒）
+    """
+    kind, _, rest = spec.partition(':')
+    try:
+        params = [float(x) for x in rest.split(':')] if rest else []
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的延迟参数: {spec}")
+    if kind == 'fixed' and len(params) == 1:
+        return lambda rng: params[0]
+    if kind == 'uniform' and len(params) == 2:
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == 'lognormal' and len(params) == 2:
+        return lambda rng: rng.lognormvariate(params[0], params[1])
+    if kind == 'exp' and len(params) == 1:
+        return lambda rng: rng.expovariate(1.0 / params[0])
+    raise argparse.ArgumentTypeError(f"无效的延迟分布: {spec}（支持 fixed/uniform/lognormal/exp）")
+
+
+def make_stub_signin(platform, latency, clock, seed):
+    """
+    生成不发起网络请求的模拟签到函数（替换 bot.SIGNIN_FUNCS 中的对应项）
+
+    耗时按延迟分布在虚拟时钟上休眠，随机数按 (种子, 账号, 虚拟时间) 派生，结果与线程调度顺序无关
+    """
+    def stub(username, password, totp=None, timings=None):
+        rng = random.Random(f"{seed}:{username}:{clock.now.isoformat()}")
+        clock.sleep(latency(rng))
+        return True, f"✅ {platform} 模拟签到成功: {username}"
+    return stub
+
+
+class VirtualClock:
+    """
+    虚拟时钟：替代 get_shanghai_now 注入调度器，monotonic/sleep 注入令牌桶和模拟签到
+
+    工作线程调用 sleep 时登记唤醒时刻并阻塞，由模拟循环推进时间后唤醒；
+    同时统计执行池中各平台已提交、已开始、已结束的任务数，
+    据此判断所有工作线程都已停在虚拟休眠上（或无事可做），可以安全地推进时间。
+    """
+
+    def __init__(self, start, limits, capacity):
+        self.start = start
+        self.now = start
+        self.limits = limits
+        self.capacity = capacity
+        self._cond = threading.Condition()
+        self._sleepers = []  # (唤醒时刻, 序号, 唤醒标记)
+        self._seq = 0
+        self.running = 0  # 已开始、未结束且不在虚拟休眠中的任务数
+        self.submitted = collections.Counter()
+        self.started = collections.Counter()
+        self.finished = collections.Counter()
+
+    def __call__(self):
+        return self.now
+
+    def monotonic(self):
+        return (self.now - self.start).total_seconds()
+
+    def sleep(self, seconds):
+        """在虚拟时钟上休眠，直到模拟循环把时间推进到唤醒时刻"""
+        with self._cond:
+            self._seq += 1
+            entry = (self.now + timedelta(seconds=max(seconds, 0)), self._seq, threading.Event())
+            heapq.heappush(self._sleepers, entry)
+            self.running -= 1
+            self._cond.notify_all()
+        entry[2].wait()
+
+    def next_wake(self):
+        with self._cond:
+            return self._sleepers[0][0] if self._sleepers else None
+
+    def advance(self, when):
+        """推进时间并唤醒到期的休眠线程"""
+        with self._cond:
+            self.now = when
+            while self._sleepers and self._sleepers[0][0] <= when:
+                _, _, event = heapq.heappop(self._sleepers)
+                self.running += 1
+                event.set()
+
+    def job_submitted(self, platform):
+        with self._cond:
+            self.submitted[platform] += 1
+
+    def job_started(self, platform):
+        with self._cond:
+            self.started[platform] += 1
+            self.running += 1
+
+    def job_finished(self, platform):
+        with self._cond:
+            self.finished[platform] += 1
+            self.running -= 1
+            self._cond.notify_all()
+
+    def _idle(self):
+        """没有正在运行的任务，且排队中的任务都受并发上限约束无法开始"""
+        if self.running:
+            return False
+        active = {p: self.started[p] - self.finished[p] for p in self.submitted}
+        if sum(active.values()) >= self.capacity:
+            return True
+        return not any(self.submitted[p] > self.started[p] and active[p] < self.limits.get(p, self.capacity)
+                       for p in self.submitted)
+
+    def wait_idle(self, timeout=60):
+        with self._cond:
+            if not self._cond.wait_for(self._idle, timeout=timeout):
+                raise RuntimeError("模拟停滞：工作线程长时间未进入虚拟休眠")
+
+
+def generate_tasks(count, hot_ratio, spread, seed, created_at):
+    """
+    生成模拟任务
+
+    Args:
+        count: 任务数
+        hot_ratio: 落在推荐时间点（0:00/0:10 等热门分钟）的比例，其余均匀分布在全天
+        spread: 是否为任务计算错峰偏移
+        seed: 随机种子
+        created_at: 任务创建时间（设为压测起点，避免被当作错过触发）
+
+    Returns:
+        dict: task_id -> 任务信息，结构与 scheduled_tasks.json 一致
+    """
+    rng = random.Random(seed)
+    tasks = {}
+    load = collections.Counter()  # 分钟 -> 任务数，增量维护供错峰计算使用
+    for i in range(count):
+        platform = PLATFORMS[i % len(PLATFORMS)]
+        if rng.random() < hot_ratio:
+            hour, minute = rng.choice(bot.RECOMMENDED_TIMES)
+        else:
+            hour, minute = rng.randrange(24), rng.randrange(60)
+        user_id = str(100000 + i // 3)
+        username = f"user{i}"
+        task_id = f"{user_id}_{platform}_{username}_{hour:02d}{minute:02d}"
+        task = {
+            "id": task_id,
+            "user_id": user_id,
+            "module": platform,
+            "username": username,
+            "hour": hour,
+            "minute": minute,
+            "cron": None,
+            "offset": 0,
+            "misfire": bot.DEFAULT_MISFIRE_POLICY,
+            "enabled": True,
+            "created_at": created_at.isoformat(),
+            "last_run": None,
+        }
+        if spread:
+            task["offset"] = bot.compute_spread_offset(task_id, hour, minute, tasks, load)
+        load[(hour * 60 + minute + task["offset"] // 60) % 1440] += 1
+        tasks[task_id] = task
+    return tasks
+
+
+def percentile(sorted_values, pct):
+    """最近秩法百分位数，sorted_values 需已排序"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+def simulate(args):
+    """
+    离散事件模拟：调度器按虚拟时钟弹出到期任务，交给真实的 TaskExecutor 定时通道
+    （全局/平台并发上限、交互通道预留线程、同平台按用户轮转）执行 platform_signin，
+    签到经过真实的平台令牌桶限流，模拟签到函数在虚拟时钟上休眠
+
+    Returns:
+        dict: 统计结果
+    """
+    latency = args.latency
+    start = datetime(2024, 1, 1, 0, 0, 0) - timedelta(seconds=1)
+    end = start + timedelta(hours=args.hours)
+    limits = {'Acck': args.acck_limit, 'Akile': args.akile_limit}
+    capacity = args.workers - min(max(args.reserved, 0), args.workers - 1)
+    clock = VirtualClock(start, limits, capacity)
+
+    for platform in PLATFORMS:
+        bot.SIGNIN_FUNCS[platform] = make_stub_signin(platform, latency, clock, args.seed)
+    rate_limits = {} if args.no_rate_limit else bot.PLATFORM_RATE_LIMITS
+    bot.platform_rate_limiter = bot.PlatformRateLimiter(rate_limits, clock=clock.monotonic, sleep=clock.sleep)
+
+    t0 = time.perf_counter()
+    tasks = generate_tasks(args.tasks, args.hot_ratio, args.spread, args.seed, start)
+    generate_seconds = time.perf_counter() - t0
+
+    scheduler = bot.TaskScheduler(application=None, loop=None, clock=clock)
+    scheduler.executor = bot.TaskExecutor(args.workers, limits, args.reserved)
+    t0 = time.perf_counter()
+    scheduler.load_tasks(tasks)
+    load_seconds = time.perf_counter() - t0
+
+    lock = threading.Lock()
+    lag_by_minute = collections.defaultdict(list)  # 计划触发分钟 -> 派发延迟列表
+    completion_times = []
+    errors = []
+    pop_seconds = 0.0
+    dispatched = 0
+
+    def job(task, fire_time):
+        """执行池中运行的一次签到：派发延迟 = 开始执行的等待 + 令牌桶等待"""
+        platform = task["module"]
+        clock.job_started(platform)
+        try:
+            started = clock.now
+            timings = {}
+            bot.platform_signin(platform, task["username"], "", None, timings)
+            lag = (started - fire_time).total_seconds() + timings.get("rate_wait", 0.0)
+            with lock:
+                lag_by_minute[fire_time.replace(second=0)].append(lag)
+                completion_times.append((clock.now - fire_time).total_seconds())
+        except Exception as e:
+            with lock:
+                errors.append(f"{task['id']}: {e}")
+        finally:
+            clock.job_finished(platform)
+
+    day = start.date()
+    try:
+        while True:
+            clock.wait_idle()
+            wait = scheduler._seconds_until_next(clock.now)
+            next_fire = clock.now + timedelta(seconds=wait) if wait is not None else None
+            if next_fire is not None and next_fire > end:
+                next_fire = None  # 超出模拟时长后只等待在途签到完成
+            next_wake = clock.next_wake()
+            candidates = [t for t in (next_fire, next_wake) if t is not None]
+            if not candidates:
+                break
+            clock.advance(min(candidates))
+            if clock.now.date() != day:
+                # 当日成功缓存按真实日期分键，虚拟时间跨天时手动清空
+                day = clock.now.date()
+                bot.signin_result_cache = bot.SigninResultCache()
+            if clock.now == next_fire:
+                t0 = time.perf_counter()
+                with scheduler._cond:
+                    due = scheduler._pop_due_tasks(clock.now)
+                pop_seconds += time.perf_counter() - t0
+                for task, fire_time in due:
+                    clock.job_submitted(task["module"])
+                    scheduler.executor.submit(task["module"], job, task, fire_time, owner=task["user_id"])
+                    dispatched += 1
+    finally:
+        scheduler.executor.shutdown()
+
+    return {
+        "generate_seconds": generate_seconds,
+        "load_seconds": load_seconds,
+        "pop_seconds": pop_seconds,
+        "dispatched": dispatched,
+        "errors": errors,
+        "lag_by_minute": lag_by_minute,
+        "completion_times": completion_times,
+    }
+
+
+def report(args, stats, peak_bytes):
+    """输出压测报告"""
+    print(f"📊 调度器压测：{args.tasks} 个任务，模拟 {args.hours} 小时")
+    print(f"⚙️ 工作线程 {args.workers}（预留 {args.reserved}），平台并发 Acck={args.acck_limit} Akile={args.akile_limit}，"
+          f"限流 {'关闭' if args.no_rate_limit else bot.PLATFORM_RATE_LIMITS}，错峰 {'开启' if args.spread else '关闭'}")
+    print(f"⏱️ 生成任务 {stats['generate_seconds']:.3f}s，load_tasks {stats['load_seconds']:.3f}s，"
+          f"弹出到期任务累计 {stats['pop_seconds']:.3f}s")
+    print(f"✅ 共执行 {stats['dispatched']} 次签到")
+    if stats["errors"]:
+        print(f"❌ 失败 {len(stats['errors'])} 次，例如: {stats['errors'][0]}")
+
+    lag_by_minute = stats["lag_by_minute"]
+    if lag_by_minute:
+        print(f"\n🕐 每分钟派发延迟（按最大延迟排序，前 {args.top} 个）：")
+        print(f"{'分钟':<8}{'任务数':>8}{'平均(s)':>12}{'最大(s)':>12}")
+        rows = sorted(lag_by_minute.items(), key=lambda kv: max(kv[1]), reverse=True)[:args.top]
+        for minute, lags in rows:
+            print(f"{minute.strftime('%H:%M'):<8}{len(lags):>8}{sum(lags) / len(lags):>12.2f}{max(lags):>12.2f}")
+
+    completion_times = sorted(stats["completion_times"])
+    if completion_times:
+        print("\n📈 完成耗时（计划触发 → 签到结束）：")
+        for pct in (50, 95, 99):
+            print(f"  p{pct}: {percentile(completion_times, pct):.2f}s")
+        print(f"  max: {completion_times[-1]:.2f}s")
+
+    print(f"\n💾 峰值内存: {peak_bytes / 1024 / 1024:.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="定时任务调度器虚拟时钟压测")
+    parser.add_argument("--tasks", type=int, default=10000, help="任务数（默认10000）")
+    parser.add_argument("--hours", type=float, default=24, help="模拟时长（小时，默认24）")
+    parser.add_argument("--workers", type=int, default=bot.SCHEDULER_MAX_WORKERS, help="全局工作线程数")
+    parser.add_argument("--acck-limit", type=int, default=bot.PLATFORM_CONCURRENCY['Acck'], help="Acck 并发上限")
+    parser.add_argument("--akile-limit", type=int, default=bot.PLATFORM_CONCURRENCY['Akile'], help="Akile 并发上限")
+    parser.add_argument("--reserved", type=int, default=bot.INTERACTIVE_RESERVED_WORKERS, help="为手动签到预留的线程数")
+    parser.add_argument("--latency", type=parse_latency, default=parse_latency("lognormal:0.7:0.5"),
+                        help="签到耗时分布：fixed:秒 | uniform:a:b | lognormal:mu:sigma | exp:均值")
+    parser.add_argument("--hot-ratio", type=float, default=0.8, help="落在推荐时间点的任务比例（默认0.8）")
+    parser.add_argument("--spread", action="store_true", help="为任务计算错峰偏移")
+    parser.add_argument("--no-rate-limit", action="store_true", help="不模拟平台令牌桶限流")
+    parser.add_argument("--top", type=int, default=10, help="报告中列出的最差分钟数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    stats = simulate(args)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    report(args, stats, peak_bytes)
+
+
+if __name__ == "__main__":
+    main()
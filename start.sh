@@ -479,6 +479,26 @@ update_via_git() {
     fi
 }
 
+# 合并SQLite状态库的WAL，保证复制出的 state.db 包含全部已提交数据
+checkpoint_state_db() {
+    if [ ! -f state.db ]; then
+        return 0
+    fi
+    local py="$PYTHON_IN_VENV"
+    if [ ! -x "$py" ]; then
+        py=$(command -v python3 || true)
+    fi
+    if [ -z "$py" ]; then
+        echo "[WARNING] 未找到Python，跳过state.db检查点（将连同WAL文件一起备份）"
+        return 0
+    fi
+    if "$py" -c "import sqlite3; c = sqlite3.connect('state.db', timeout=30); c.execute('PRAGMA wal_checkpoint(TRUNCATE)'); c.close()"; then
+        echo "[SUCCESS] 已合并 state.db 的WAL日志"
+    else
+        echo "[WARNING] state.db 检查点失败，将连同WAL文件一起备份"
+    fi
+}
+
 # 下载方式更新
 update_via_download() {
     echo "[INFO] 正在从GitHub下载最新代码..."
@@ -506,15 +526,16 @@ update_via_download() {
     done
     
     # 备份日志目录
-    for dir in "Acck_logs" "Akile_logs"; do
+    for dir in "Acck_logs" "Akile_logs" "admin_logs" "signin_ledger"; do
         if [ -d "$dir" ]; then
             cp -r "$dir" "$BACKUP_DIR/"
             echo "[SUCCESS] 已备份 $dir"
         fi
     done
     
-    # 备份其他重要文件
-    for file in "scheduled_tasks.json" "allowed_users.json" "banned_users.json" "daily_usage.json" "usage_stats.json"; do
+    # 备份其他重要文件（state.db 为默认的SQLite状态库，先合并WAL再复制；scheduler_journal.jsonl 为定时任务执行日志）
+    checkpoint_state_db
+    for file in "scheduled_tasks.json" "allowed_users.json" "banned_users.json" "daily_usage.json" "usage_stats.json" "state.db" "state.db-wal" "state.db-shm" "scheduler_journal.jsonl"; do
         if [ -f "$file" ]; then
             cp "$file" "$BACKUP_DIR/"
             echo "[SUCCESS] 已备份 $file"
@@ -554,7 +575,7 @@ update_via_download() {
         done
         
         # 恢复日志目录
-        for dir in "Acck_logs" "Akile_logs"; do
+        for dir in "Acck_logs" "Akile_logs" "admin_logs" "signin_ledger"; do
             if [ -d "$BACKUP_DIR/$dir" ]; then
                 cp -r "$BACKUP_DIR/$dir" .
                 echo "[SUCCESS] 已恢复 $dir"
@@ -562,7 +583,7 @@ update_via_download() {
         done
         
         # 恢复其他重要文件
-        for file in "scheduled_tasks.json" "allowed_users.json" "banned_users.json" "daily_usage.json" "usage_stats.json"; do
+        for file in "scheduled_tasks.json" "allowed_users.json" "banned_users.json" "daily_usage.json" "usage_stats.json" "state.db" "state.db-wal" "state.db-shm" "scheduler_journal.jsonl"; do
             if [ -f "$BACKUP_DIR/$file" ]; then
                 cp "$BACKUP_DIR/$file" .
                 echo "[SUCCESS] 已恢复 $file"